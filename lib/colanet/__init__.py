@@ -8,6 +8,8 @@ from . import configs
 from dev_basics import lightning
 from . import flow
 from . import augmented
+from . import analysis
+from . import bench
 from .augmented import extract_model_config
 from .augmented import extract_config
 
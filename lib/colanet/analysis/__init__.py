@@ -0,0 +1 @@
+from .index_overlap import index_overlap,pairwise_index_overlap
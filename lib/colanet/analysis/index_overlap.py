@@ -0,0 +1,100 @@
+"""
+
+Overlap of the neighbor sets found by two searches.
+
+For each query, the fraction of the top-"k_s" neighbors of one search
+found among the top-"k_p" neighbors of another. A neighbor matches if
+the frames are equal and the spatial offset is at most "radius"
+(in the max-norm); radius = 0 is an exact match.
+
+Each (query,t,h,w) is packed into one int64 key, so a match is a lookup
+into the sorted keys of the reference set. For radius > 0 the reference
+keys are binned by (query,t,h) rows, with w padded so that a window
+[w-r,w+r] never crosses a row; each of the 2r+1 rows around a neighbor
+is then a single range count with "searchsorted". Memory is linear in
+the number of neighbors, unlike the (Q,K_s,K_p) pairwise distances.
+
+"""
+
+import torch as th
+
+def pack_keys(inds,qids,origin,sizes,radius):
+    """
+    Packed (query,t,h,w) keys; h and w are padded by "radius".
+    """
+    T,H,W = sizes
+    Hp,Wp = H + 2*radius,W + 2*radius
+    t = inds[...,0] - origin[0]
+    h = inds[...,1] - origin[1] + radius
+    w = inds[...,2] - origin[2] + radius
+    return ((qids * T + t) * Hp + h) * Wp + w
+
+def coord_bounds(*inds_list):
+    mins = th.stack([inds.reshape(-1,3).min(0).values for inds in inds_list])
+    maxs = th.stack([inds.reshape(-1,3).max(0).values for inds in inds_list])
+    origin = mins.min(0).values
+    sizes = (maxs.max(0).values - origin + 1).tolist()
+    return origin,sizes
+
+def index_overlap(inds_a,inds_b,radius,k_s,k_p):
+    """
+
+    inds_a: (...,Q,K,3) reference neighbors; the top "k_p" are used
+    inds_b: (...,Q,K,3) neighbors to look up; the top "k_s" are used
+    returns: (...,Q) the fraction of matched neighbors per query
+
+    """
+    return _overlap(inds_a[...,:k_p,:],inds_b[None,...,:k_s,:],radius)[0]
+
+def pairwise_index_overlap(inds,radius,k_s,k_p):
+    """
+
+    inds: (N,...,Q,K,3) the neighbors of N layers
+    returns: (N(N-1)/2,...,Q) the overlap of layer n1 with n0 for n0 < n1,
+             in the order of the (n0,n1) loop
+
+    """
+    N = inds.shape[0]
+    accs = []
+    for n0 in range(N-1):
+        accs.append(_overlap(inds[n0,...,:k_p,:],inds[n0+1:,...,:k_s,:],radius))
+    return th.cat(accs)
+
+def _overlap(ref,qry,radius):
+    """
+    ref: (...,Q,K_p,3) and qry: (P,...,Q,K_s,3); returns (P,...,Q)
+    """
+
+    # -- flatten queries --
+    lead = ref.shape[:-2]
+    ref = ref.long()
+    qry = qry.long()
+    P,K_s = qry.shape[0],qry.shape[-2]
+    K_p = ref.shape[-2]
+    ref = ref.reshape(-1,K_p,3)
+    qry = qry.reshape(P,-1,K_s,3)
+    Q = ref.shape[0]
+    qids = th.arange(Q,device=ref.device)
+
+    # -- sorted reference keys --
+    origin,sizes = coord_bounds(ref,qry)
+    keys = pack_keys(ref,qids[:,None],origin,sizes,radius)
+    keys = keys.flatten().sort().values
+
+    # -- look up --
+    qkeys = pack_keys(qry,qids[None,:,None],origin,sizes,radius).flatten()
+    if radius == 0:
+        pos = th.searchsorted(keys,qkeys).clamp(max=len(keys)-1)
+        found = keys[pos] == qkeys
+    else:
+        Wp = sizes[2] + 2*radius
+        found = th.zeros_like(qkeys,dtype=th.bool)
+        for dh in range(-radius,radius+1):
+            row = qkeys + dh * Wp
+            lo = th.searchsorted(keys,row - radius)
+            hi = th.searchsorted(keys,row + radius,right=True)
+            found |= hi > lo
+
+    # -- fraction per query --
+    found = found.view(P,Q,K_s).float().mean(-1)
+    return found.view((P,)+tuple(lead))
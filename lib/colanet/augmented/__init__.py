@@ -1,3 +1,5 @@
 from .io import load_model,extract_search_config,extract_io_config
 from .io import extract_config as extract_model_config
 from .io import extract_config
+from .ladder import QualityLadder
+from .search_cache import SearchCache
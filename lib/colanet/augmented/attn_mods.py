@@ -11,6 +11,94 @@ from dev_basics.utils import clean_code
 __methods__ = [] # self is a DataStore
 register_method = clean_code.register_method(__methods__)
 
+# -- fields read by each operator; used to skip needless rebuilds --
+SEARCH_FIELDS = ["search_name","ps","pt","ws","wt","wr","kr","k_s",
+                 "stride0","stride1","dilation","rbwd","nbwd","exact",
+                 "reflect_bounds","anchor_self","dist_type","batchsize"]
+AGG_FIELDS = ["ps","pt","dilation","reflect_bounds",
+              "exact","agg_fxn","stride0"]
+
+@register_method
+def init_search_ops(self,search_cfg,init_search=True,init_agg=True):
+    """
+
+    (Re-)build the search and aggregation operators from "search_cfg".
+    Only the operators are touched; the learned projections are not.
+
+    """
+
+    # -- unpack --
+    self.search_cfg = search_cfg
+    self.search_name = search_cfg.search_name
+    self.batchsize = search_cfg.batchsize
+    self.ps = search_cfg.ps
+    self.stride0 = search_cfg.stride0
+    self.stride1 = search_cfg.stride1
+    self.use_state_update = search_cfg.use_state_update
+    self.dist_type = search_cfg.dist_type
+    self.k_a = search_cfg.k_a
+    self.k_s = search_cfg.k_s
+
+    # -- search --
+    if init_search:
+        self.search = None
+        self.cache_refine = None
+        self.seed_refine = None
+        if search_cfg.search_name != "csa":
+            search_cfg.k = search_cfg.k_s
+            self.search = stnls.search.init(search_cfg)
+
+    # -- aggregate --
+    if init_agg:
+        agg_cfg = {k:search_cfg[k] for k in AGG_FIELDS}
+        self.wpsum = self.init_agg(**agg_cfg)
+
+@register_method
+def set_search(self,search_cfg):
+    """
+
+    Update the search config of a live module.
+
+    "search_cfg" may hold any subset of the fields of the current config;
+    missing fields keep their current values. The search and aggregation
+    operators are rebuilt only if a field they read has changed.
+
+    """
+
+    # -- merge with current --
+    cfg = self.merge_search_cfg(search_cfg)
+
+    # -- only rebuild what changed --
+    changed = [k for k in cfg if cfg[k] != self.search_cfg[k]]
+    init_search = any([k in SEARCH_FIELDS for k in changed])
+    init_agg = any([k in AGG_FIELDS for k in changed])
+    self.init_search_ops(cfg,init_search,init_agg)
+    if "softmax_scale" in search_cfg:
+        self.softmax_scale = search_cfg["softmax_scale"]
+    return changed
+
+@register_method
+def merge_search_cfg(self,search_cfg):
+    """
+    The current search config updated with "search_cfg" and checked;
+    the module is not changed.
+    """
+    cfg = dcopy(self.search_cfg)
+    for key,val in search_cfg.items():
+        if not(key in cfg):
+            raise KeyError(f"Uknown search field [{key}]")
+        cfg[key] = val
+    check_search_cfg(cfg)
+    return cfg
+
+def check_search_cfg(cfg):
+    if cfg.stride0 < 1 or cfg.stride1 < 1:
+        raise ValueError(f"Strides must be positive [{cfg.stride0},{cfg.stride1}]")
+    if cfg.ps < 1:
+        raise ValueError(f"Patchsize must be positive [{cfg.ps}]")
+    if cfg.k_a > 0 and cfg.k_s > 0 and cfg.k_a > cfg.k_s:
+        raise ValueError(f"Can't aggregate more than searched [{cfg.k_a} > {cfg.k_s}]")
+
 @register_method
 def update_search(self,inds_is_none):
     if self.refine_inds:
@@ -19,12 +19,15 @@ from . import inds_buffer
 from . import attn_mods
 from . import csa_attn
 from . import nl_attn
+from . import search_cache
+from .checkpointing import checkpoint_replay,use_checkpoint
 from dev_basics.utils import clean_code
 
 
 """
 CA network
 """
+@clean_code.add_methods_from(search_cache)
 @clean_code.add_methods_from(nl_attn)
 @clean_code.add_methods_from(csa_attn)
 @clean_code.add_methods_from(attn_mods)
@@ -47,11 +50,7 @@ class ContextualAttention_Enhance(nn.Module):
         self.use_multiple_size=use_multiple_size
         self.add_SE=add_SE
         self.use_inds_buffer = return_inds
-        self.search_name = search_cfg.search_name
-        self.batchsize = search_cfg.batchsize
-        self.ps = search_cfg.ps
         self.inds_buffer = []
-        self.search_cfg = search_cfg
 
         # -- se layer --
         self.conv33 = None
@@ -86,9 +85,6 @@ class ContextualAttention_Enhance(nn.Module):
         # self.wr = wr
         # self.kr = kr
         # self.wt = wt
-        self.stride0 = search_cfg.stride0
-        self.stride1 = search_cfg.stride1
-        self.use_state_update = search_cfg.use_state_update
         # self.dilation = dilation
         # self.rbwd = rbwd
         # self.nbwd = nbwd
@@ -101,28 +97,27 @@ class ContextualAttention_Enhance(nn.Module):
         #                       "dilation":dilation,"rbwd":rbwd,"nbwd":nbwd,
         #                       "exact":exact,"reflect_bounds":reflect_bounds,
         #                       "refine_inds":refine_inds}
-        self.dist_type = search_cfg.dist_type
-        self.k_a = search_cfg.k_a
-        self.k_s = search_cfg.k_s
-        self.search = None
-        # print(search_cfg)
-        if search_cfg.search_name != "csa":
-            search_cfg.k = search_cfg.k_s
-            self.search = stnls.search.init(search_cfg)
-
-        # self.search = self.init_search(attn_mode=attn_mode,k=k_s,ps=ps,pt=pt,
-        #                                ws=ws,ws_r=ws_r,wt=wt,
-        #                                stride0=stride0,stride1=stride1,
-        #                                dilation=dilation,rbwd=rbwd,nbwd=nbwd,
-        #                                exact=exact,reflect_bounds=reflect_bounds,
-        #                                refine_inds=refine_inds)
-        # self.wpsum = self.init_wpsum(ps=ps,pt=pt,dilation=dilation,
-        #                              reflect_bounds=reflect_bounds,exact=exact)
-        agg_fields = ["ps","pt","dilation","reflect_bounds",
-                      "exact","agg_fxn","stride0"]
-        agg_cfg = {k:search_cfg[k] for k in agg_fields}
-        # self.wpsum = self.init_agg(**agg_cfg)
-        self.wpsum = self.init_agg(**agg_cfg)
+
+        # -- search & aggregate; see attn_mods.set_search --
+        self.search_cfg = None
+        self.init_search_ops(search_cfg)
+
+        # -- opt-in search cache; see search_cache.py --
+        self.init_search_cache()
+
+        # -- activation checkpointing; see checkpointing.py --
+        self.ckpt = False
+        self.record_inds = False
+        self.replay_inds = None
+        self.search_inds = None
+
+        # -- reused temporaries; shared by the model, see RR.set_workspace --
+        self.workspace = None
+
+        # -- indices carried across temporal windows; see CES.forward --
+        self.seed_inds = None
+        self.keep_inds = False
+        self.last_inds = None
 
         # -- timers --
         # self.times = AggTimer()
@@ -131,6 +126,14 @@ class ContextualAttention_Enhance(nn.Module):
         self.times = ExpTimerList(self.use_timer)
 
     def forward(self, vid, flows=None, inds_pred=None, batchsize=1):
+        if self.ckpt and use_checkpoint(self):
+            def fxn(vid,replay):
+                state = [None,None] if replay else inds_pred
+                return self._forward(vid,flows,state,batchsize)
+            return checkpoint_replay(fxn,[self],vid)
+        return self._forward(vid,flows,inds_pred,batchsize)
+
+    def _forward(self, vid, flows=None, inds_pred=None, batchsize=1):
         if self.search_name == "csa":
             vid = self.forward_csa(vid,flows,inds_pred) # csa_attn.py
         else:
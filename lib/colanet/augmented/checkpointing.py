@@ -0,0 +1,71 @@
+"""
+
+Activation checkpointing for training RR on large crops.
+
+Two independent settings (see "RR.set_checkpoint"):
+
+  res_group: groups of this many consecutive ResBlocks (and convs) of the
+    trunk and of the CES are checkpointed; 0 stores every activation.
+  attn: "none", "attn" (each ContextualAttention_Enhance) or
+    "merge" (each merge_block, i.e. SKUnit + attention + gate).
+
+A checkpointed region keeps only its input and recomputes the rest in
+backward. The recompute of an attention layer does not search again.
+In the forward pass the search runs without grad and its indices are
+scored by a refine search with wr = 1; the recompute runs that same
+refine op on the same indices. Both passes then save the same tensors
+(as non-reentrant checkpointing requires) and use the same attention
+pattern, even for random searches, and the costly search runs once.
+The saved indices are the only extra memory.
+
+"""
+
+# -- misc --
+import torch as th
+from torch.utils.checkpoint import checkpoint
+
+CKPT_ATTN = ["none","attn","merge"]
+
+def run_seq(layers, x):
+    for layer in layers:
+        x = layer(x)
+    return x
+
+def run_groups(layers, x, group_size):
+    """
+    Run "layers" in order, checkpointing groups of "group_size".
+    """
+    if group_size <= 0 or not(th.is_grad_enabled()):
+        return run_seq(layers,x)
+    for i in range(0,len(layers),group_size):
+        x = checkpoint(run_seq,layers[i:i+group_size],x,use_reentrant=False)
+    return x
+
+def checkpoint_replay(fxn, units, x):
+    """
+
+    Checkpoint "fxn(x,replay)" where "units" are the attention layers
+    it runs. The first call records the indices of each unit's search;
+    the recompute (replay = True) scores them in place of the search.
+
+    """
+    saved = []
+    def run(x):
+        replay = len(saved) > 0
+        for i,unit in enumerate(units):
+            unit.replay_inds = saved[0][i] if replay else None
+            unit.record_inds = not(replay)
+        try:
+            out = fxn(x,replay)
+            if not(replay):
+                saved.append([unit.search_inds for unit in units])
+        finally:
+            for unit in units:
+                unit.replay_inds = None
+                unit.record_inds = False
+                unit.search_inds = None
+        return out
+    return checkpoint(run,x,use_reentrant=False)
+
+def use_checkpoint(module):
+    return module.training and th.is_grad_enabled()
@@ -8,7 +8,7 @@ import torch.nn.functional as F
 from copy import deepcopy as dcopy
 from torch.autograd import gradcheck
 from einops import rearrange,repeat
-from colanet.utils.misc import assert_nonan
+from colanet.utils.misc import assert_nonan,fp32_region
 import colanet
 from colanet.utils import optional
 from torch.nn.functional import unfold as th_unfold
@@ -53,55 +53,59 @@ def forward_csa(self, vid, flows=None, inds_pred=None):
     unfold0 = partial(vid2patches,self.ps,self.stride0)
     unfold1 = partial(vid2patches,self.ps,self.stride1)
 
-    # -- batch across queries --
-    assert nbatches == 1
-    for index in range(nbatches):
-
-        # -- batch info --
-        qindex = min(nbatch * index,ntotal)
-        nbatch_i =  min(nbatch, ntotal - qindex)
-
-        # -- search --
-        timer.sync_start("search")
-        p0 = rearrange(unfold0(b1[0])[0],'t f n -> t n f')
-        p1,pad = unfold1(b3[0])
-        p1 = rearrange(p1,'t f n -> t f n')
-        dists = p0 @ p1
-        timer.sync_stop("search")
-        # print("inds.shape: ",inds.shape)
-        # print(dists)
-
-        # -- normalize --
-        timer.sync_start("normalize")
-        weights = F.softmax(dists*self.softmax_scale, dim=1)
-        assert_nonan(weights)
-        timer.sync_stop("normalize")
-
-        # -- attn mask --
-        timer.sync_start("agg")
-        p3 = unfold1(b2[0])[0]
-        p3 = rearrange(p3,'t f n -> t n f')
-        _T = weights.shape[0]
-        zi = []
-        for ti in range(_T):
-            zi_i = th.mm(weights[ti],p3[ti])
-            zi.append(zi_i)
-        zi = th.stack(zi,0)
-        timer.sync_stop("agg")
-
-        # -- ifold --
-        timer.sync_start("fold")
-        # zi = rearrange(zi,'n (ph pw c) b H q c h w -> b q H 1 c h w')
-        zi = rearrange(zi,'t n f -> t f n')
-        ones = th.ones_like(zi)
-        yvid = th_fold(zi,(H,W),(ps,ps),padding=pad[0],stride=self.stride0)
-        zvid = th_fold(ones,(H,W),(ps,ps),padding=pad[0],stride=self.stride0)
-        y = yvid / zvid
-        # print(y)
-        assert_nonan(y)
-        # ifold(zi,qindex)
-        timer.sync_stop("fold")
-        # print(timer)
+    # -- search, softmax and fold in fp32 (under autocast too) --
+    b1,b2,b3 = [b.float() for b in [b1,b2,b3]]
+    with fp32_region(vid.device):
+
+        # -- batch across queries --
+        assert nbatches == 1
+        for index in range(nbatches):
+
+            # -- batch info --
+            qindex = min(nbatch * index,ntotal)
+            nbatch_i =  min(nbatch, ntotal - qindex)
+
+            # -- search --
+            timer.sync_start("search")
+            p0 = rearrange(unfold0(b1[0])[0],'t f n -> t n f')
+            p1,pad = unfold1(b3[0])
+            p1 = rearrange(p1,'t f n -> t f n')
+            dists = p0 @ p1
+            timer.sync_stop("search")
+            # print("inds.shape: ",inds.shape)
+            # print(dists)
+
+            # -- normalize --
+            timer.sync_start("normalize")
+            weights = F.softmax(dists*self.softmax_scale, dim=1)
+            assert_nonan(weights)
+            timer.sync_stop("normalize")
+
+            # -- attn mask --
+            timer.sync_start("agg")
+            p3 = unfold1(b2[0])[0]
+            p3 = rearrange(p3,'t f n -> t n f')
+            _T = weights.shape[0]
+            zi = []
+            for ti in range(_T):
+                zi_i = th.mm(weights[ti],p3[ti])
+                zi.append(zi_i)
+            zi = th.stack(zi,0)
+            timer.sync_stop("agg")
+
+            # -- ifold --
+            timer.sync_start("fold")
+            # zi = rearrange(zi,'n (ph pw c) b H q c h w -> b q H 1 c h w')
+            zi = rearrange(zi,'t n f -> t f n')
+            ones = th.ones_like(zi)
+            yvid = th_fold(zi,(H,W),(ps,ps),padding=pad[0],stride=self.stride0)
+            zvid = th_fold(ones,(H,W),(ps,ps),padding=pad[0],stride=self.stride0)
+            y = yvid / zvid
+            # print(y)
+            assert_nonan(y)
+            # ifold(zi,qindex)
+            timer.sync_stop("fold")
+            # print(timer)
 
     # -- get post-attn vid --
     # y,Z = ifold.vid,ifold.zvid
@@ -0,0 +1,137 @@
+"""
+
+Fold the BatchNorms of the SKUnits into their convolutions for inference.
+
+An SKUnit is
+
+    conv1x1 -> bn -> SKConv[conv -> bn -> relu ...] -> bn -> conv1x1 -> bn
+
+and in eval mode each BatchNorm is a per-channel affine map. A bn after a
+conv folds into that conv's weight and bias; the bn before the last 1x1
+conv folds into its input channels (exact since a 1x1 conv has no
+padding). The fused unit is
+
+    conv1x1 -> SKConv[conv -> relu ...] -> conv1x1
+
+with the same outputs up to rounding. The res_scale of the ResBlocks is
+folded into their last conv too.
+
+    model.fuse_for_inference()
+
+"""
+
+# -- misc --
+import torch as th
+import torch.nn as nn
+
+# -- local --
+from .misc_blocks import ResBlock
+from .sk_conv import SKConv,SKUnit
+
+def bn_affine(bn):
+    """
+    Scale and shift of a BatchNorm2d in eval mode.
+    """
+    scale = bn.weight / th.sqrt(bn.running_var + bn.eps)
+    shift = bn.bias - bn.running_mean * scale
+    return scale,shift
+
+def new_conv(conv, weight, bias):
+    fused = nn.Conv2d(conv.in_channels,conv.out_channels,conv.kernel_size,
+                      stride=conv.stride,padding=conv.padding,
+                      dilation=conv.dilation,groups=conv.groups,bias=True,
+                      padding_mode=conv.padding_mode,
+                      device=weight.device,dtype=weight.dtype)
+    fused.weight = nn.Parameter(weight.detach().clone())
+    fused.bias = nn.Parameter(bias.detach().clone())
+    return fused
+
+def conv_bias(conv):
+    if conv.bias is None:
+        return th.zeros_like(conv.weight[:,0,0,0])
+    return conv.bias
+
+def fold_bn(conv, bn):
+    """
+    conv -> bn as one conv.
+    """
+    scale,shift = bn_affine(bn)
+    weight = conv.weight * scale[:,None,None,None]
+    bias = conv_bias(conv) * scale + shift
+    return new_conv(conv,weight,bias)
+
+def fold_bn_input(bn, conv):
+    """
+    bn -> conv as one conv; "conv" must be unpadded and ungrouped.
+    """
+    if any([p != 0 for p in conv.padding]) or conv.groups != 1:
+        raise ValueError("Can only fold a bn into an unpadded, ungrouped conv.")
+    scale,shift = bn_affine(bn)
+    weight = conv.weight * scale[None,:,None,None]
+    bias = conv_bias(conv) + (conv.weight.sum((-2,-1)) @ shift)
+    return new_conv(conv,weight,bias)
+
+def fuse_seq(seq):
+    """
+    Fold each "conv -> bn" pair of an nn.Sequential; other modules are kept.
+    """
+    mods = list(seq.children())
+    fused,i = [],0
+    while i < len(mods):
+        conv_bn = i+1 < len(mods) and isinstance(mods[i],nn.Conv2d) \
+            and isinstance(mods[i+1],nn.BatchNorm2d)
+        if conv_bn:
+            fused.append(fold_bn(mods[i],mods[i+1]))
+            i += 2
+        else:
+            fused.append(mods[i])
+            i += 1
+    return nn.Sequential(*fused)
+
+def fuse_skunit(skunit):
+    conv0,bn0,skconv,bn1,conv1,bn2 = list(skunit.feas.children())
+    for i,branch in enumerate(skconv.convs):
+        skconv.convs[i] = fuse_seq(branch)
+    conv1 = fold_bn(fold_bn_input(bn1,conv1),bn2)
+    skunit.feas = nn.Sequential(fold_bn(conv0,bn0),skconv,conv1)
+    skunit.shortcut = fuse_seq(skunit.shortcut)
+
+class FusedResBlock(nn.Module):
+    """
+    A ResBlock with res_scale folded into its last conv.
+    """
+
+    def __init__(self, block):
+        super().__init__()
+        mods = list(block.body.children())
+        last = mods[-1]
+        weight = last.weight * block.res_scale
+        bias = conv_bias(last) * block.res_scale
+        self.body = nn.Sequential(*mods[:-1],new_conv(last,weight,bias))
+
+    def forward(self, x):
+        return self.body(x) + x
+
+def fuse_resblocks(seq):
+    for name,module in seq.named_children():
+        if isinstance(module,ResBlock) and not(has_bn(module)):
+            setattr(seq,name,FusedResBlock(module))
+
+def has_bn(module):
+    return any([isinstance(m,nn.BatchNorm2d) for m in module.modules()])
+
+@th.no_grad()
+def fuse_for_inference(model):
+    """
+
+    Fold the BatchNorms and res_scales of "model" in place; the model is
+    set to eval mode since the folds use the running statistics.
+
+    """
+    model.eval()
+    for module in list(model.modules()):
+        if isinstance(module,SKUnit) and isinstance(module.feas[1],nn.BatchNorm2d):
+            fuse_skunit(module)
+        elif isinstance(module,nn.Sequential):
+            fuse_resblocks(module)
+    return model
@@ -5,7 +5,7 @@ import torch
 import torch as th
 import torch.nn as nn
 import torch.nn.functional as F
-from colanet.utils.misc import rslice
+from colanet.utils.misc import rslice,optional,autocast,PRECISIONS
 from easydict import EasyDict as edict
 from einops import rearrange,repeat
 
@@ -19,8 +19,14 @@ import colanet.utils.gpu_mem as gpu_mem
 # -- modules --
 from colanet.utils import clean_code
 from colanet.utils.config_blocks import config_to_list
+from colanet.utils.proc_utils import ChopState
+from colanet.utils.workspace import Workspace
 from .misc_blocks import default_conv,ResBlock,MeanShift
 from .merge_unit import merge_block
+from .fuse import fuse_for_inference
+from .static import StaticRR
+from .checkpointing import run_groups,CKPT_ATTN
+from .search_cache import WeightsVersion,input_digest
 
 @clean_code.add_methods_from(shared_mods)
 @clean_code.add_methods_from(inds_buffer)
@@ -73,6 +79,57 @@ class RR(nn.Module):
         self.use_inds_buffer = self.return_inds
         self.inds_buffer = []
 
+        # -- opt-in search cache --
+        self.search_cache = None
+
+        # -- activation checkpointing for training --
+        self.set_checkpoint(optional(args,"ckpt_res_group",0),
+                            optional(args,"ckpt_attn","none"))
+
+        # -- opt-in buffers reused across calls & layers --
+        use_ws = optional(args,"use_workspace",False)
+        self.set_workspace(Workspace() if use_ws else None)
+
+        # -- inference precision & memory format --
+        self.set_precision(optional(args,"precision","single"),
+                           optional(args,"channels_last",False))
+
+    def set_precision(self,precision="single",channels_last=False):
+        """
+
+        precision: "single", "bf16" or "fp16"; convs and projections run
+        under autocast while search, softmax and fold stay in fp32.
+        channels_last: NHWC memory format for the conv trunk.
+
+        """
+        if not(precision in PRECISIONS):
+            raise ValueError(f"Uknown precision [{precision}]")
+        self.precision = precision
+        self.channels_last = channels_last
+        fmt = th.channels_last if channels_last else th.contiguous_format
+        self.to(memory_format=fmt)
+
+    def fuse_for_inference(self):
+        """
+
+        Fold the BatchNorms of the SKUnits and the res_scales of the
+        ResBlocks into their convs (in place; sets eval mode).
+        Quantize from the unfused model; see "fuse.py".
+
+        """
+        fuse_for_inference(self)
+        self.set_precision(self.precision,self.channels_last)
+        return self
+
+    def to_static(self):
+        """
+
+        A compile-ready copy of the inference path sharing these weights;
+        see "static.py". Call again after "set_search".
+
+        """
+        return StaticRR(self).eval()
+
     @property
     def times(self):
         return self.msa.times
@@ -80,23 +137,121 @@ class RR(nn.Module):
     def reset_times(self):
         self.msa.reset_times()
 
+    def set_search(self,search_cfgs):
+        """
+
+        Swap the search config of the attention layers without reloading.
+
+        search_cfgs: a dict applied to every block or a list with one dict
+        per block; each dict may only hold the fields to update,
+        e.g. model.set_search({"ws":15,"k_s":50,"k_a":50})
+
+        """
+        return self.msa.set_search(search_cfgs)
+
+    def enable_search_cache(self,cache=None,mode="bypass"):
+        """
+
+        Share one search cache across the attention layers; "None" disables it.
+        mode: "bypass" reuses indices only for the same weights;
+              "refine" re-scores old indices after the weights change.
+
+        """
+        if not(mode in ["bypass","refine"]):
+            raise ValueError(f"Uknown search cache mode [{mode}]")
+        self.search_cache = cache
+        weights = WeightsVersion(self.parameters) # all upstream weights
+        for name,module in self.named_modules():
+            if hasattr(module,"search_cache_mode"):
+                module.search_cache = cache
+                module.search_cache_mode = mode
+                module.search_cache_name = name
+                module.search_cache_weights = weights
+                module.search_cache_input = None
+        return cache
+
+    def set_search_cache_input(self,vid,flows):
+        """
+        Key the searches of this call by the digest of the model input.
+        """
+        use = not(self.search_cache is None) and not(self.training)
+        inputs = input_digest(vid,flows) if use else None
+        for module in self.modules():
+            if hasattr(module,"search_cache_mode"):
+                module.search_cache_input = inputs
+
+    def set_checkpoint(self,res_group=0,attn="none"):
+        """
+
+        Trade compute for memory in training; see "checkpointing.py".
+        res_group: checkpoint groups of this many ResBlocks (0 for none).
+        attn: "none", "attn" or "merge"; the recompute re-scores the
+        indices of the forward pass instead of searching again.
+
+        """
+        if not(attn in CKPT_ATTN):
+            raise ValueError(f"Uknown checkpoint mode [{attn}]")
+        self.ckpt_res_group = res_group
+        self.ckpt_attn = attn
+        self.msa.ckpt_res_group = res_group
+        for i in range(3):
+            block = getattr(self.msa,'c%d'%(i+1))
+            block.ckpt = attn == "merge"
+            block.CAUnit.ckpt = attn == "attn"
+
+    def set_workspace(self,workspace=None):
+        """
+
+        Share one workspace of temporaries (folds, attention weights)
+        across the attention layers; "None" (the default) allocates on
+        every call. Buffers are only reused with grad disabled; call
+        "release_workspace" between videos of different sizes.
+
+        """
+        self.workspace = workspace
+        for module in self.modules():
+            if hasattr(module,"workspace") and not(module is self):
+                module.workspace = workspace
+        return workspace
+
+    def release_workspace(self):
+        if not(self.workspace is None):
+            self.workspace.release()
+
+    def invalidate_search_cache(self,clear=True):
+        cache = None
+        for module in self.modules():
+            if hasattr(module,"search_cache_mode"):
+                module.invalidate_search_cache()
+                cache = module.search_cache
+        if clear and not(cache is None):
+            cache.clear()
+
     def forward(self, vid, flows=None, state=None):
         ndim = vid.ndim
         if vid.ndim == 4:
             vid = vid[None,:]
+        if not(self.search_cache is None):
+            self.set_search_cache_input(vid,flows)
 
         B = vid.shape[0]
         vid = rearrange(vid,'b t c h w -> (b t) c h w')
-        res = vid
-        res = self.head(vid)
-        for _name,layer in self.body.named_children():
-            if int(_name) == 8: res = layer(res,flows,state,B)
-            else: res = layer(res)
-        res = self.tail(res)
+        if self.channels_last:
+            vid = vid.contiguous(memory_format=th.channels_last)
+        with autocast(vid.device,self.precision):
+            res = self.head(vid)
+            layers = list(self.body.children())
+            nhalf = self.n_resblocks // 2
+            res = run_groups(layers[:nhalf],res,self.ckpt_res_group)
+            res = self.msa(res,flows,state,B)
+            res = run_groups(layers[nhalf+1:],res,self.ckpt_res_group)
+            res = self.tail(res)
         # self.inds_buffer = inds
         # self.update_inds_buffer(inds)
-        vid = vid + res
+        vid = vid + res.to(vid.dtype)
         vid = rearrange(vid,'(b t) c h w -> b t c h w',b=B)
+        if self.channels_last:
+            vid = vid.contiguous()
 
         if ndim == 4:
             vid = vid[0]
@@ -142,6 +297,7 @@ class CES(nn.Module):
         self.use_inds_buffer = return_inds
         self.use_timer = attn_timer
         self.times = ExpTimerList(attn_timer)
+        self.ckpt_res_group = 0 # see RR.set_checkpoint
 
     def reset_times(self):
         self._reset_times()
@@ -149,22 +305,77 @@ class CES(nn.Module):
             layer_i = getattr(self,'c%d'%(i+1))
             layer_i._reset_times()
 
+    def set_search(self,search_cfgs):
+        if isinstance(search_cfgs,dict):
+            search_cfgs = [search_cfgs,]*3
+        if len(search_cfgs) != 3:
+            msg = "Expected one search config per block [%d != 3]"
+            raise ValueError(msg % len(search_cfgs))
+
+        # -- state updates are needed if any block refines --
+        names = []
+        for i in range(3):
+            name_i = getattr(self,'c%d'%(i+1)).CAUnit.search_name
+            names.append(optional(search_cfgs[i],"search_name",name_i))
+        any_refine = any([name == "refine" for name in names])
+
+        # -- check every block before updating any --
+        cfgs = []
+        for i in range(3):
+            cfg_i = dict(search_cfgs[i])
+            cfg_i["use_state_update"] = any_refine
+            getattr(self,'c%d'%(i+1)).CAUnit.merge_search_cfg(cfg_i)
+            cfgs.append(cfg_i)
+
+        # -- update each block --
+        changed = []
+        for i in range(3):
+            layer_i = getattr(self,'c%d'%(i+1))
+            changed.append(layer_i.set_search(cfgs[i]))
+        return changed
+
     def update_ca_times(self):
         for i in range(3):
             layer_i = getattr(self,'c%d'%(i+1))
             self.update_times(layer_i.times)
             layer_i._reset_times()
 
+    def seed_blocks(self,chop):
+        """
+        Seed the full (non-refine) searches with the carried indices.
+        """
+        for i in range(3):
+            ca_i = getattr(self,'c%d'%(i+1)).CAUnit
+            seed_i = None if chop.seeds is None else chop.seeds[i]
+            if ca_i.search_name in ["refine","csa"]: seed_i = None
+            ca_i.seed_inds = seed_i
+            ca_i.keep_inds = True
+
+    def collect_inds(self,chop):
+        chop.inds = []
+        for i in range(3):
+            ca_i = getattr(self,'c%d'%(i+1)).CAUnit
+            chop.inds.append(ca_i.last_inds)
+            ca_i.seed_inds = None
+            ca_i.keep_inds = False
+            ca_i.last_inds = None
+
     def forward(self, vid, flows=None, inds=None, batchsize=1):
         self.clear_inds_buffer()
 
+        # -- indices carried across temporal windows --
+        chop = None
+        if isinstance(inds,ChopState):
+            chop,inds = inds,None
+            self.seed_blocks(chop)
+
         state = [inds,None]
         out = self.c1(vid,flows,state,batchsize)
         inds0 = state[0]
-        out = self.RBS1(out)
+        out = run_groups(list(self.RBS1),out,self.ckpt_res_group)
         out = self.c2(out,flows,state,batchsize)
         inds1 = state[0]
-        out = self.RBS2(out)
+        out = run_groups(list(self.RBS2),out,self.ckpt_res_group)
         out = self.c3(out,flows,state,batchsize)
         inds2 = state[0]
         # if not(inds is None):
@@ -182,5 +393,7 @@ class CES(nn.Module):
         #     out,inds2 = self.c3(out,flows,inds1)
         inds = self.format_inds(inds0,inds1,inds2)
         self.update_ca_times()
+        if not(chop is None):
+            self.collect_inds(chop)
         return out#,inds
 
@@ -1,6 +1,7 @@
 
 from pathlib import Path
 from functools import partial
+from collections import OrderedDict
 from easydict import EasyDict as edict
 
 import torch as th
@@ -9,14 +10,20 @@ from .grecc_rcaa import RR as ColaNet
 from ..utils import optional as _optional
 
 from colanet.utils import model_io
+from colanet.utils.frozen_config import freeze,thaw
 from dev_basics import arch_io
-from .menu import extract_menu_cfg_impl,fill_menu
+from .menu import extract_menu_cfg_impl,fill_menu,plan_schedule
 
 # -- auto populate fields to extract config --
 from dev_basics.configs import ExtractConfig
 econfig = ExtractConfig(__file__) # init static variable
 extract_config = econfig.extract_config # rename extraction
 
+# -- compiled configs; keyed by the content hash of the input config --
+# -- (least recently used first; at most "_COMPILED_MAX") --
+_compiled = OrderedDict()
+_COMPILED_MAX = 64
+
 # _fields = []
 # def optional_full(init,pydict,field,default):
 #     if not(field in _fields) and init:
@@ -31,6 +38,38 @@ def load_model(cfg):
     # init = _optional(cfg,'__init',False) # purposefully weird key
     # optional = partial(optional_full,init)
 
+    # -- unpack configs --
+    compiled = compile_config(cfg)
+    if compiled is None: return
+    cfgs = thaw(compiled.cfgs)
+    blocks = thaw(compiled.blocks)
+    device = compiled.device
+
+    # -- init model --
+    model = ColaNet(cfgs.arch,blocks)#search_cfg)
+
+    # -- load model --
+    load_pretrained(model,cfgs.io)
+
+    # -- device --
+    model = model.to(device)
+
+    return model
+
+def compile_config(cfg):
+    """
+
+    The extracted configs and the per-block configs from the menu,
+    frozen and cached by the content hash of "cfg". Returns None on init.
+
+    """
+
+    # -- fast path --
+    key = None if econfig.is_init else freeze(cfg).digest
+    if key in _compiled:
+        _compiled.move_to_end(key)
+        return _compiled[key]
+
     # -- unpack configs --
     depth = [3]
     pairs = {"io":io_pairs(),
@@ -40,24 +79,19 @@ def load_model(cfg):
     device = econfig.optional(cfg,"device","cuda:0")
     cfgs = econfig.extract_set(pairs)
     if econfig.is_init: return
-    # print(menu_cfgs)
 
     # -- fill blocks with menu --
     # fields = ["attn","search","normz","agg"]
     fields = ["search"]
+    plan_schedule(menu_cfgs,cfgs.search) # check the index sharing
     blocks = fill_menu(cfgs,fields,menu_cfgs)
-    # print(blocks)
-
-    # -- init model --
-    model = ColaNet(cfgs.arch,blocks)#search_cfg)
 
-    # -- load model --
-    load_pretrained(model,cfgs.io)
-
-    # -- device --
-    model = model.to(device)
-
-    return model
+    # -- freeze --
+    compiled = freeze({"cfgs":cfgs,"blocks":blocks,"device":device})
+    _compiled[key] = compiled
+    if len(_compiled) > _COMPILED_MAX:
+        _compiled.popitem(last=False)
+    return compiled
 
 def load_pretrained(model,cfg):
     if cfg.pretrained_load:
@@ -109,7 +143,7 @@ def search_pairs():
 
 def arch_pairs():
     pairs = {"scale":[1],"self_ensemble":False,
-             "chop":False,"precision":"single",
+             "chop":False,"precision":"single","channels_last":False,
              "cpu":False,"n_GPUs":1,"pre_train":".",
              "save_models":False,"model":"COLA","mode":"E",
              "print_model":False,"resume":0,"seed":1,
@@ -117,7 +151,9 @@ def arch_pairs():
              "res_scale":1,"rgb_range":1.,"stages":6,
              "blocks":3,"act":"relu","sigma":0.,
              "arch_return_inds":False,"device":"cuda:0",
-             "attn_timer":False,"add_SE":False}
+             "attn_timer":False,"add_SE":False,
+             "ckpt_res_group":0,"ckpt_attn":"none",
+             "use_workspace":False}
     return pairs
     # return extract_pairs(pairs,_cfg,optional)
 
@@ -146,7 +182,9 @@ def extract_menu_cfg(_cfg,depth):
 
     cfg = econfig.extract_pairs({'search_menu_name':'full',
                                  "search_v0":"exact",
-                                 "search_v1":"refine"},_cfg)
+                                 "search_v1":"refine",
+                                 "search_menu_n":2,
+                                 "search_schedule":""},_cfg)
     return extract_menu_cfg_impl(cfg,depth)
 
 # -=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-=-
@@ -0,0 +1,148 @@
+"""
+
+A ladder of search configs ordered by quality for serving under a deadline.
+
+Each rung is a search config (ws,wt,k_s,k_a,stride0,...), a search menu
+to label the blocks exact/refine, and an optional x8 ensemble. Rungs are
+profiled once to measure their cost and psnr; at request time the highest
+quality rung that fits the deadline is swapped into the model with
+"set_search". Only the search and aggregation fields of a rung reach
+"set_search"; e.g. its name, cost and psnr do not.
+
+"""
+
+# -- misc --
+import time
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- local --
+from ..utils import optional
+from ..utils.aug_test import test_x8
+from ..utils.metrics import compute_psnrs
+from .menu import extract_menu_cfg_impl
+from .attn_mods import SEARCH_FIELDS,AGG_FIELDS
+
+MENU_FIELDS = ["search_menu_name","search_v0","search_v1",
+               "search_menu_n","search_schedule"]
+RUNG_FIELDS = SEARCH_FIELDS + AGG_FIELDS + \
+    ["k_a","softmax_scale","refine_inds","use_state_update"]
+
+def init_rung(cfg):
+    rung = edict()
+    rung.search = edict({k:v for k,v in cfg.items() if k in RUNG_FIELDS})
+    rung.menu = edict({k:optional(cfg,k,v) for k,v in
+                       zip(MENU_FIELDS,["full","exact","refine",2,""])})
+    rung.aug_test = optional(cfg,"aug_test",False)
+    rung.name = optional(cfg,"name","")
+    rung.cost = optional(cfg,"cost",None) # seconds per (t h w) element
+    rung.psnr = optional(cfg,"psnr",None)
+    return rung
+
+def rung_blocks(rung,depth=[3]):
+    """
+    Per-block search configs using the search menu.
+    """
+    blocks = []
+    menu_cfgs = extract_menu_cfg_impl(rung.menu,depth)
+    for menu_cfg in menu_cfgs:
+        block = edict(rung.search)
+        block.update({k:v for k,v in menu_cfg.items() if k in RUNG_FIELDS})
+        blocks.append(block)
+    return blocks
+
+def vid_nelems(vid):
+    T,C,H,W = vid.shape[-4:]
+    return T*H*W
+
+def sync_time(device):
+    if "cuda" in str(device):
+        th.cuda.synchronize()
+    return time.perf_counter()
+
+class QualityLadder():
+
+    def __init__(self, rung_cfgs, ema=0.9, depth=[3]):
+        self.rungs = [init_rung(cfg) for cfg in rung_cfgs]
+        self.ema = ema
+        self.depth = depth
+        self.current = None
+
+    def __len__(self):
+        return len(self.rungs)
+
+    def __getitem__(self,index):
+        return self.rungs[index]
+
+    def apply(self,model,index):
+        if self.current == index: return
+        model.set_search(rung_blocks(self.rungs[index],self.depth))
+        self.current = index
+
+    def forward(self,model,index,vid,flows=None):
+        self.apply(model,index)
+        if self.rungs[index].aug_test:
+            return test_x8(model,vid,flows)
+        else:
+            return model(vid,flows)
+
+    def profile(self,model,noisy,clean,flows=None,nreps=1):
+        """
+
+        Measure the cost and psnr of each rung on a calibration clip,
+        then sort the rungs from highest to lowest psnr.
+
+        """
+        nelems = vid_nelems(noisy)
+        for index,rung in enumerate(self.rungs):
+            with th.no_grad():
+                self.forward(model,index,noisy,flows) # burn-in
+                start = sync_time(noisy.device)
+                for _ in range(nreps):
+                    deno = self.forward(model,index,noisy,flows)
+                dtime = (sync_time(noisy.device) - start)/nreps
+            deno = deno.clamp(0.,1.)
+            rung.cost = dtime / nelems
+            rung.psnr = np.mean(compute_psnrs(deno,clean,div=1.)).item()
+        self.sort()
+
+    def sort(self):
+        cur = None if self.current is None else self.rungs[self.current]
+        self.rungs = sorted(self.rungs,key=lambda r: -r.psnr)
+        if not(cur is None):
+            self.current = self.rungs.index(cur)
+
+    def select(self,nelems,deadline,queue_depth=0):
+        """
+
+        Pick the best rung whose expected time fits the deadline [seconds].
+        With "queue_depth" requests waiting, the budget is split across
+        the backlog so the queue drains; the cheapest rung is the fallback.
+
+        """
+        if any([rung.cost is None for rung in self.rungs]):
+            raise ValueError("Profile the ladder before selecting a rung.")
+        budget = deadline / (1. + queue_depth)
+        for index,rung in enumerate(self.rungs):
+            if rung.cost * nelems <= budget:
+                return index
+        costs = [rung.cost for rung in self.rungs]
+        return int(np.argmin(costs))
+
+    def run(self,model,vid,flows=None,deadline=float("inf"),queue_depth=0):
+        """
+        Denoise "vid" with the best rung for the deadline.
+        """
+        nelems = vid_nelems(vid)
+        index = self.select(nelems,deadline,queue_depth)
+        start = sync_time(vid.device)
+        with th.no_grad():
+            deno = self.forward(model,index,vid,flows)
+        dtime = sync_time(vid.device) - start
+        self.update_cost(index,dtime/nelems)
+        return deno,index
+
+    def update_cost(self,index,cost):
+        rung = self.rungs[index]
+        rung.cost = self.ema * rung.cost + (1 - self.ema) * cost
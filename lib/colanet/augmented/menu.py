@@ -5,11 +5,26 @@ The number of layers ~= 50
 This is too many params to set by hand.
 Instead, fix the list of parameters using a menu.
 
+A menu is either named ("full","one","first","nth") with two search
+types "search_v0" and "search_v1", or an explicit schedule with one
+spec per block separated by "/",
+
+    search_schedule = "exact:ws=21:k=100:s=4/refine:wr=3:k=50/refine:k=30:ka=-1"
+
+Each spec is the search type followed by optional "key=value" overrides
+(keys: ws,wt,wr,kr,ps,k [k_s],ka [k_a],s [stride0]); a single spec is
+used for every block. A "refine" block re-ranks the indices of the block
+before it (passed along by "update_state"), so only the first block
+pays for a full window search. "load_model" checks the index sharing
+with "plan_schedule"; "estimate_cost" gives the search cost of a
+schedule to compare schedules before running them.
+
 """
 
 import copy
 dcopy = copy.deepcopy
 import numpy as np
+from functools import lru_cache
 from easydict import EasyDict as edict
 from ..utils import optional
 
@@ -26,13 +41,17 @@ def fill_menu(_cfgs,fields,menu_cfgs):
                "normz":[],"agg":[],}
 
     # -- filling --
+    # -- (edict copies nested lists; values are scalars) --
     cfgs = []
     for menu_cfg in menu_cfgs:
         cfgs_m = edict()
         for field in fields:
-            cfg_f = dcopy(_cfgs[field])
+            cfg_f = edict(_cfgs[field])
             for fill_key in mfields[field]:
                 cfg_f[fill_key] = menu_cfg[fill_key]
+            for fill_key in menu_cfg: # schedule overrides
+                if fill_key in cfg_f:
+                    cfg_f[fill_key] = menu_cfg[fill_key]
             cfgs_m[field] = cfg_f
         cfgs.append(cfgs_m)
     return cfgs
@@ -44,11 +63,14 @@ def extract_menu_cfg_impl(cfg,depth):
     # -- unpack search name --
     # "search_vX" in ["exact","refine","approx_t","approx_s","approx_st"]
     p = edict()
-    pairs = {"search_menu_name":"full","search_v0":"exact","search_v1":"exact"}
+    pairs = {"search_menu_name":"full","search_v0":"exact","search_v1":"exact",
+             "search_menu_n":2,"search_schedule":""}
     for key,val in pairs.items():
         p[key] = optional(cfg,key,val)
+    if p.search_schedule:
+        return parse_schedule(p.search_schedule,depth)
     search_names = search_menu(p.search_menu_name,depth,
-                               p.search_v0,p.search_v1)
+                               p.search_v0,p.search_v1,p.search_menu_n)
 
     # -- search params from names --
     nblocks = len(search_names)
@@ -85,14 +107,20 @@ def search_params_from_names(search_names,nblocks):
     params.use_state_updates = []
 
     # -- fill --
+    any_refine = "refine" in search_names
     for i in range(nblocks):
-        any_refine = np.any(np.array(search_names)=="refine")
         params.use_state_updates.append(any_refine)
     return params
 
-def search_menu(menu_name,depth,v0,v1):
-    nblocks = 2*np.sum(depth[:-1]) + depth[-1]
-    nblocks = int(nblocks)
+def get_nblocks(depth):
+    return int(2*sum(depth[:-1]) + depth[-1])
+
+def search_menu(menu_name,depth,v0,v1,menu_n=2):
+    return list(_search_menu(menu_name,tuple(depth),v0,v1,menu_n))
+
+@lru_cache(maxsize=128)
+def _search_menu(menu_name,depth,v0,v1,menu_n):
+    nblocks = get_nblocks(depth)
 
     if menu_name == "full":
         return [v0,]*nblocks
@@ -116,5 +144,105 @@ def search_menu(menu_name,depth,v0,v1):
                 names.append(v1)
         return names
     else:
-        raise ValeError("Uknown search type in menu [%s]" % menu_name)
+        raise ValueError("Uknown search type in menu [%s]" % menu_name)
+
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+#     Schedules
+# -=-=-=-=-=-=-=-=-=-=-=-=-=-=-
+
+SCHEDULE_SEP = "/" # can't appear in a value (e.g. "ka=-1")
+SCHEDULE_KEYS = {"ws":"ws","wt":"wt","wr":"wr","kr":"kr","ps":"ps",
+                 "k":"k_s","k_s":"k_s","ka":"k_a","k_a":"k_a",
+                 "s":"stride0","stride0":"stride0"}
+
+def parse_schedule(schedule,depth):
+    """
+
+    Per-block configs from a schedule string; see the module docstring.
+
+    """
+    nblocks = get_nblocks(depth)
+    specs = schedule.split(SCHEDULE_SEP)
+    if len(specs) == 1:
+        specs = specs * nblocks
+    if len(specs) != nblocks:
+        msg = "Schedule has %d blocks but the model has %d [%s]"
+        raise ValueError(msg % (len(specs),nblocks,schedule))
+
+    blocks = []
+    for spec in specs:
+        fields = spec.split(":")
+        block = edict()
+        block.search_name = fields[0]
+        for field in fields[1:]:
+            if field.count("=") != 1:
+                raise ValueError("Expected key=value in schedule [%s]" % spec)
+            key,val = field.split("=")
+            if not(key in SCHEDULE_KEYS):
+                raise ValueError("Uknown schedule key [%s]" % key)
+            block[SCHEDULE_KEYS[key]] = float(val) if key == "kr" else int(val)
+        blocks.append(block)
+
+    # -- derived --
+    names = [block.search_name for block in blocks]
+    params = search_params_from_names(names,nblocks)
+    for block,use_state in zip(blocks,params.use_state_updates):
+        block.use_state_update = use_state
+    return blocks
+
+def plan_schedule(blocks,base_cfg):
+    """
+
+    Resolve each block against "base_cfg" and check the index sharing:
+    a "refine" block needs a block before it with the same query stride
+    and can keep at most the candidates it is given.
+
+    """
+    plan = []
+    for l,block in enumerate(blocks):
+        cfg = edict(base_cfg)
+        cfg.update(block)
+        if cfg.search_name == "refine":
+            if l == 0:
+                raise ValueError("The first block can't refine; no indices yet.")
+            prev = plan[-1]
+            if prev.stride0 != cfg.stride0:
+                msg = "Block %d refines indices of stride %d with stride %d"
+                raise ValueError(msg % (l,prev.stride0,cfg.stride0))
+            ncand = int(prev.k_s * cfg.kr) * cfg.wr**2
+            if cfg.k_s > ncand:
+                msg = "Block %d keeps k=%d of only %d refined candidates"
+                raise ValueError(msg % (l,cfg.k_s,ncand))
+        plan.append(cfg)
+    return plan
+
+def estimate_cost(blocks,base_cfg,vshape,nchnls=64):
+    """
+
+    Multiply-adds of the search and aggregation of each block for a video
+    of shape (T,C,H,W); returns the per-block costs and the total.
+
+    exact: ws^2 * (2 wt + 1) candidates per query
+    refine: (k_prev * kr) * wr^2 candidates per query
+
+    """
+    T,_,H,W = vshape[-4:]
+    plan = plan_schedule(blocks,base_cfg)
+    costs = []
+    for l,cfg in enumerate(plan):
+        nq = T * ((H-1)//cfg.stride0+1) * ((W-1)//cfg.stride0+1)
+        if cfg.search_name == "refine":
+            ncand = int(plan[l-1].k_s * cfg.kr) * cfg.wr**2
+        elif cfg.search_name == "csa":
+            ncand = ((H-1)//cfg.stride1+1) * ((W-1)//cfg.stride1+1)
+        else:
+            ncand = cfg.ws**2 * (2*cfg.wt+1)
+        pdim = cfg.ps**2 * nchnls
+        k_a = cfg.k_a if cfg.k_a > 0 else ncand
+        cost = edict()
+        cost.search = nq * ncand * pdim
+        cost.agg = nq * k_a * pdim
+        cost.total = cost.search + cost.agg
+        costs.append(cost)
+    return costs,sum([cost.total for cost in costs])
 
@@ -9,6 +9,7 @@ from colanet.utils import fwd_4dim
 # -- modules --
 from .ca_module import ContextualAttention_Enhance
 from .sk_conv import SKUnit
+from .checkpointing import checkpoint_replay,use_checkpoint
 
 class merge_block(nn.Module):
     def __init__(self,search_cfg,in_channels,out_channels,vector_length=32,
@@ -24,6 +25,7 @@ class merge_block(nn.Module):
         self.att_CA = nn.Linear(in_features=vector_length,out_features=out_channels)
         self.att_SK = nn.Linear(in_features=vector_length,out_features=out_channels)
         self.softmax = nn.Softmax(dim=1)
+        self.ckpt = False # see checkpointing.py
 
     @property
     def times(self):
@@ -32,16 +34,30 @@ class merge_block(nn.Module):
     def _reset_times(self):
         self.CAUnit._reset_times()
 
+    def set_search(self,search_cfg):
+        return self.CAUnit.set_search(search_cfg)
+
     def forward(self, x, flows, state, batchsize):
+        if self.ckpt and use_checkpoint(self):
+            def fxn(x,replay):
+                state_r = [None,None] if replay else state
+                return self._forward(x,flows,state_r,batchsize)
+            return checkpoint_replay(fxn,[self.CAUnit],x)
+        return self._forward(x,flows,state,batchsize)
+
+    def _forward(self, x, flows, state, batchsize):
         out1 = self.SKUnit(x)
         out2 = self.CAUnit(x,flows,state,batchsize)
-        out = torch.cat((out2[:,None],out1[:,None]),dim=1)
-        U = torch.sum(out,dim=1)
-        attention_vector = U.mean(-1).mean(-1)
+
+        # -- gate from the sum; no stacked copy of the branches --
+        U = out1 + out2
+        attention_vector = U.mean((-2,-1))
         attention_vector = self.fc1(attention_vector)
-        attention_vector_CA = self.att_CA(attention_vector)[:,None]
-        attention_vector_SK = self.att_SK(attention_vector)[:,None]
-        vector = torch.cat((attention_vector_CA,attention_vector_SK),dim=1)
-        vector = self.softmax(vector)[...,None,None]
-        out = (out*vector).sum(dim=1)
+        attention_vector_CA = self.att_CA(attention_vector)
+        attention_vector_SK = self.att_SK(attention_vector)
+        vector = torch.stack((attention_vector_CA,attention_vector_SK),dim=1)
+        vector = self.softmax(vector)[...,None,None].to(out1.dtype)
+
+        # -- two weights sum to one: out2*w + out1*(1-w) --
+        out = torch.lerp(out1,out2,vector[:,0])
         return out
@@ -13,6 +13,7 @@ from torch.nn.functional import unfold as th_unfold
 from .tiling import *
 from dev_basics.utils.timer import ExpTimerList,ExpTimer
 import colanet.utils.gpu_mem as gpu_mem
+from colanet.utils.misc import fp32_region
 
 def print_nan_info(vid,y,Z,dists,inds,state,search_cfg):
     print(search_cfg)
@@ -29,25 +30,62 @@ register_method = clean_code.register_method(__methods__)
 @register_method
 def run_search(self,q_vid,k_vid,flows,state):
     self.timer.sync_start("search")
+    if not(self.replay_inds is None):
+        # -- recompute of a checkpoint; see checkpointing.py --
+        dists,inds = self.get_cache_refine()(q_vid,k_vid,self.replay_inds)
+    elif self.record_inds:
+        # -- first pass of a checkpoint; scored by the op of the recompute --
+        with th.no_grad():
+            _,search_inds = self.search_op(q_vid,k_vid,flows,state)
+        self.search_inds = search_inds.detach()
+        dists,inds = self.get_cache_refine()(q_vid,k_vid,self.search_inds)
+    else:
+        dists,inds = self.search_op(q_vid,k_vid,flows,state)
+    if self.keep_inds: self.last_inds = inds.detach()
+    self.update_state(state,dists,inds,q_vid.shape)
+    self.timer.sync_stop("search")
+    return dists,inds
+
+@register_method
+def search_op(self,q_vid,k_vid,flows,state):
     if self.search_name == "refine":
         inds_p = self.inds_rs1(state[0])
         dists,inds = self.search(q_vid,k_vid,inds_p)
+    elif not(self.seed_inds is None):
+        dists,inds = self.get_seed_refine()(q_vid,k_vid,self.seed_inds)
     elif self.search_name == "rand_inds":
         dists,inds = self.search(q_vid,k_vid)
     else:
         dists,inds = self.search(q_vid,k_vid,flows.fflow,flows.bflow)
-    self.update_state(state,dists,inds,q_vid.shape)
-    self.timer.sync_stop("search")
     return dists,inds
 
+@register_method
+def get_seed_refine(self):
+    """
+    Refine search around carried indices (e.g. from the previous
+    temporal window) in place of the full search.
+    """
+    if self.seed_refine is None:
+        cfg = self.search_cfg
+        self.seed_refine = self.init_refine(
+            k=self.k_s,ps=cfg.ps,pt=cfg.pt,ws=cfg.ws,wr=cfg.wr,kr=cfg.kr,
+            wt=cfg.wt,stride0=cfg.stride0,stride1=cfg.stride1,
+            dilation=cfg.dilation,rbwd=cfg.rbwd,nbwd=cfg.nbwd,exact=cfg.exact,
+            dist_type=cfg.dist_type,reflect_bounds=cfg.reflect_bounds)
+    return self.seed_refine
+
 @register_method
 def update_state(self,state,dists,inds,vshape):
+    """
+    state[0] holds the indices of the latest block (read by
+    the next "refine" block) and state[1] those of the one before.
+    """
     if not(self.use_state_update): return
     T,C,H,W = vshape[-4:]
     nH = (H-1)//self.stride0+1
     nW = (W-1)//self.stride0+1
-    state[0] = state[1]
-    state[1] = self.inds_rs0(inds.detach(),nH,nW)
+    state[1] = state[0]
+    state[0] = self.inds_rs0(inds.detach(),nH,nW)
 
 @register_method
 def inds_rs0(self,inds,nH,nW):
@@ -63,6 +101,42 @@ def inds_rs1(self,inds):
     inds = rearrange(inds,rshape)
     return inds
 
+@register_method
+def get_workspace(self):
+    """
+    The shared workspace (see "utils/workspace.py") if buffers can be reused.
+    """
+    ws = self.workspace
+    if ws is None or not(ws.active): return None
+    return ws
+
+@register_method
+def get_ifold(self,ws,vshape,device):
+    if ws is None: return self.init_ifold(vshape,device)
+    search = self.search
+    key = (tuple(vshape),str(device),search.stride0,
+           search.dilation,search.reflect_bounds)
+    ifold = ws.get_obj("ifold",key,lambda: self.init_ifold(vshape,device))
+    ifold.vid.zero_()
+    ifold.zvid.zero_()
+    return ifold
+
+@register_method
+def ws_copy(self,ws,tag,tensor):
+    if ws is None: return tensor.contiguous()
+    buf = ws.get(tag,tensor.shape,tensor.dtype,tensor.device)
+    return buf.copy_(tensor)
+
+@register_method
+def attn_weights(self,ws,dists):
+    scale = -self.softmax_scale if self.dist_type == "l2" else self.softmax_scale
+    if ws is None:
+        return F.softmax(dists*scale,-1)
+    attn = ws.get("attn",dists.shape,dists.dtype,dists.device)
+    th.mul(dists,scale,out=attn)
+    attn.sub_(attn.amax(-1,keepdim=True)).exp_()
+    return attn.div_(attn.sum(-1,keepdim=True))
+
 @register_method
 def forward_nl(self, vid, flows=None, state=None):
 
@@ -93,47 +167,50 @@ def forward_nl(self, vid, flows=None, state=None):
     # print(b3[0,0,:3,:3,:3])
     # print("-"*30)
 
-    # -- init & update --
-    ifold = self.init_ifold(b1.shape,b1.device)
-    # if not(self.refine_inds):
-    #     # print(vid.shape,flows.fflow.shape,flows.bflow.shape)
-    #     self.search.update_flow(vid.shape,vid.device,flows)
-
-    # -- run search --
-    self.timer.sync_start("search")
-    # dists,inds = self.search.wrap_fwd(b1,qindex,nbatch_i,b3,inds_pred)
-    # print(b1.shape,b3.shape)
-    dists,inds = self.run_search(b1,b3,flows,state)
-    self.timer.sync_stop("search")
+    # -- search, softmax and fold in fp32 (under autocast too) --
+    b1,b2,b3 = [b.float().contiguous() for b in [b1,b2,b3]]
+    with fp32_region(vid.device):
+
+        # -- init & update --
+        ws = self.get_workspace()
+        ifold = self.get_ifold(ws,b1.shape,b1.device)
+        # if not(self.refine_inds):
+        #     # print(vid.shape,flows.fflow.shape,flows.bflow.shape)
+        #     self.search.update_flow(vid.shape,vid.device,flows)
+
+        # -- run search --
+        self.timer.sync_start("search")
+        # dists,inds = self.search.wrap_fwd(b1,qindex,nbatch_i,b3,inds_pred)
+        # print(b1.shape,b3.shape)
+        dists,inds = self.run_cached_search(vid,b1,b3,flows,state)
+        self.timer.sync_stop("search")
+
+        # -- subset to only aggregate --
+        # print(self.k_a)
+        if self.k_a > 0 and self.k_a != self.k_s:
+            inds = self.ws_copy(ws,"inds",inds[...,:self.k_a,:])
+            dists = self.ws_copy(ws,"dists",dists[...,:self.k_a])
+        inds_agg = inds.contiguous()#[...,:self.k_a,:].contiguous()
+        dists_agg = dists.contiguous()#[...,:self.k_a].contiguous()
+
+        # -- attn mask --
+        self.timer.sync_start("agg")
+        yi = self.attn_weights(ws,dists_agg)
+        assert_nonan(yi)
+        zi = self.wpsum(b2,yi,inds_agg)
+        self.timer.sync_stop("agg")
+
+        # -- ifold --
+        self.timer.sync_start("fold")
+        zi = rearrange(zi,'b H q 1 c h w -> b q H 1 c h w')
+        ifold(zi,0)#qindex)
+        self.timer.sync_stop("fold")
+
+        # -- get post-attn vid --
+        y,Z = ifold.vid,ifold.zvid
+        if ws is None: y = y / Z
+        else: y = th.div(y,Z,out=ws.get("y",y.shape,y.dtype,y.device))
 
-    # -- subset to only aggregate --
-    # print(self.k_a)
-    if self.k_a > 0 and self.k_a != self.k_s:
-        inds = inds[...,:self.k_a,:].contiguous()
-        dists = dists[...,:self.k_a].contiguous()
-    inds_agg = inds.contiguous()#[...,:self.k_a,:].contiguous()
-    dists_agg = dists.contiguous()#[...,:self.k_a].contiguous()
-
-    # -- manage dists --
-    if self.dist_type == "l2":
-        dists_agg = -dists_agg
-
-    # -- attn mask --
-    self.timer.sync_start("agg")
-    yi = F.softmax(dists_agg*self.softmax_scale,-1)
-    assert_nonan(yi)
-    zi = self.wpsum(b2,yi,inds_agg)
-    self.timer.sync_stop("agg")
-
-    # -- ifold --
-    self.timer.sync_start("fold")
-    zi = rearrange(zi,'b H q 1 c h w -> b q H 1 c h w')
-    ifold(zi,0)#qindex)
-    self.timer.sync_stop("fold")
-
-    # -- get post-attn vid --
-    y,Z = ifold.vid,ifold.zvid
-    y = y / Z
     if th.any(th.isnan(y)):
         print_nan_info(vid,y,Z,dists,inds,state,self.search_cfg)
         print("Nan found.")
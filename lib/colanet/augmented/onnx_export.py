@@ -0,0 +1,200 @@
+"""
+
+Export RR to ONNX through its static variant (see "static.py").
+
+With search_name = "csa" the attention is unfold/matmul/softmax/fold and
+the graph only holds standard ONNX ops (opset >= 18 for Col2Im); it runs
+in onnxruntime as is.
+
+    export_onnx(model,"rr.onnx",vshape=(3,1,128,128))
+    deno = run_onnx("rr.onnx",noisy,fflow,bflow)
+
+Other searches export the two stnls operators as custom ops of the
+"colanet" domain. A runtime must provide kernels for them; "ref_search"
+and "ref_agg_fold" below are their reference implementations.
+
+  colanet::Search(q, k, fflow, bflow, inds_p) -> (dists, inds)
+    q,k: (B,T,C,H,W) float; fflow,bflow: (B,T,2,H,W) float;
+    inds_p: the inds of the previous block (only read when refine = 1).
+    One query patch per stride0 location, Q = T*nH*nW with
+    nH = (H-1)//stride0+1. Candidates are the ps x ps patches of "k"
+    in a ws x ws window, over frames t-wt..t+wt (following the flows);
+    with refine = 1 the window is wr x wr around each of inds_p.
+    dists: (B,1,Q,k_s) the patch dot products (dist_type "prod") or
+    squared l2 distances ("l2") of the k_s best; inds: (B,1,Q,k_s,3)
+    int32 rows of (t,h,w) of each match.
+    attrs: ws, wt, wr, ps, k_s, stride0, stride1, dilation,
+    dist_type, reflect_bounds, refine.
+
+  colanet::AggFold(v, weights, inds) -> y
+    v: (B,T,C,H,W); weights: (B,1,Q,K); inds: (B,1,Q,K,3).
+    The weighted sum of the ps x ps patches of "v" at "inds" is added
+    back at the location of each query patch and each pixel is divided
+    by the number of patches covering it. y: (B,T,C,H,W).
+    attrs: ps, stride0, dilation, reflect_bounds.
+
+The shapes are fixed at export.
+
+"""
+
+# -- misc --
+import time
+import torch as th
+import torch.nn.functional as F
+from easydict import EasyDict as edict
+
+# -- local --
+from .static import _ATTN_OPS
+
+#
+# -- export --
+#
+
+def sample_inputs(vshape, device="cpu"):
+    T,C,H,W = vshape
+    vid = th.rand((1,T,C,H,W),device=device)
+    fflow = th.zeros((1,T,2,H,W),device=device)
+    return vid,fflow,fflow.clone()
+
+def export_onnx(model, path, vshape=(3,1,64,64), opset=18):
+    """
+
+    Export the inference path of "model" (an RR) for clips of
+    shape "vshape" = (T,C,H,W); the exported inputs are
+    vid (1,T,C,H,W), fflow and bflow (1,T,2,H,W).
+
+    """
+    register_symbolics(opset)
+    smodel = model.to_static().cpu().float()
+    inputs = sample_inputs(vshape)
+    with th.no_grad():
+        th.onnx.export(smodel,inputs,path,opset_version=opset,
+                       input_names=["vid","fflow","bflow"],
+                       output_names=["deno"],
+                       custom_opsets={"colanet":1})
+    return path
+
+def register_symbolics(opset):
+    th.onnx.register_custom_op_symbolic("colanet::search",symbolic_search,opset)
+    th.onnx.register_custom_op_symbolic("colanet::agg_fold",symbolic_agg_fold,opset)
+
+def symbolic_search(g, q, k, fflow, bflow, inds_p, name):
+    from torch.onnx import symbolic_helper
+    cfg = _ATTN_OPS[symbolic_helper._maybe_get_const(name,"s")]["cfg"]
+    return g.op("colanet::Search",q,k,fflow,bflow,inds_p,
+                ws_i=cfg.ws,wt_i=cfg.wt,wr_i=cfg.wr,ps_i=cfg.ps,k_s_i=cfg.k_s,
+                stride0_i=cfg.stride0,stride1_i=cfg.stride1,
+                dilation_i=cfg.dilation,dist_type_s=cfg.dist_type,
+                reflect_bounds_i=int(cfg.reflect_bounds),
+                refine_i=int(cfg.search_name == "refine"),outputs=2)
+
+def symbolic_agg_fold(g, v, weights, inds, name):
+    from torch.onnx import symbolic_helper
+    cfg = _ATTN_OPS[symbolic_helper._maybe_get_const(name,"s")]["cfg"]
+    return g.op("colanet::AggFold",v,weights,inds,ps_i=cfg.ps,
+                stride0_i=cfg.stride0,dilation_i=cfg.dilation,
+                reflect_bounds_i=int(cfg.reflect_bounds))
+
+#
+# -- onnxruntime --
+#
+
+def init_session(path, nthreads=None):
+    import onnxruntime as ort
+    opts = ort.SessionOptions()
+    if not(nthreads is None):
+        opts.intra_op_num_threads = nthreads
+    return ort.InferenceSession(path,opts,providers=["CPUExecutionProvider"])
+
+def run_onnx(sess, vid, fflow, bflow):
+    if isinstance(sess,str): sess = init_session(sess)
+    names = [i.name for i in sess.get_inputs()]
+    feeds = {"vid":vid,"fflow":fflow,"bflow":bflow}
+    feeds = {k:v.detach().cpu().numpy() for k,v in feeds.items() if k in names}
+    return th.from_numpy(sess.run(["deno"],feeds)[0])
+
+def compare_latency(model, path, vshape=(3,1,64,64), nreps=10, nthreads=None):
+    """
+    Time per clip of the eager model and of onnxruntime on the cpu.
+    """
+    sess = init_session(path,nthreads)
+    smodel = model.to_static().cpu().float()
+    inputs = sample_inputs(vshape)
+    fwds = {"torch":lambda: smodel(*inputs),
+            "onnx":lambda: run_onnx(sess,*inputs)}
+    report,outs = edict(),{}
+    with th.no_grad():
+        for name,fwd in fwds.items():
+            fwd() # burn-in
+            start = time.perf_counter()
+            for _ in range(nreps): outs[name] = fwd()
+            report[name] = (time.perf_counter() - start)/nreps
+    report.max_diff = (outs["torch"] - outs["onnx"]).abs().max().item()
+    report.speedup = report.torch / report.onnx
+    return report
+
+#
+# -- reference implementations of the custom ops --
+#
+
+def unfold_vid(vid, ps, dilation=1):
+    # -- (B,T,C,H,W) -> (B,T,C*ps*ps,H,W); one patch per pixel --
+    B,T,C,H,W = vid.shape
+    pad = dilation*(ps//2)
+    patches = F.unfold(vid.reshape(B*T,C,H,W),ps,dilation=dilation,padding=pad)
+    return patches.reshape(B,T,C*ps*ps,H,W)
+
+def query_grid(T, H, W, stride0, device):
+    ti,hi,wi = th.meshgrid(th.arange(T,device=device),
+                           th.arange(0,H,stride0,device=device),
+                           th.arange(0,W,stride0,device=device),indexing="ij")
+    return th.stack([ti,hi,wi],-1).reshape(-1,3) # Q,3
+
+def ref_search(q, k, ws, wt, ps, k_s, stride0, dist_type="prod", dilation=1):
+    """
+
+    colanet::Search without flows or refinement, zero-padded patches.
+    Memory is O(Q * ws^2 * (2wt+1) * C * ps^2); for testing only.
+
+    """
+    B,T,C,H,W = q.shape
+    qp,kp = unfold_vid(q,ps,dilation),unfold_vid(k,ps,dilation)
+    grid = query_grid(T,H,W,stride0,q.device)
+
+    # -- candidate locations; windows are shifted inside the frame --
+    off = th.arange(ws,device=q.device)
+    tc = (grid[:,None,0] + th.arange(-wt,wt+1,device=q.device)).clamp(0,T-1)
+    hc = (grid[:,1] - ws//2).clamp(0,max(H-ws,0))[:,None] + off
+    wc = (grid[:,2] - ws//2).clamp(0,max(W-ws,0))[:,None] + off
+    tc,hc,wc = tc[:,:,None,None],hc[:,None,:,None],wc[:,None,None,:]
+    tc,hc,wc = th.broadcast_tensors(tc,hc.clamp(0,H-1),wc.clamp(0,W-1))
+    cands = th.stack([tc,hc,wc],-1).reshape(len(grid),-1,3) # Q,N,3
+
+    # -- distances --
+    qv = qp[:,grid[:,0],:,grid[:,1],grid[:,2]] # Q,B,F
+    kv = kp[:,cands[...,0],:,cands[...,1],cands[...,2]] # Q,N,B,F
+    if dist_type == "prod":
+        dists = th.einsum("qbf,qnbf->bqn",qv,kv)
+    else:
+        dists = ((qv[:,None] - kv)**2).sum(-1).permute(2,0,1)
+    dists,order = th.topk(dists,k_s,-1,largest=dist_type == "prod")
+    inds = cands[None].expand(B,-1,-1,-1)
+    inds = th.gather(inds,2,order[...,None].expand(-1,-1,-1,3))
+    return dists[:,None],inds[:,None].int()
+
+def ref_agg_fold(v, weights, inds, ps, stride0, dilation=1):
+    """
+    colanet::AggFold with zero-padded patches.
+    """
+    B,T,C,H,W = v.shape
+    vp = unfold_vid(v,ps,dilation)
+    inds = inds[:,0].long()
+    bi = th.arange(B,device=v.device)[:,None,None]
+    patches = vp[bi,inds[...,0],:,inds[...,1],inds[...,2]] # B,Q,K,F
+    zi = (weights[:,0,...,None] * patches).sum(2) # B,Q,F
+    nH,nW = (H-1)//stride0+1,(W-1)//stride0+1
+    zi = zi.reshape(B*T,nH*nW,-1).transpose(1,2)
+    pad = dilation*(ps//2)
+    fold = lambda x: F.fold(x,(H,W),ps,dilation=dilation,padding=pad,stride=stride0)
+    y = fold(zi) / fold(th.ones_like(zi))
+    return y.reshape(B,T,C,H,W)
@@ -0,0 +1,199 @@
+"""
+
+Post-training int8 quantization of the convolutional trunk of RR.
+
+The head, the two stacks of ResBlocks and the tail convs, and every conv
+of each SKUnit (with its BatchNorms folded in) run in int8 (weights and
+activations); the attention layers, the SK gating and the SKUnit skip
+stay in float.
+
+    qmodel = quantize_model(model,calib) # calib: [(noisy,flows),...]
+    export_quantized(qmodel,"rr_int8.pt")
+    qmodel = load_quantized(model,"rr_int8.pt")
+
+Quantized convs run on the cpu ("fbgemm" on x86, "qnnpack" on arm), so
+the attention must use a cpu search, i.e. search_name = "csa".
+
+"""
+
+# -- misc --
+import copy
+import time
+import numpy as np
+import torch as th
+import torch.nn as nn
+from einops import rearrange
+from easydict import EasyDict as edict
+
+# -- quantization --
+import torch.ao.quantization as tq
+import torch.ao.nn.quantized as nnq
+
+# -- local --
+from .misc_blocks import ResBlock
+from .fuse import fold_bn,fold_bn_input,fuse_seq
+from ..utils.metrics import compute_psnrs
+
+class QuantSeq(nn.Module):
+    """
+    Float in, float out; the modules in between run quantized.
+    """
+
+    def __init__(self, *modules):
+        super().__init__()
+        self.quant = tq.QuantStub()
+        self.body = nn.Sequential(*modules)
+        self.dequant = tq.DeQuantStub()
+
+    def forward(self, x):
+        return self.dequant(self.body(self.quant(x)))
+
+class QuantResBlock(nn.Module):
+    """
+    A ResBlock with the scale and skip as quantizable functionals.
+    """
+
+    def __init__(self, block):
+        super().__init__()
+        self.body = block.body
+        self.res_scale = block.res_scale
+        self.scale = nnq.FloatFunctional()
+        self.skip = nnq.FloatFunctional()
+
+    def forward(self, x):
+        res = self.body(x)
+        if self.res_scale != 1:
+            res = self.scale.mul_scalar(res,self.res_scale)
+        return self.skip.add(res,x)
+
+def quant_trunk(modules):
+    modules = [QuantResBlock(m) if isinstance(m,ResBlock) else m
+               for m in modules]
+    return QuantSeq(*modules)
+
+@th.no_grad()
+def quant_skunit(skunit):
+    """
+    Fold the BatchNorms into the convs (see fuse.py) and quantize
+    the 1x1 convs, the branches of the SKConv and the shortcut.
+    """
+    conv0,bn0,skconv,bn1,conv1,bn2 = list(skunit.feas.children())
+    for i,branch in enumerate(skconv.convs):
+        groups = [[str(j),str(j+1),str(j+2)] for j in range(0,len(branch),3)]
+        tq.fuse_modules(branch,groups,inplace=True)
+        skconv.convs[i] = QuantSeq(branch)
+    conv1 = fold_bn(fold_bn_input(bn1,conv1),bn2)
+    skunit.feas = nn.Sequential(QuantSeq(fold_bn(conv0,bn0)),skconv,
+                                QuantSeq(conv1))
+    if len(skunit.shortcut) > 0:
+        skunit.shortcut = QuantSeq(*fuse_seq(skunit.shortcut))
+
+class QuantRR(nn.Module):
+    """
+    The forward of RR with quantized trunk segments around a float CES.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        body = list(model.body.children())
+        nhalf = model.n_resblocks // 2
+        assert body[nhalf] is model.msa
+        self.pre = quant_trunk(list(model.head.children()) + body[:nhalf])
+        self.msa = model.msa
+        self.post = quant_trunk(body[nhalf+1:] + list(model.tail.children()))
+        for i in range(3):
+            quant_skunit(getattr(self.msa,'c%d'%(i+1)).SKUnit)
+            ca_i = getattr(self.msa,'c%d'%(i+1)).CAUnit
+            ca_i.search_cache_input = None # keyed by the block input here
+
+    def quant_modules(self):
+        return [m for m in self.modules() if isinstance(m,QuantSeq)]
+
+    def forward(self, vid, flows=None, state=None):
+        ndim = vid.ndim
+        if vid.ndim == 4:
+            vid = vid[None,:]
+        B = vid.shape[0]
+        vid = rearrange(vid,'b t c h w -> (b t) c h w')
+        res = self.pre(vid)
+        res = self.msa(res,flows,state,B)
+        res = self.post(res)
+        vid = vid + res
+        vid = rearrange(vid,'(b t) c h w -> b t c h w',b=B)
+        if ndim == 4:
+            vid = vid[0]
+        return vid
+
+def prepare_model(model, backend="fbgemm"):
+    th.backends.quantized.engine = backend
+    qmodel = QuantRR(copy.deepcopy(model).cpu().eval()).eval()
+    qconfig = tq.get_default_qconfig(backend)
+    for module in qmodel.quant_modules():
+        module.qconfig = qconfig
+    tq.prepare(qmodel,inplace=True)
+    return qmodel
+
+def quantize_model(model, calib, backend="fbgemm"):
+    """
+
+    Calibrate the observers on "calib", a list of (noisy,flows) on the
+    cpu, and convert the trunk to int8. "model" is not modified.
+
+    """
+    qmodel = prepare_model(model,backend)
+    with th.no_grad():
+        for noisy,flows in calib:
+            qmodel(noisy,flows=flows)
+    tq.convert(qmodel,inplace=True)
+    return qmodel
+
+def export_quantized(qmodel, path, backend="fbgemm"):
+    th.save({"state_dict":qmodel.state_dict(),"backend":backend},path)
+
+def load_quantized(model, path):
+    """
+    Rebuild the quantized structure of "model" and load the int8 weights.
+    """
+    ckpt = th.load(path,map_location="cpu")
+    qmodel = prepare_model(model,ckpt["backend"])
+    tq.convert(qmodel,inplace=True)
+    qmodel.load_state_dict(ckpt["state_dict"])
+    return qmodel
+
+def count_convs(net):
+    """
+    The number of int8 and float convs of "net".
+    """
+    nint8 = len([m for m in net.modules() if isinstance(m,nnq.Conv2d)])
+    nfloat = len([m for m in net.modules() if isinstance(m,nn.Conv2d)])
+    return nint8,nfloat
+
+def benchmark(model, qmodel, samples, nreps=3):
+    """
+
+    Time and psnr of the float and int8 models on the cpu;
+    "samples" is a list of (noisy,clean,flows) on [0,1].
+
+    """
+    model = model.cpu().eval()
+    report = edict({"float":edict({"time":[],"psnr":[]}),
+                    "int8":edict({"time":[],"psnr":[]})})
+    for name,net in [("float",model),("int8",qmodel)]:
+        for noisy,clean,flows in samples:
+            with th.no_grad():
+                net(noisy,flows=flows) # burn-in
+                start = time.perf_counter()
+                for _ in range(nreps):
+                    deno = net(noisy,flows=flows)
+                dtime = (time.perf_counter() - start)/nreps
+            deno = deno.clamp(0.,1.)
+            psnr = np.mean(compute_psnrs(deno,clean,div=1.)).item()
+            report[name].time.append(dtime)
+            report[name].psnr.append(psnr)
+    for name in ["float","int8"]:
+        report[name].ave_time = float(np.mean(report[name].time))
+        report[name].ave_psnr = float(np.mean(report[name].psnr))
+    report.speedup = report.float.ave_time / report.int8.ave_time
+    report.psnr_drop = report.float.ave_psnr - report.int8.ave_psnr
+    report.int8_convs,report.float_convs = count_convs(qmodel)
+    return report
@@ -0,0 +1,249 @@
+"""
+
+An opt-in cache of the search indices of the attention layers.
+
+When a clip is denoised many times (sweeps over softmax_scale or k_a,
+ensembles, epochs of adaptation) the search of a block only depends on
+the model input, the weights upstream of the block and its search
+config. The cache keys each search by
+
+    (block name, input digest, flows digest, search fields)
+
+where the search fields are the config fields the search reads
+("SEARCH_FIELDS" of attn_mods.py), so changing k_a, softmax_scale or
+agg_fxn reuses the cached indices. The digests are sha1 hashes of the
+bytes of the model's input and flows, computed once per call of
+RR.forward; with a cache set this copies the input and flows to the
+host on every forward, hit or miss.
+
+Entries store the dists with compact indices and the digest of all the
+model weights (a superset of those upstream of the block). An entry
+made with the same weights is used directly ("bypass"); with
+mode="refine" an entry made with older weights seeds a refine search
+(wr=1) which recomputes the dists at the cached indices instead of
+searching the full window.
+
+    model.enable_search_cache(SearchCache(max_bytes=2**30,cache_dir=".cache"))
+    ...
+    model.invalidate_search_cache() # e.g. after loading new weights
+
+Entries over "max_bytes" are evicted least-recently-used, and written to
+"cache_dir" if set. In-place weight updates (optimizer steps,
+load_state_dict) change the weights version, so stale entries are not
+used directly. The cache is skipped in training mode.
+
+"""
+
+# -- misc --
+import hashlib
+from pathlib import Path
+from collections import OrderedDict
+import torch as th
+from easydict import EasyDict as edict
+from ..utils.frozen_config import config_digest
+from .attn_mods import SEARCH_FIELDS
+
+# -- clean code --
+from colanet.utils import clean_code
+__methods__ = [] # self is a DataStore
+register_method = clean_code.register_method(__methods__)
+
+def digest(tensor):
+    """
+    sha1 of the shape, dtype and bytes of "tensor"; one device-to-host copy.
+    """
+    if tensor is None: return "none"
+    x = tensor.detach().contiguous().reshape(-1)
+    hasher = hashlib.sha1(("%s:%s" % (list(tensor.shape),tensor.dtype)).encode())
+    hasher.update(x.view(th.uint8).cpu().numpy())
+    return hasher.hexdigest()
+
+class WeightsVersion():
+    """
+
+    Digest of the parameters returned by "params_fxn", recomputed only
+    after one of them is updated in-place (optimizer steps,
+    load_state_dict) or replaced. "invalidate" bumps a counter so
+    entries made before it are never used directly.
+
+    """
+
+    def __init__(self, params_fxn):
+        self.params_fxn = params_fxn
+        self.versions = None
+        self.digest = None
+        self.count = 0
+
+    def __call__(self):
+        params = list(self.params_fxn())
+        versions = tuple([(id(p),p._version) for p in params])
+        if self.versions != versions:
+            hasher = hashlib.sha1()
+            for param in params:
+                hasher.update(digest(param).encode())
+            self.digest = hasher.hexdigest()
+            self.versions = versions
+        return "%d;%s" % (self.count,self.digest)
+
+    def invalidate(self):
+        self.count += 1
+        self.versions = None
+
+def compact_inds(inds):
+    if inds.is_floating_point(): return inds
+    if inds.numel() > 0 and inds.abs().max().item() < 2**15:
+        return inds.to(th.int16)
+    return inds
+
+class SearchCache():
+
+    def __init__(self, max_bytes=2**30, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = None if cache_dir is None else Path(cache_dir)
+        self.entries = OrderedDict()
+        self.on_disk = set()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        if not(self.cache_dir is None):
+            self.cache_dir.mkdir(parents=True,exist_ok=True)
+            self.on_disk = set([f.stem for f in self.cache_dir.glob("*.pt")])
+
+    def __len__(self):
+        return len(self.entries) + len(self.on_disk)
+
+    def get(self, key, device):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        if key in self.on_disk:
+            entry = edict(th.load(self.cache_dir / ("%s.pt" % key)))
+            entry.dists = entry.dists.to(device)
+            entry.inds = entry.inds.to(device)
+            self.add(key,entry)
+            return entry
+        return None
+
+    def put(self, key, version, dists, inds, itype):
+        entry = edict({"version":version,"dists":dists.detach(),
+                       "inds":compact_inds(inds.detach()),"itype":itype})
+        self.add(key,entry)
+
+    def add(self, key, entry):
+        if key in self.entries:
+            self.nbytes -= entry_nbytes(self.entries[key])
+        self.entries[key] = entry
+        self.nbytes += entry_nbytes(entry)
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self.evict()
+
+    def evict(self):
+        key,entry = self.entries.popitem(last=False)
+        self.nbytes -= entry_nbytes(entry)
+        if self.cache_dir is None: return
+        entry = {k:(v.cpu() if th.is_tensor(v) else v) for k,v in entry.items()}
+        th.save(entry,self.cache_dir / ("%s.pt" % key))
+        self.on_disk.add(key)
+
+    def clear(self, disk=True):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        if disk and not(self.cache_dir is None):
+            for key in self.on_disk:
+                path = self.cache_dir / ("%s.pt" % key)
+                if path.exists(): path.unlink()
+            self.on_disk = set()
+
+def entry_nbytes(entry):
+    return sum([v.numel()*v.element_size() for v in entry.values()
+                if th.is_tensor(v)])
+
+def input_digest(vid, flows):
+    fflow = None if flows is None else flows.fflow
+    bflow = None if flows is None else flows.bflow
+    return ";".join([digest(vid),digest(fflow),digest(bflow)])
+
+@register_method
+def search_cache_key(self, vid, flows, state):
+    """
+    The key of the search of this block; "search_cache_input" is the
+    digest of the model input (set by RR.forward), else that of "vid".
+    """
+    inputs = self.search_cache_input
+    if inputs is None: inputs = input_digest(vid,flows)
+    prev = state[0] if self.search_name == "refine" else self.seed_inds
+    cfg = {k:v for k,v in self.search_cfg.items() if k in SEARCH_FIELDS}
+    key = "|".join([self.search_cache_name,inputs,digest(prev),
+                    config_digest(cfg)])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+@register_method
+def weights_version(self):
+    """
+    Digest of the weights the search depends on; shared across the
+    layers of a model (see RR.enable_search_cache), else this layer's.
+    """
+    if self.search_cache_weights is None:
+        self.search_cache_weights = WeightsVersion(self.parameters)
+    return self.search_cache_weights()
+
+@register_method
+def invalidate_search_cache(self):
+    if not(self.search_cache_weights is None):
+        self.search_cache_weights.invalidate()
+
+@register_method
+def run_cached_search(self, vid, q_vid, k_vid, flows, state):
+    """
+
+    "run_search" through the search cache; see "search_cache.py".
+
+    """
+    cache = self.search_cache
+    if cache is None or self.training:
+        return self.run_search(q_vid,k_vid,flows,state)
+
+    # -- lookup --
+    key = self.search_cache_key(vid,flows,state)
+    version = self.weights_version()
+    entry = cache.get(key,q_vid.device)
+
+    # -- hit; same weights --
+    if not(entry is None) and entry.version == version:
+        cache.hits += 1
+        dists,inds = entry.dists,entry.inds.to(entry.itype)
+        if self.keep_inds: self.last_inds = inds
+        self.update_state(state,dists,inds,q_vid.shape)
+        return dists,inds
+
+    # -- refine the old indices --
+    cache.misses += 1
+    if not(entry is None) and self.search_cache_mode == "refine":
+        inds_p = entry.inds.to(entry.itype)
+        dists,inds = self.get_cache_refine()(q_vid,k_vid,inds_p)
+        if self.keep_inds: self.last_inds = inds.detach()
+        self.update_state(state,dists,inds,q_vid.shape)
+    else:
+        dists,inds = self.run_search(q_vid,k_vid,flows,state)
+    cache.put(key,version,dists,inds,inds.dtype)
+    return dists,inds
+
+@register_method
+def get_cache_refine(self):
+    if self.cache_refine is None:
+        cfg = self.search_cfg
+        self.cache_refine = self.init_refine(
+            k=self.k_s,ps=cfg.ps,pt=cfg.pt,ws=cfg.ws,wr=1,kr=1.,wt=cfg.wt,
+            stride0=cfg.stride0,stride1=cfg.stride1,dilation=cfg.dilation,
+            rbwd=cfg.rbwd,nbwd=cfg.nbwd,exact=cfg.exact,
+            dist_type=cfg.dist_type,reflect_bounds=cfg.reflect_bounds)
+    return self.cache_refine
+
+@register_method
+def init_search_cache(self):
+    self.search_cache = None
+    self.search_cache_mode = "bypass"
+    self.search_cache_name = ""
+    self.search_cache_input = None
+    self.search_cache_weights = None
+    self.cache_refine = None
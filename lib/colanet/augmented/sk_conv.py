@@ -50,25 +50,27 @@ class SKConv(nn.Module):
         self.softmax = nn.Softmax(dim=1)
 
     def forward(self, x):
-        for i, conv in enumerate(self.convs):
-            fea = conv(x)[:,None]#.unsqueeze_(dim=1)
-            if i == 0:
-                feas = fea
-            else:
-                feas = torch.cat([feas, fea], dim=1)
-        fea_U = torch.sum(feas, dim=1)
-        # fea_s = self.gap(fea_U).squeeze_()
-        fea_s = fea_U.mean(-1).mean(-1)
+
+        # -- branches; gate from their sum without stacking --
+        feas = [conv(x) for conv in self.convs]
+        fea_U = feas[0]
+        for fea in feas[1:]:
+            fea_U = fea_U + fea
+        fea_s = fea_U.mean((-2,-1))
         fea_z = self.fc(fea_s)
-        for i, fc in enumerate(self.fcs):
-            vector = fc(fea_z)[:,None]#.unsqueeze_(dim=1)
-            if i == 0:
-                attention_vectors = vector
-            else:
-                attention_vectors = torch.cat([attention_vectors, vector], dim=1)
-        attention_vectors = self.softmax(attention_vectors)
-        attention_vectors = attention_vectors[...,None,None]#.unsqueeze(-1).unsqueeze(-1)
-        fea_v = (feas * attention_vectors).sum(dim=1)
+
+        # -- one matmul for all branch vectors --
+        weight = torch.cat([fc.weight for fc in self.fcs],0)
+        bias = torch.cat([fc.bias for fc in self.fcs],0)
+        attention_vectors = F.linear(fea_z,weight,bias)
+        attention_vectors = attention_vectors.view(-1,self.M,self.features)
+        attention_vectors = self.softmax(attention_vectors)[...,None,None]
+        attention_vectors = attention_vectors.to(feas[0].dtype)
+
+        # -- fused weighted sum --
+        fea_v = feas[0] * attention_vectors[:,0]
+        for i in range(1,self.M):
+            fea_v = torch.addcmul(fea_v,feas[i],attention_vectors[:,i])
         return fea_v
 
 
@@ -0,0 +1,242 @@
+"""
+
+A compile-ready inference variant of RR.
+
+"RR" builds its attention at runtime (registered methods, edict configs,
+getattr dispatch, timers and iFoldz objects made in forward) which breaks
+the graph of torch.compile many times per forward. The modules here share
+the weights of a loaded RR but have a static structure: every config field
+is a python constant fixed at init and the forward only takes tensors.
+
+    smodel = model.to_static()      # shares parameters with "model"
+    smodel = th.compile(smodel)
+    deno = smodel(noisy,fflow,bflow)
+
+The "csa" attention is written in plain tensor ops and compiles fully.
+The stnls search and the aggregate/fold are registered as custom ops,
+"colanet::search" and "colanet::agg_fold", so the compiled graph calls
+them as single opaque nodes. Their operator objects are held in a module
+registry keyed by name since a custom op only takes tensors and scalars;
+each entry is named after its StaticCA and dropped when it is freed.
+Custom ops need torch >= 2.4; older versions call the functions directly.
+
+The search cache, the carried indices of temporal_chop, the timers and
+the inds buffer are not part of this variant.
+
+"""
+
+# -- misc --
+import weakref
+from typing import Optional,Tuple
+import stnls
+import torch as th
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+
+#
+# -- custom ops for the stnls search and aggregate/fold --
+#
+
+_ATTN_OPS = {}
+
+def register_attn_ops(ca, owner):
+    """
+    Hold the operators of a ContextualAttention_Enhance under a name
+    unique to "owner" while it is alive.
+    """
+    name = "ca%x" % id(owner)
+    weakref.finalize(owner,_ATTN_OPS.pop,name,None)
+    cfg = ca.search_cfg
+    _ATTN_OPS[name] = {"search":ca.search,"wpsum":ca.wpsum,"cfg":cfg,
+                       "refine":ca.search_name == "refine",
+                       "stride0":cfg.stride0,"dilation":cfg.dilation,
+                       "reflect_bounds":cfg.reflect_bounds,"k_s":cfg.k_s}
+    return name
+
+def _search(q: Tensor, k: Tensor, fflow: Tensor, bflow: Tensor,
+            inds_p: Tensor, name: str) -> Tuple[Tensor,Tensor]:
+    ops = _ATTN_OPS[name]
+    if ops["refine"]:
+        dists,inds = ops["search"](q,k,inds_p)
+    else:
+        dists,inds = ops["search"](q,k,fflow,bflow)
+    return dists.contiguous(),inds.contiguous()
+
+def _search_fake(q, k, fflow, bflow, inds_p, name):
+    ops = _ATTN_OPS[name]
+    B,T,C,H,W = q.shape
+    stride0 = ops["stride0"]
+    nq = T * ((H-1)//stride0+1) * ((W-1)//stride0+1)
+    dists = q.new_empty((B,1,nq,ops["k_s"]))
+    inds = q.new_empty((B,1,nq,ops["k_s"],3),dtype=th.int32)
+    return dists,inds
+
+def _agg_fold(v: Tensor, weights: Tensor, inds: Tensor, name: str) -> Tensor:
+    ops = _ATTN_OPS[name]
+    zi = ops["wpsum"](v,weights,inds)
+    zi = zi.transpose(1,2) # b H q 1 c h w -> b q H 1 c h w
+    ifold = stnls.iFoldz(v.shape,stride=ops["stride0"],
+                         dilation=ops["dilation"],use_adj=False,
+                         only_full=False,reflect_bounds=ops["reflect_bounds"],
+                         device=v.device)
+    ifold(zi,0)
+    return ifold.vid / ifold.zvid
+
+def _agg_fold_fake(v, weights, inds, name):
+    return th.empty_like(v)
+
+if hasattr(th.library,"custom_op"):
+    search_op = th.library.custom_op("colanet::search",mutates_args=())(_search)
+    search_op.register_fake(_search_fake)
+    agg_fold_op = th.library.custom_op("colanet::agg_fold",mutates_args=())(_agg_fold)
+    agg_fold_op.register_fake(_agg_fold_fake)
+else:
+    search_op = _search
+    agg_fold_op = _agg_fold
+
+#
+# -- csa in tensor ops; matches "csa_attn.forward_csa" --
+#
+
+def same_pad(ps: int, stride: int, H: int, W: int) -> Tuple[int,int,int,int]:
+    out_H = (H + stride - 1) // stride
+    out_W = (W + stride - 1) // stride
+    pad_H = max(0, (out_H - 1) * stride + ps - H)
+    pad_W = max(0, (out_W - 1) * stride + ps - W)
+    return (pad_W//2, pad_W - pad_W//2, pad_H//2, pad_H - pad_H//2)
+
+def patches(x: Tensor, ps: int, stride: int) -> Tensor:
+    H,W = x.shape[-2:]
+    x = F.pad(x,same_pad(ps,stride,H,W))
+    return F.unfold(x,ps,stride=stride) # t f n
+
+def csa_attn(b1: Tensor, b2: Tensor, b3: Tensor, ps: int, stride0: int,
+             stride1: int, scale: float) -> Tensor:
+    H,W = b1.shape[-2:]
+    p0 = patches(b1,ps,stride0).transpose(1,2)
+    p1 = patches(b3,ps,stride1)
+    weights = F.softmax((p0 @ p1)*scale,dim=1)
+    p3 = patches(b2,ps,stride1).transpose(1,2)
+    zi = th.bmm(weights,p3).transpose(1,2)
+    pad = same_pad(ps,stride1,H,W)[0]
+    yvid = F.fold(zi,(H,W),(ps,ps),padding=pad,stride=stride0)
+    zvid = F.fold(th.ones_like(zi),(H,W),(ps,ps),padding=pad,stride=stride0)
+    return yvid / zvid
+
+#
+# -- modules --
+#
+
+class StaticCA(nn.Module):
+    """
+    ContextualAttention_Enhance with its config fixed at init.
+    """
+
+    def __init__(self, ca):
+        super().__init__()
+        cfg = ca.search_cfg
+        self.g,self.theta,self.phi,self.W = ca.g,ca.theta,ca.phi,ca.W
+        self.add_SE = ca.add_SE
+        self.SE,self.conv33 = ca.SE,ca.conv33
+        self.use_csa = ca.search_name == "csa"
+        self.ps = cfg.ps
+        self.stride0 = cfg.stride0
+        self.stride1 = cfg.stride1
+        self.k_a = ca.k_a if (ca.k_a > 0 and ca.k_a != ca.k_s) else -1
+        self.neg_dists = cfg.dist_type == "l2"
+        self.softmax_scale = float(ca.softmax_scale)
+        self.name = "" if self.use_csa else register_attn_ops(ca,self)
+
+    def forward(self, x: Tensor, fflow: Tensor, bflow: Tensor,
+                inds_p: Tensor, B: int) -> Tuple[Tensor,Tensor]:
+        b1,b2,b3 = self.g(x),self.theta(x),self.phi(x)
+        if self.use_csa:
+            y = csa_attn(b1.float(),b2.float(),b3.float(),self.ps,
+                         self.stride0,self.stride1,self.softmax_scale)
+            inds = inds_p
+        else:
+            y,inds = self.nl_attn(b1,b2,b3,fflow,bflow,inds_p,B)
+        y = x + self.W(y.to(x.dtype))
+        if self.add_SE:
+            y = self.conv33(th.cat((self.SE(y)*y,y),dim=1))
+        return y,inds
+
+    def nl_attn(self, b1, b2, b3, fflow, bflow, inds_p, B: int):
+        BT,C,H,W = b1.shape
+        b1,b2,b3 = [b.float().reshape(B,BT//B,C,H,W) for b in [b1,b2,b3]]
+        dists,inds = search_op(b1,b3,fflow,bflow,inds_p,self.name)
+        if self.k_a > 0:
+            dists = dists[...,:self.k_a].contiguous()
+            inds = inds[...,:self.k_a,:].contiguous()
+        if self.neg_dists:
+            dists = -dists
+        weights = F.softmax(dists*self.softmax_scale,-1)
+        y = agg_fold_op(b2,weights,inds,self.name)
+        return y.reshape(BT,C,H,W),inds
+
+class StaticMergeBlock(nn.Module):
+
+    def __init__(self, block):
+        super().__init__()
+        self.SKUnit = block.SKUnit
+        self.CAUnit = StaticCA(block.CAUnit)
+        self.fc1,self.att_CA,self.att_SK = block.fc1,block.att_CA,block.att_SK
+
+    def forward(self, x: Tensor, fflow: Tensor, bflow: Tensor,
+                inds_p: Tensor, B: int) -> Tuple[Tensor,Tensor]:
+        out1 = self.SKUnit(x)
+        out2,inds = self.CAUnit(x,fflow,bflow,inds_p,B)
+        vec = self.fc1((out1 + out2).mean((-2,-1)))
+        vec = th.stack((self.att_CA(vec),self.att_SK(vec)),dim=1)
+        vec = F.softmax(vec,dim=1)[...,None,None].to(out1.dtype)
+        return th.lerp(out1,out2,vec[:,0]),inds
+
+class StaticCES(nn.Module):
+
+    def __init__(self, ces):
+        super().__init__()
+        self.c1 = StaticMergeBlock(ces.c1)
+        self.c2 = StaticMergeBlock(ces.c2)
+        self.c3 = StaticMergeBlock(ces.c3)
+        self.RBS1,self.RBS2 = ces.RBS1,ces.RBS2
+
+    def forward(self, x: Tensor, fflow: Tensor, bflow: Tensor,
+                B: int) -> Tensor:
+        inds = x.new_empty(0,dtype=th.int32)
+        x,inds = self.c1(x,fflow,bflow,inds,B)
+        x,inds = self.c2(self.RBS1(x),fflow,bflow,inds,B)
+        x,inds = self.c3(self.RBS2(x),fflow,bflow,inds,B)
+        return x
+
+class StaticRR(nn.Module):
+    """
+    RR with the body split around the attention; takes (B,T,C,H,W) or
+    (T,C,H,W) and flows of shape (B,T,2,H,W).
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        body = list(model.body.children())
+        nhalf = model.n_resblocks // 2
+        assert body[nhalf] is model.msa
+        self.head = model.head
+        self.pre = nn.Sequential(*body[:nhalf])
+        self.msa = StaticCES(model.msa)
+        self.post = nn.Sequential(*body[nhalf+1:])
+        self.tail = model.tail
+
+    def forward(self, vid: Tensor, fflow: Optional[Tensor]=None,
+                bflow: Optional[Tensor]=None) -> Tensor:
+        squeeze = vid.ndim == 4
+        if squeeze: vid = vid[None]
+        B,T,C,H,W = vid.shape
+        if fflow is None: fflow = vid.new_zeros((B,T,2,H,W))
+        if bflow is None: bflow = vid.new_zeros((B,T,2,H,W))
+        x = vid.reshape(B*T,C,H,W)
+        res = self.pre(self.head(x))
+        res = self.msa(res,fflow,bflow,B)
+        res = self.tail(self.post(res))
+        vid = (x + res).reshape(B,T,C,H,W)
+        if squeeze: vid = vid[0]
+        return vid
@@ -0,0 +1,189 @@
+"""
+
+Recall of the windowed top-k searches against full attention.
+
+The ground truth is the full (per-frame) attention of "CSASearch" with
+every pixel as a key. For each approximate search ("exact" windowed,
+"refine", "rand_inds") and each (ws,k,stride0) in a grid we report
+
+  recall: the softmax attention mass covered by the distinct k neighbors
+  error: relative l2 error of the attention output vs full attention
+  time: seconds per search
+  mem: peak gpu memory of the search [GB]
+
+so configurations on the recall/time Pareto front can be chosen directly.
+
+    vid = synthetic_features(T=3,C=16,H=64,W=64,device="cuda:0")
+    rows = run_grid(vid,{"ws":[9,21],"k_s":[25,100],"stride0":[4]})
+    front = pareto(rows)
+
+Approximate neighbors in other frames count toward the output error
+but not the recall, since the ground truth is per frame (wt = 0).
+
+"""
+
+# -- misc --
+import time
+import itertools
+import torch as th
+import torch.nn.functional as F
+from einops import rearrange
+from easydict import EasyDict as edict
+
+# -- search --
+import stnls
+from ..search.csa import CSASearch
+from ..augmented.io import search_pairs
+
+def synthetic_features(B=1,T=3,C=16,H=64,W=64,shift=2,sigma=0.1,
+                       seed=0,device="cuda:0"):
+    """
+    Smooth random features; each frame is the previous one shifted by
+    "shift" pixels plus noise, so true matches exist across frames.
+    """
+    gen = th.Generator().manual_seed(seed)
+    base = th.randn((B,C,H,W),generator=gen)
+    base = F.avg_pool2d(base,5,stride=1,padding=2)
+    frames = [th.roll(base,(t*shift,t*shift),(-2,-1)) for t in range(T)]
+    vid = th.stack(frames,1)
+    vid = vid + sigma*th.randn(vid.shape,generator=gen)
+    return vid.to(device)
+
+def sync_time(device):
+    if "cuda" in str(device):
+        th.cuda.synchronize()
+    return time.perf_counter()
+
+def reset_mem(device):
+    if "cuda" in str(device):
+        th.cuda.reset_peak_memory_stats(device)
+
+def peak_mem(device):
+    if not("cuda" in str(device)): return 0.
+    return th.cuda.max_memory_allocated(device) / 1024.**3
+
+def full_attention(vid,ps,stride0):
+    """
+    Ground truth logits (B,T,Q,H*W) with keys centered at every pixel.
+    """
+    B,T,C,H,W = vid.shape
+    pad = ps//2
+    vid_p = rearrange(vid,'b t c h w -> (b t) c h w')
+    vid_p = F.pad(vid_p,(pad,pad,pad,pad),mode="reflect")
+    vid_p = rearrange(vid_p,'(b t) c h w -> b t c h w',b=B)
+    search = CSASearch(ps,1,stride0,1)
+    attn,_ = search(vid_p)
+    return attn[:,:,0]
+
+def init_search(name,cfg):
+    cfg = edict(cfg)
+    cfg.search_name = name
+    cfg.k = cfg.k_s
+    return stnls.search.init(cfg)
+
+def run_search(name,cfg,vid,flows):
+    """
+    Returns the dists and inds of one search; "refine" is seeded by
+    an exact search with window "ws_seed".
+    """
+    if name == "refine":
+        cfg_s = edict(cfg)
+        cfg_s.ws = cfg.ws_seed
+        seed = init_search("exact",cfg_s)
+        _,inds_p = seed(vid,vid,flows.fflow,flows.bflow)
+        return init_search("refine",cfg)(vid,vid,inds_p)
+    elif name == "rand_inds":
+        return init_search(name,cfg)(vid,vid)
+    else:
+        return init_search(name,cfg)(vid,vid,flows.fflow,flows.bflow)
+
+def attention_metrics(vid,logits,dists,inds,scale,stride0):
+    """
+    Recall of the attention mass and the relative output error.
+    """
+    B,T,C,H,W = vid.shape
+    nH,nW = (H-1)//stride0+1,(W-1)//stride0+1
+    probs = F.softmax(scale*logits,-1) # b t q (h w)
+
+    # -- exact output; values are the center pixels --
+    vals = rearrange(vid,'b t c h w -> b t (h w) c')
+    out_full = th.matmul(probs,vals)
+
+    # -- neighbors per query --
+    inds = rearrange(inds[:,0].long(),'b (t q) k tr -> b t q k tr',t=T)
+    dists = rearrange(dists[:,0],'b (t q) k -> b t q k',t=T)
+    tq = th.arange(T,device=vid.device).view(1,T,1,1)
+    same = inds[...,0] == tq
+    hw = (inds[...,1].clamp(0,H-1)*W + inds[...,2].clamp(0,W-1))
+
+    # -- recall; a repeated neighbor counts once --
+    keys,_ = th.where(same,hw,-1).sort(-1)
+    first = th.ones_like(same)
+    first[...,1:] = keys[...,1:] != keys[...,:-1]
+    mass = th.gather(probs,-1,keys.clamp(min=0))
+    recall = (mass*(first & (keys >= 0))).sum(-1).mean().item()
+
+    # -- approx output --
+    weights = F.softmax(scale*dists,-1)
+    vals_f = rearrange(vals,'b t n c -> b (t n) c')
+    flat = inds[...,0].clamp(0,T-1)*H*W + hw
+    nbrs = th.gather(vals_f,1,flat.flatten(1)[...,None].expand(-1,-1,C))
+    nbrs = nbrs.view(flat.shape+(C,))
+    out_approx = (weights[...,None]*nbrs).sum(-2)
+    error = th.linalg.norm(out_approx-out_full)/th.linalg.norm(out_full)
+    return recall,error.item()
+
+def run_grid(vid,grid,names=None,scale=10.,nreps=3,base_cfg=None):
+    """
+
+    Measure every search in "names" (default: exact, refine and
+    rand_inds) over the product of "grid",
+    e.g. {"ws":[9,21],"k_s":[25,100],"stride0":[4]}.
+
+    """
+    if names is None: names = ["exact","refine","rand_inds"]
+    device = vid.device
+    cfg0 = edict(search_pairs())
+    cfg0.update({"wt":0,"k_a":-1,"ws_seed":9,"nheads":1,"reflect_bounds":True,
+                 "use_state_update":False})
+    if not(base_cfg is None): cfg0.update(base_cfg)
+    zeros = th.zeros_like(vid[:,:,:2])
+    flows = edict({"fflow":zeros,"bflow":zeros})
+    keys = list(grid.keys())
+
+    rows = []
+    gt_cache = {}
+    for vals in itertools.product(*[grid[k] for k in keys]):
+        cfg = edict(cfg0)
+        cfg.update(dict(zip(keys,vals)))
+        if not((cfg.ps,cfg.stride0) in gt_cache):
+            gt_cache[(cfg.ps,cfg.stride0)] = full_attention(vid,cfg.ps,cfg.stride0)
+        logits = gt_cache[(cfg.ps,cfg.stride0)]
+        for name in names:
+            with th.no_grad():
+                run_search(name,cfg,vid,flows) # burn-in
+                reset_mem(device)
+                start = sync_time(device)
+                for _ in range(nreps):
+                    dists,inds = run_search(name,cfg,vid,flows)
+                dtime = (sync_time(device) - start)/nreps
+                mem = peak_mem(device)
+                recall,error = attention_metrics(vid,logits,dists,inds,
+                                                 scale,cfg.stride0)
+            row = edict({"name":name,"recall":recall,"error":error,
+                         "time":dtime,"mem":mem})
+            row.update(dict(zip(keys,vals)))
+            rows.append(row)
+    return rows
+
+def pareto(rows,x="time",y="recall"):
+    """
+    The rows not dominated in (lower "x", higher "y"), sorted by "x".
+    """
+    rows = sorted(rows,key=lambda r: (r[x],-r[y]))
+    front,best = [],-float("inf")
+    for row in rows:
+        if row[y] > best:
+            front.append(row)
+            best = row[y]
+    return front
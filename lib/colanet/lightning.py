@@ -30,7 +30,14 @@ import colanet.configs as configs
 import colanet.utils.gpu_mem as gpu_mem
 from colanet.utils.timer import ExpTimer
 from colanet.utils.metrics import compute_psnrs,compute_ssims
-from colanet.utils.misc import rslice,write_pickle,read_pickle
+from colanet.utils.misc import rslice,write_pickle,read_pickle,optional
+from colanet.utils.misc import rslice_videos,equal_regions
+from colanet.utils.noise import NoiseModel,counter_seed
+from colanet.utils.dist_data import RegionSampler,reduce_means
+
+# -- configs --
+from dev_basics.configs import ExtractConfig
+econfig = ExtractConfig(__file__) # init static variable
 
 # -- noise sims --
 try:
@@ -45,6 +52,7 @@ logging.basicConfig()
 # -- lightning module --
 import torch
 import pytorch_lightning as pl
+from pytorch_lightning.strategies import DDPStrategy
 from pytorch_lightning import Callback
 from pytorch_lightning.loggers import CSVLogger
 from pytorch_lightning.callbacks import ModelCheckpoint
@@ -57,7 +65,8 @@ from pytorch_lightning.utilities.distributed import rank_zero_only
 def init_cfg(cfg):
     econfig.set_cfg(cfg)
     cfgs = econfig({"lit":lit_pairs(),
-                    "sim":sim_pairs()})
+                    "sim":sim_pairs(),
+                    "dist":dist_pairs()})
     return cfgs
 
 def lit_pairs():
@@ -71,9 +80,52 @@ def lit_pairs():
 
 def sim_pairs():
     pairs = {"sim_type":"g","sim_module":"stardeno",
-             "sim_device":"cuda:0","load_fxn":"load_sim"}
+             "sim_device":"cuda:0","load_fxn":"load_sim",
+             "sim_sigma":25.,"sim_gain":0.01,"sim_seed":123}
+    return pairs
+
+def dist_pairs():
+    pairs = {"accelerator":"gpu","ndevices":1,"dist_backend":"nccl",
+             "accumulate_grad_batches":1,"crops_per_video":1}
     return pairs
 
+def dist_trainer_kwargs(cfg):
+    """
+
+    The pl.Trainer args for "cfg.ndevices" processes on "cfg.accelerator";
+    more than one device trains with DDP over "cfg.dist_backend"
+    (e.g. "nccl" on gpus, "gloo" on cpus).
+
+    """
+    ndevices = cfg.ndevices
+    kwargs = {"accelerator":cfg.accelerator,"devices":ndevices,
+              "accumulate_grad_batches":cfg.accumulate_grad_batches}
+    if ndevices > 1:
+        kwargs['strategy'] = DDPStrategy(process_group_backend=cfg.dist_backend,
+                                         find_unused_parameters=False)
+        kwargs['replace_sampler_ddp'] = False # see "region_loader"
+    return kwargs
+
+def region_loader(cfg,dset,batch_size,shuffle=True):
+    """
+    A loader over the region crops of "dset", sharded across processes.
+    """
+    sampler = RegionSampler(dset,crops_per_video=cfg.crops_per_video,
+                            shuffle=shuffle,seed=cfg.seed)
+    nworkers = optional(cfg,"num_workers",2)
+    persist = optional(cfg,"persistent_workers",False) and nworkers > 0
+    return th.utils.data.DataLoader(dset,batch_size=batch_size,sampler=sampler,
+                                    num_workers=nworkers,persistent_workers=persist,
+                                    pin_memory=cfg.accelerator == "gpu")
+
+def peak_mem(name):
+    if not(th.cuda.is_available()): return 0.,0.
+    return gpu_mem.print_peak_gpu_stats(False,name,reset=True)
+
+# -- the epoch metrics of each stage; a fixed list for "reduce_means" --
+METRIC_KEYS = {"train":["loss","psnr"],
+               "val":["loss","mem_alloc","mem_res","psnr"]}
+
 def get_sim_model(self,cfg):
     if cfg.sim_type == "g":
         return None
@@ -90,6 +142,7 @@ class ColaNetLit(pl.LightningModule):
                  lr_init=1e-3,lr_final=1e-8,weight_decay=1e-4,nepochs=0,
                  warmup_epochs=0,scheduler="default",momentum=0.,
                  task=0,uuid="",sim_type="g",sim_device="cuda:0",
+                 sim_sigma=25.,sim_gain=0.01,sim_seed=123,
                  optim="default",deno_clamp=False):
         super().__init__()
         self.optim = optim
@@ -109,12 +162,17 @@ class ColaNetLit(pl.LightningModule):
         self.gen_loger = logging.getLogger('lightning')
         self.gen_loger.setLevel("NOTSET")
         self.ca_fwd = "stnls_k"
-        self.sim_model = self.get_sim_model(sim_type,sim_device)
+        self.sim_model = self.get_sim_model(sim_type,sim_device,
+                                            sim_sigma,sim_gain,sim_seed)
         self.deno_clamp = deno_clamp
+        self.epoch_sums = {}
 
-    def get_sim_model(self,sim_type,sim_device):
+    def get_sim_model(self,sim_type,sim_device,sigma=25.,gain=0.01,seed=123):
         if sim_type == "g":
             return None
+        elif sim_type in ["gs","pg"]:
+            ntype = "g" if sim_type == "gs" else "pg"
+            return NoiseModel(ntype,sigma,gain,seed,imax=255.)
         elif sim_type == "stardeno":
             return stardeno.load_noise_sim(sim_device,True).to(sim_device)
         else:
@@ -147,10 +205,21 @@ class ColaNetLit(pl.LightningModule):
             deno = th.clamp(deno,0.,1.)
         return deno
 
-    def sample_noisy(self,batch):
+    def sample_noisy(self,batch,step=0):
+        """
+        "step" must differ across the draws of one video; e.g. the
+        micro-batch in training. Evaluation uses one fixed draw.
+        """
         if self.sim_model is None: return
         clean = batch['clean']
-        noisy = self.sim_model.run_rgb(clean)
+        if isinstance(self.sim_model,NoiseModel):
+            video = batch['index'] if 'index' in batch else 0
+            frame = batch['fnums'][:,0] if 'fnums' in batch else 0
+            region = batch['region'] if 'region' in batch else None
+            noisy = self.sim_model(clean,video=video,frame=frame,
+                                   region=region,step=step)
+        else:
+            noisy = self.sim_model.run_rgb(clean)
         batch['noisy'] = noisy
 
     def configure_optimizers(self):
@@ -186,47 +255,37 @@ class ColaNetLit(pl.LightningModule):
 
     def training_step(self, batch, batch_idx):
 
-        # -- sample noise from simulator --
-        self.sample_noisy(batch)
+        # -- sample noise from simulator; a new draw each micro-batch --
+        step = counter_seed(self.current_epoch,batch_idx,self.global_rank)
+        self.sample_noisy(batch,step)
 
-        # -- each sample in batch --
-        loss = 0 # init @ zero
+        # -- crops of one size run as one batch --
         nbatch = len(batch['noisy'])
-        denos,cleans = [],[]
-        for i in range(nbatch):
-            deno_i,clean_i,loss_i = self.training_step_i(batch, i)
-            loss += loss_i
-            denos.append(deno_i)
-            cleans.append(clean_i)
-        loss = loss / nbatch
-
-        # -- append --
-        denos = th.stack(denos)
-        cleans = th.stack(cleans)
-
-        # -- log --
-        self.log("train_loss", loss.item(), on_step=True,
-                 on_epoch=False,batch_size=self.batch_size)
+        same_size = th.is_tensor(batch['noisy']) and equal_regions(batch['region'])
+        if same_size and self.ca_fwd in ["stnls_k","stnls"]:
+            noisy,cleans = self.get_crops_batch(batch)
+            denos = self.forward_batch(noisy)
+            loss = th.mean((cleans - denos)**2)
+            psnrs = compute_psnrs(denos.detach(),cleans,div=1.)
+        else:
+            outs = [self.training_step_i(batch,i) for i in range(nbatch)]
+            loss = sum([out[2] for out in outs])/nbatch
+            psnrs = [compute_psnrs(deno[None],clean[None],div=1.)
+                     for deno,clean,_ in outs]
 
-        # -- terminal log --
-        val_psnr = np.mean(compute_psnrs(denos,cleans,div=1.)).item()
-        self.gen_loger.info("train_psnr: %2.2f" % val_psnr)
-        # print("train_psnr: %2.2f" % val_psnr)
+        # -- log; reduced across processes once per epoch --
         self.log("train_loss", loss.item(), on_step=True,
                  on_epoch=False, batch_size=self.batch_size)
+        psnr = np.mean(psnrs).item()
+        self.accumulate_metrics("train",loss=loss.item(),psnr=psnr)
+        self.gen_loger.info("train_psnr: %2.2f" % psnr)
 
         return loss
 
     def training_step_i(self, batch, i):
 
-        # -- unpack batch
-        noisy = batch['noisy'][i]/255.
-        clean = batch['clean'][i]/255.
-        region = batch['region'][i]
-
         # -- get data --
-        noisy = rslice(noisy,region)
-        clean = rslice(clean,region)
+        noisy,clean = self.get_crops(batch,i)
 
         # -- foward --
         deno = self.forward(noisy)
@@ -235,6 +294,26 @@ class ColaNetLit(pl.LightningModule):
         loss = th.mean((clean - deno)**2)
         return deno.detach(),clean,loss
 
+    def get_crops(self, batch, i):
+        noisy = batch['noisy'][i]/255.
+        clean = batch['clean'][i]/255.
+        region = batch['region'][i]
+        return rslice(noisy,region),rslice(clean,region)
+
+    def get_crops_batch(self, batch):
+        regions = batch['region']
+        noisy = rslice_videos(batch['noisy']/255.,regions)
+        clean = rslice_videos(batch['clean']/255.,regions)
+        return noisy,clean
+
+    def forward_batch(self, vids):
+        flows = [flow.orun(vid,self.flow,ftype=self.flow_method) for vid in vids]
+        flows = edict({k:th.cat([f[k] for f in flows]) for k in ["fflow","bflow"]})
+        if isinstance(vids,(list,tuple)): vids = th.stack(vids)
+        deno = self.net(vids,flows=flows)
+        deno = th.clamp(deno,0.,1.)
+        return deno
+
     def validation_step(self, batch, batch_idx):
 
         # -- sample noise from simulator --
@@ -247,26 +326,51 @@ class ColaNetLit(pl.LightningModule):
         clean = rslice(clean,region)
 
         # -- forward --
-        gpu_mem.print_peak_gpu_stats(False,"val",reset=True)
+        peak_mem("val")
         with th.no_grad():
             deno = self.forward(noisy)
-        mem_res,mem_alloc = gpu_mem.print_peak_gpu_stats(False,"val",reset=True)
+        mem_res,mem_alloc = peak_mem("val")
 
         # -- loss --
         loss = th.mean((clean - deno)**2)
+        val_psnr = np.mean(compute_psnrs(deno,clean,div=1.)).item()
 
-        # -- report --
-        self.log("val_loss", loss.item(), on_step=False,
-                 on_epoch=True,batch_size=1,sync_dist=True)
-        self.log("val_mem_res", mem_res, on_step=False,
-                 on_epoch=True,batch_size=1,sync_dist=True)
-        self.log("val_mem_alloc", mem_alloc, on_step=False,
-                 on_epoch=True,batch_size=1,sync_dist=True)
+        # -- report; reduced across processes once per epoch --
+        self.accumulate_metrics("val",loss=loss.item(),psnr=val_psnr,
+                                mem_res=mem_res,mem_alloc=mem_alloc)
 
         # -- terminal log --
-        val_psnr = np.mean(compute_psnrs(deno,clean,div=1.)).item()
         self.gen_loger.info("val_psnr: %2.2f" % val_psnr)
 
+    def accumulate_metrics(self, stage, **metrics):
+        sums = self.epoch_sums.setdefault(stage,{})
+        for key,val in metrics.items():
+            if not(key in METRIC_KEYS[stage]):
+                raise ValueError(f"Uknown {stage} metric [{key}]")
+            total,count = sums.get(key,(0.,0))
+            sums[key] = (total + float(val),count + 1)
+
+    def reduce_metrics(self, stage):
+        """
+
+        Means of the metrics of "stage" over the epoch and all processes;
+        one all_reduce over the fixed "METRIC_KEYS", also on a process
+        with no metrics this epoch.
+
+        """
+        sums = self.epoch_sums.pop(stage,{})
+        return reduce_means(sums,METRIC_KEYS[stage],self.device)
+
+    def on_train_epoch_end(self):
+        for key,val in self.reduce_metrics("train").items():
+            self.log("train_%s_epoch" % key, val, on_step=False, on_epoch=True)
+
+    def on_validation_epoch_end(self):
+        for key,val in self.reduce_metrics("val").items():
+            self.log("val_%s" % key, val, on_step=False, on_epoch=True)
+        if hasattr(self.net,"release_workspace"):
+            self.net.release_workspace() # drop the validation-sized buffers
+
     def test_step(self, batch, batch_nb):
 
         # -- sample noise from simulator --
@@ -279,10 +383,10 @@ class ColaNetLit(pl.LightningModule):
         clean = rslice(clean,region)
 
         # -- forward --
-        gpu_mem.print_peak_gpu_stats(False,"test",reset=True)
+        peak_mem("test")
         with th.no_grad():
             deno = self.forward(noisy)
-        mem_res,mem_alloc = gpu_mem.print_peak_gpu_stats(False,"test",reset=True)
+        mem_res,mem_alloc = peak_mem("test")
 
         # -- compare --
         loss = th.mean((clean - deno)**2)
@@ -4,7 +4,7 @@ Functions for internal domain adaptation.
 """
 
 # -- misc --
-import sys,math,gc
+import sys,math
 from ..misc import default_options,crop_offset
 from ..misc import default_options as get_default_config
 
@@ -12,7 +12,8 @@ from ..misc import default_options as get_default_config
 import torch.utils.data as data
 from colanet.utils.adapt_data import ImagePairDataSet
 from colanet.utils.adapt_rpd import RegionProposalData
-from colanet.utils.misc import assert_nonan
+from colanet.utils.misc import assert_nonan,rslice_batch,rslice_flows_batch
+from colanet.utils.noise import NoiseModel
 
 # -- linalg --
 import torch as th
@@ -39,7 +40,7 @@ def run_internal_adapt(self,_noisy,sigma,srch_img=None,flows=None,ws=29,wt=0,
                        batch_size = -1, nsteps=100, nepochs=5, noise_sim = None,
                        sample_mtype="default", region_template = "2_96_96",
                        sobel_nlevels = 3, clean_gt=None, region_gt=None,
-                       ensemble=False, verbose=False):
+                       ensemble=False, verbose=False, nregions=1, eval_every=10):
     if verbose: print("Running Internal Adaptation.")
     # noisy = (_noisy/255. - 0.5)/0.5
     div = 1.
@@ -70,14 +71,16 @@ def run_internal_adapt(self,_noisy,sigma,srch_img=None,flows=None,ws=29,wt=0,
                            region_template=region_template,
                            noisy_gt=noisy,clean_gt=_clean_gt,
                            region_gt=region_gt,
-                           ensemble=ensemble,verbose=verbose)
+                           ensemble=ensemble,verbose=verbose,
+                           nregions=nregions,eval_every=eval_every)
         return psnrs
 
 @register_method
 def run_external_adapt(self,_clean,sigma,srch_img=None,flows=None,ws=29,wt=0,
                        batch_size = -1, nsteps=100, nepochs=5, noise_sim=None,
                        sample_mtype="default", region_template = "2_96_96",
-                       noisy_gt=None,sobel_nlevels = 3, ensemble=False, verbose=False):
+                       noisy_gt=None,sobel_nlevels = 3, ensemble=False, verbose=False,
+                       nregions=1, eval_every=10):
 
     if verbose: print("Running External Adaptation.")
     # -- setup --
@@ -105,7 +108,8 @@ def run_external_adapt(self,_clean,sigma,srch_img=None,flows=None,ws=29,wt=0,
                    sobel_nlevels = sobel_nlevels,
                    region_template=region_template,
                    noisy_gt=noisy_gt,clean_gt=clean,
-                   ensemble=ensemble,verbose=verbose)
+                   ensemble=ensemble,verbose=verbose,
+                   nregions=nregions,eval_every=eval_every)
 
 def rslice(vid,coords):
     if coords is None: return vid
@@ -124,7 +128,21 @@ def adapt_step(nl_denoiser, clean, srch_img, flows, opt,
                noise_sim = None, sobel_nlevels = 3,
                sample_mtype="default", region_template = "2_64_64",
                noisy_gt=None,clean_gt=None,region_gt=None,
-               ensemble=False, verbose=False):
+               ensemble=False, verbose=False, nregions=1, eval_every=10):
+    """
+
+    Fine-tune the denoiser on regions sampled from "clean".
+
+    Noise is sampled only inside each region and each step draws
+    "nregions" equal-sized regions as a batch (N,T,C,H,W), denoised in
+    one forward with the cropped flows (N,T,2,H,W). The search runs per
+    batch element, so it never matches across regions, and the loss is
+    taken over the batch.
+    The loss is only read back from the device every "eval_every" steps,
+    which is also when the (full clip) psnr of "noisy_gt" is logged;
+    eval_every <= 0 skips the intermediate logging.
+
+    """
 
     # -- psnrs --
     psnrs = []
@@ -141,93 +159,72 @@ def adapt_step(nl_denoiser, clean, srch_img, flows, opt,
     # -- get data --
     loader = get_adapt_dataset(clean,sample_mtype,region_template,sobel_nlevels)
 
-    # -- train --
-    noisy = add_noise_to_image(clean, noise_sim, opt.sigma)
-
     # -- epoch --
     for epoch in range(nepochs):
 
         # -- info --
         if verbose:
             print('Training epoch {} of {}'.format(epoch + 1, nepochs))
+            sys.stdout.flush()
 
-        # -- garbage collect --
-        sys.stdout.flush()
-        gc.collect()
-        th.cuda.empty_cache()
-
-        # -- loaders --
-        device = next(nl_denoiser.parameters()).device
-        iloader = enumerate(loader)
-        nsamples = min(len(loader),nsteps)
-        for i, region in iloader:
-
-            # -- tenors on device --
-            noisy_i = add_noise_to_image(clean,noise_sim,opt.sigma)
-            noisy_r = rslice(noisy_i,region)
-
-            # -- forward pass --
-            optim.zero_grad()
-            image_dn = nl_denoiser(noisy_r,ensemble=ensemble,flows=flows)
-            # image_dn = nl_denoiser(noisy_i,opt.sigma,srch_img=None,flows=flows,
-            #                        ws=ws,wt=wt,train=True,rescale=False,
-            #                        batch_size=batch_size,region=region)
-
-            # -- post-process images --
-            image_dn = image_dn.clamp(0,1)
-            clean_r = rslice(clean,region)
+        losses = []
+        for i in range(nsteps):
+
+            # -- noisy regions; only sample noise inside them --
+            regions = loader.sample(nregions)
+            clean_r = rslice_batch(clean,regions)
+            flows_r = rslice_flows_batch(flows,regions)
+            step = epoch*nsteps + i
+            noisy_r = add_noise_to_image(clean_r,noise_sim,opt.sigma,
+                                         regions,step)
+
+            # -- forward pass; the regions are one batch --
+            optim.zero_grad(set_to_none=True)
+            image_dn = nl_denoiser(noisy_r,ensemble=ensemble,flows=flows_r)
 
             # -- compute loss --
+            image_dn = image_dn.clamp(0,1)
             loss = th.log10(criterion(image_dn, clean_r))
-            assert not np.isnan(loss.item())
 
             # -- update step --
             loss.backward()
             optim.step()
+            losses.append(loss.detach())
 
-            # -- memory dump --
-            gc.collect()
-            th.cuda.empty_cache()
-
-            # -- logging --
-            if (i % 10 == 0) or (nsteps == i):
+            # -- logging at a cadence; the only device syncs in the loop --
+            log_bool = (eval_every > 0) and (i % eval_every == 0)
+            if log_bool or (i == nsteps-1):
+                losses = th.stack(losses)
+                assert not th.any(th.isnan(losses)).item()
+                if verbose:
+                    psnr_i = -10*losses[-1].item()
+                    print("Processing [%d/%d]: %2.2f" % (i,nsteps,psnr_i))
+                losses = []
+            if log_bool:
                 with th.no_grad():
-                    batch_size_te = 390*100
                     if not(noisy_gt is None):
                         deno_gt =nl_denoiser(noisy_gt,ensemble=ensemble,flows=flows)
-                        # deno_gt =nl_denoiser(noisy_gt,opt.sigma,srch_img=None,flows=flows,
-                        #                       ws=ws,wt=wt,train=False,rescale=False,
-                        #                       batch_size=batch_size_te,region=region_gt)
                         clean_gt_r = rslice(clean_gt,region_gt)
                         psnr_gt = compute_psnr(deno_gt,clean_gt_r)
                     else: psnr_gt = np.zeros(clean.shape[0])
                     psnrs.append(psnr_gt)
 
-            # -- message --
+        # -- message --
+        epoch_bool = (epoch + 1) % opt.epochs_between_check == 0
+        if epoch_bool:
+            with th.no_grad():
+                noisy = add_noise_to_image(clean, noise_sim, opt.sigma,
+                                           step=epoch)
+                deno = nl_denoiser(noisy,ensemble=ensemble,flows=flows)
+            deno = deno.detach().clamp(0., 1.)
+            mse = criterion(deno,clean).item()
+            train_psnr = -10 * math.log10(mse)
+            psnrs.append(train_psnr)
             if verbose:
-                print("Processing [%d/%d]: %2.2f" % (i,nsamples,-10*loss.item()))
-            batch_bool = i == nsteps
-            epoch_bool = (epoch + 1) % opt.epochs_between_check == 0
-            print_bool = batch_bool and epoch_bool
-            if print_bool:
-                gc.collect()
-                th.cuda.empty_cache()
-                batch_size_te = 390*100
-                with th.no_grad():
-                    deno = nl_denoiser(noisy,ensemble=ensemble,flows=flows)
-                    # deno = nl_denoiser(noisy,opt.sigma,srch_img.clone(),flows,
-                    #                    rescale=False,ws=ws,wt=wt,
-                    #                    batch_size=batch_size_te)
-                deno = deno.detach().clamp(0., 1.)
-                mse = criterion(deno,clean).item()
-                train_psnr = -10 * math.log10(mse)
-                psnrs.append(train_psnr)
-                if verbose:
-                    a,b,c = epoch + 1, nepochs, train_psnr
-                    msg = 'Epoch {} of {} done, training PSNR = {:.2f}'.format(a,b,c)
-                    print(msg)
-                    sys.stdout.flush()
-            if i > nsteps: break
+                a,b,c = epoch + 1, nepochs, train_psnr
+                msg = 'Epoch {} of {} done, training PSNR = {:.2f}'.format(a,b,c)
+                print(msg)
+                sys.stdout.flush()
 
     return psnrs
 
@@ -248,9 +245,13 @@ def get_adapt_dataset(clean,mtype,region_template,nlevels=3):
     rpn = RegionProposalData(clean,mtype,region_template,nlevels)
     return rpn
 
-def add_noise_to_image(clean, noise_sim, sigma):
+def add_noise_to_image(clean, noise_sim, sigma, region=None, step=0):
+    """
+    Gaussian noise from the seeded "NoiseModel" (see utils/noise.py)
+    unless a "noise_sim" is given; "region" is the crop of each sample.
+    """
     if noise_sim is None:
-        noisy = clean + sigma_255_to_torch(sigma) * th.randn_like(clean)
+        noisy = NoiseModel("g",sigma)(clean,region=region,step=step)
     else:
         with th.no_grad():
             noisy = noise_sim(clean)
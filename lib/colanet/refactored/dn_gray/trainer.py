@@ -6,6 +6,7 @@ import torch
 from torch.autograd import Variable
 from tqdm import tqdm
 from utils import batch_PSNR
+from colanet.utils.noise import NoiseModel
 
 class Trainer():
     def __init__(self, args, loader, my_model, my_loss, ckp):
@@ -27,6 +28,14 @@ class Trainer():
             for _ in range(len(ckp.log)): self.scheduler.step()
 
         self.error_last = 1e8
+        self.noise_model = NoiseModel("g",sigma=args.noiseL,
+                                      seed=args.seed)
+
+    def add_noise(self, hr, video, step):
+        # -- one seeded draw per patch; patch b is sample "video + b" --
+        videos = [video + b for b in range(hr.size(0))]
+        noisy = self.noise_model(hr[:,None],video=videos,step=step)
+        return noisy[:,0]
 
     def train(self):
         self.scheduler.step()
@@ -39,6 +48,8 @@ class Trainer():
         )
         # self.loss.start_log() # edit for new
         self.model.train()
+        if hasattr(self.loader_train, 'set_epoch'):
+            self.loader_train.set_epoch(epoch)
 
         timer_data, timer_model = utility.timer(), utility.timer()
         for batch, (lr, hr, _) in enumerate(self.loader_train):
@@ -48,8 +59,7 @@ class Trainer():
             timer_model.tic()
 
             self.optimizer.zero_grad()
-            noise = torch.FloatTensor(hr.size()).normal_(mean=0, std=self.args.noiseL / 255.).cuda()
-            lr = hr + noise
+            lr = self.add_noise(hr,batch*self.args.batch_size,epoch)
             sr = self.model(lr, 1)#self.args.scale)
             loss = self.loss(sr, hr)/(hr.size()[0]*2)
             # print(loss,(hr.size()[0]*2))
@@ -95,8 +105,7 @@ class Trainer():
                     lr = self.prepare([lr], volatile=True)[0]
                 else:
                     lr, hr = self.prepare([lr, hr], volatile=True)
-                noise = torch.FloatTensor(hr.size()).normal_(mean=0,std=self.args.noiseL/255.).cuda()
-                lr = hr+noise
+                lr = self.add_noise(hr,idx_img,0) # a fixed draw per image
            
                 sr = self.model(lr, idx_scale)
                 sr = utility.quantize(sr, self.args.rgb_range)
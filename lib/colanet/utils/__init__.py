@@ -12,6 +12,12 @@ from . import proc_utils
 from . import config_blocks
 from . import aug_test
 from . import model_io
+from . import parallel
+from . import pipeline
+from . import noise
+from . import frozen_config
+from . import workspace
+from . import ms_loader
 from .misc import optional,fwd_4dim
 from .timer import ExpTimer,ExpTimerList,AggTimer,TimeIt
 from .select_sigma import select_sigma
@@ -1,71 +1,178 @@
 # -- rand nums --
 import random
 
+# -- patch store --
+import os
+import tempfile
+
 # -- linalg --
 import torch as th
 import numpy as np
 
 # -- image pair dataset --
-import random
 from PIL import Image
 import torch.utils.data as data
-import torchvision.transforms as transforms
-import torchvision.transforms.functional as TF
 
-class ImagePairDataSet(data.Dataset):
+class PatchStore(data.Dataset):
+    """
+
+    Overlapping blocks of an image pair, read from a memmap.
 
-    def __init__(self, block_w, images_a=None, images_b=None, transform=None, stride=1):
-        self.transform = transform
-        self.images_a = images_a
-        self.images_b = images_b
-        self.im_n, _, self.im_h, self.im_w = self.images_a.shape
-        self.stride = stride
+    The clean images ("images_a", on [0,imax]) are written once as uint8 and
+    the noisy/search images ("images_b") as float16 to one file that every
+    worker maps, so no process holds its own copy of the arrays. The noisy
+    channel is not clipped or quantized to 8 bits since noise goes outside
+    [0,imax]. The block offsets are precomputed into a (len,3) index of
+    (im,top,left). Samples are returned as (uint8,float16); use
+    "PatchCollate" to stack, augment (flips/transpose as batched ops)
+    and convert to float.
+
+    """
+
+    def __init__(self, block_w, images_a, images_b, stride=1,
+                 imax=1., path=None):
+        images_a = to_uint8(images_a,imax)
+        images_b = to_float16(images_b)
+        if images_a.ndim < 4:
+            images_a = images_a[:,None]
+            images_b = images_b[:,None]
+        assert images_a.shape == images_b.shape
+        self.shape = images_a.shape
         self.block_w = block_w
-        self.blocks_in_image_h = (self.im_h - self.block_w) // stride + 1
-        self.blocks_in_image_w = (self.im_w - self.block_w) // stride + 1
-        self.len = self.im_n * self.blocks_in_image_h * self.blocks_in_image_w
-        self.ishift = ShiftImageValues()
+        self.stride = stride
+        self.imax = imax
+
+        # -- write the memmap; the float16 images follow the uint8 ones --
+        self.owner = path is None
+        if path is None:
+            fd,path = tempfile.mkstemp(suffix=".patches")
+            os.close(fd)
+        self.path = path
+        self.offset_b = images_a.size + images_a.size % 2
+        store_b = np.memmap(path,dtype=np.float16,mode="w+",
+                            shape=self.shape,offset=self.offset_b)
+        store_a = np.memmap(path,dtype=np.uint8,mode="r+",shape=self.shape)
+        store_a[...],store_b[...] = images_a,images_b
+        store_a.flush(),store_b.flush()
+        del store_a,store_b
+        self._store = None
+
+        # -- block offsets --
+        self.offsets = block_offsets(self.shape,block_w,stride)
+
+    @property
+    def store(self):
+        if self._store is None:
+            store_a = np.memmap(self.path,dtype=np.uint8,
+                                mode="r",shape=self.shape)
+            store_b = np.memmap(self.path,dtype=np.float16,mode="r",
+                                shape=self.shape,offset=self.offset_b)
+            self._store = (store_a,store_b)
+        return self._store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_store"] = None
+        state["owner"] = False
+        return state
+
+    def __getitem__(self, item):
+        im,top,left = self.offsets[item]
+        bw = self.block_w
+        samples = [th.from_numpy(np.ascontiguousarray(s[im,:,top:top+bw,left:left+bw]))
+                   for s in self.store]
+        return samples[0],samples[1]
 
-        if len(self.images_a.shape) < 4:
-            self.images_a = np.expand_dims(self.images_a, axis=3)
-            self.images_b = np.expand_dims(self.images_b, axis=3)
+    def __len__(self):
+        return len(self.offsets)
+
+    def close(self):
+        self._store = None
+        if self.owner and os.path.exists(self.path):
+            os.remove(self.path)
+        self.owner = False
 
-    def augment(self,img_a,img_b):
+    def __del__(self):
+        self.close()
 
-        # Random horizontal flipping
-        if random.random() > 0.5:
-            img_a = TF.hflip(img_a)
-            img_b = TF.hflip(img_b)
+class ImagePairDataSet(PatchStore):
+    """
 
-        # Random vertical flipping
-        if random.random() > 0.5:
-            img_a = TF.vflip(img_a)
-            img_b = TF.vflip(img_b)
+    The blocks of a (clean,noisy) image pair for adaptation, held in a
+    "PatchStore"; batch with "collate_fn" to augment and get floats.
 
-        # Random transpose
-        if random.random() > 0.5:
-            img_a = img_a.transpose(-1,-2)
-            img_b = img_b.transpose(-1,-2)
+        dset = ImagePairDataSet(block_w,images_a=clean,images_b=noisy)
+        loader = data.DataLoader(dset,batch_size=8,shuffle=True,
+                                 collate_fn=dset.collate_fn)
 
-        # Transform to tensor
-        # img_a = self.ishift(img_a)
-        # img_b = self.ishift(img_b)
+    """
 
-        return img_a,img_b
+    def __init__(self, block_w, images_a=None, images_b=None, transform=None,
+                 stride=1, imax=1., augment=True, path=None):
+        super().__init__(block_w,images_a,images_b,stride,imax,path)
+        self.transform = transform
+        self.im_n, _, self.im_h, self.im_w = self.shape
+        self.len = len(self.offsets)
+        self.collate_fn = PatchCollate(imax,augment)
+
+def to_uint8(images,imax=1.):
+    if th.is_tensor(images):
+        images = images.detach().cpu().numpy()
+    if images.dtype == np.uint8:
+        return images
+    images = np.clip(np.round(images * (255./imax)),0,255)
+    return images.astype(np.uint8)
+
+def to_float16(images):
+    if th.is_tensor(images):
+        images = images.detach().cpu().numpy()
+    return images.astype(np.float16)
+
+def block_offsets(shape,block_w,stride=1):
+    """
+    The (im,top,left) of each block as a (len,3) int32 array.
+    """
+    im_n,_,im_h,im_w = shape
+    nh = (im_h - block_w) // stride + 1
+    nw = (im_w - block_w) // stride + 1
+    im,row,col = np.meshgrid(np.arange(im_n),np.arange(nh)*stride,
+                             np.arange(nw)*stride,indexing="ij")
+    offsets = np.stack([im.ravel(),row.ravel(),col.ravel()],-1)
+    return offsets.astype(np.int32)
+
+def augment_batch(batch_a, batch_b, generator=None):
+    """
 
+    Random hflip, vflip and transpose of each (B,C,h,w) pair,
+    drawn per sample and applied to the whole batch at once.
 
-    def __getitem__(self, item):
-        im, row, col = np.unravel_index(item, (self.im_n, self.blocks_in_image_h,
-                                               self.blocks_in_image_w))
-        row *= self.stride
-        col *= self.stride
-        sample_a = self.images_a[im, :,row:row + self.block_w, col:col + self.block_w]
-        sample_b = self.images_b[im, :,row:row + self.block_w, col:col + self.block_w]
-        sample_a,sample_b = self.augment(sample_a,sample_b)
-        return sample_a,sample_b
+    """
+    B = batch_a.shape[0]
+    flips = th.rand((3,B),generator=generator) > 0.5
+    flips = flips.to(batch_a.device)[...,None,None,None]
+    def apply(batch):
+        batch = th.where(flips[0],batch.flip(-1),batch)
+        batch = th.where(flips[1],batch.flip(-2),batch)
+        batch = th.where(flips[2],batch.transpose(-1,-2),batch)
+        return batch
+    return apply(batch_a),apply(batch_b)
+
+class PatchCollate(object):
+    """Stack (uint8,float16) patch pairs, augment them, and convert the
+    uint8 ones to [0,imax].
+    """
 
-    def __len__(self):
-        return self.len
+    def __init__(self, imax=1., augment=True):
+        self.imax = imax
+        self.augment = augment
+
+    def __call__(self, samples):
+        batch_a = th.stack([s[0] for s in samples])
+        batch_b = th.stack([s[1] for s in samples])
+        if self.augment:
+            batch_a,batch_b = augment_batch(batch_a,batch_b)
+        scale = self.imax / 255.
+        return batch_a.float() * scale, batch_b.float()
 
 class RandomTranspose(object):
     """Applies transpose the given PIL Image randomly with a given probability.
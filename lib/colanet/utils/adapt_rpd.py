@@ -68,14 +68,26 @@ def rslice(vid,region):
     t0,t1,h0,w0,h1,w1 = region
     return region[t0:t1,:,h0:h1,w0:w1]
 
+def points2ranges(points,reg,lb,ub):
+    """
+    Vectorized "point2range" for a tensor of points.
+    """
+    pmin = th.clamp(points-((reg-1)//2+1),min=0)
+    pmax = th.clamp(pmin + reg,max=ub)
+    pmin = pmax - reg # shift left if needed
+    info = "%d,%d,%d" % (lb,ub,reg)
+    assert th.all(pmin >= lb).item(),info
+    return pmin,pmax
+
 class RegionProposalData():
 
-    def __init__(self, clean, mtype, region_template, nlevels=3):
+    def __init__(self, clean, mtype, region_template, nlevels=3, nbuffer=128):
 
         # -- init --
         self.clean = clean
         self.mtype = mtype
         self.nlevels = nlevels
+        self.nbuffer = nbuffer
 
         # -- init shape --
         self.nframes = clean.shape[0]
@@ -88,114 +100,98 @@ class RegionProposalData():
         self.reg_height = int(rtemp[1])
         self.reg_width = int(rtemp[2])
 
+        # -- sobel pyramid & its cdf are built on first use --
+        self._sobels = None
+        self._cdf = None
+        self._buffer = []
+
+    @property
+    def sobels(self):
+        if self._sobels is None:
+            self._sobels = self.compute_sobels()
+        return self._sobels
+
+    def compute_sobels(self):
         # -- sample region via multi-scale sobels --
-        self.sobels = []
+        sobels = []
         for level in range(self.nlevels):
             if level > 0:
-                h,w = self.sobels[-1].shape[-2:]
+                h,w = sobels[-1].shape[-2:]
                 rh,rw = int(0.5*h),int(0.5*w)
-                img = tf.resize(clean,(rh,rw))
-            else: img = clean
+                img = tf.resize(self.clean,(rh,rw))
+            else: img = self.clean
             sobel = apply_sobel_filter(img)
-            self.sobels.append(sobel)
+            sobels.append(sobel)
+        return sobels
+
+    @property
+    def cdf(self):
+        if self._cdf is None:
+            sobel_vid = th.mean(self.sobels[-1],1)
+            self._cdf = th.cumsum(sobel_vid.ravel().double(),0)
+        return self._cdf
+
+    def sample(self,nsamples=1):
+        """
+
+        Draw "nsamples" regions at once.
+        Returns an int64 tensor of shape (nsamples,6) with rows
+        [fstart,fend,top,left,btm,right].
 
-    def sample_point(self):
+        """
+        # -- get points in image --
+        points = self.sample_points(nsamples)
+
+        # -- center regions --
+        fstart,fend = points2ranges(points[:,0],self.reg_nframes,0,self.nframes)
+        top,btm = points2ranges(points[:,1],self.reg_height,0,self.height)
+        left,right = points2ranges(points[:,2],self.reg_width,0,self.width)
+
+        # -- create regions --
+        regions = th.stack([fstart,fend,top,left,btm,right],1)
+        return regions
+
+    def sample_points(self,nsamples):
         if self.mtype == "rand" or self.mtype == "default":
-            return self.sample_random_point()
+            return self.sample_random_points(nsamples)
         elif self.mtype == "sobel":
-            return self.sample_sobel_point()
+            return self.sample_sobel_points(nsamples)
         else:
             raise NotImplementedError(f"Uknown sample method [{self.mtype}]")
 
-    def sample_random_point(self):
-        t,c,h,w = self.clean.shape
-
-        # -- sample t --
-        ones = th.ones(t)
-        rt = int(th.multinomial(ones,1).item())
-
-        # -- sample h --
-        ones = th.ones(h)
-        rh = int(th.multinomial(ones,1).item())
-        rh = int(th.multinomial(ones,1).item())
+    def sample_random_points(self,nsamples):
+        t,h,w = self.nframes,self.height,self.width
+        rt = th.randint(0,t,(nsamples,))
+        rh = th.randint(0,h,(nsamples,))
+        rw = th.randint(0,w,(nsamples,))
+        return th.stack([rt,rh,rw],1)
 
-        # -- sample w --
-        ones = th.ones(w)
-        rw = int(th.multinomial(ones,1).item())
+    def sample_sobel_points(self,nsamples):
 
-        # -- agg point --
-        point = [rt,rh,rw]
-        return point
-
-    def sample_sobel_point(self):
-        sobel_vid = self.sobels[-1]
-        t,c,h,w = sobel_vid.shape
-        sobel_vid = th.mean(sobel_vid,1)
-        hw = h * w
-        ind = int(th.multinomial(sobel_vid.ravel(),1).item())
-        ti = ind // hw
-        hi = (ind%hw)//h
-        wi = (ind%hw)%w
-        point = [ti,hi,wi]
-        return point
-
-    def sample_rand_point(self):
-        # print("self.sobel.shape: ",self.sobels[-1].shape)
+        # -- inverse cdf on the coarsest level --
+        cdf = self.cdf
         t,c,h,w = self.sobels[-1].shape
-        size = th.Tensor([t*h*w])
+        rands = th.rand(nsamples,dtype=cdf.dtype,device=cdf.device) * cdf[-1]
+        inds = th.searchsorted(cdf,rands).clamp(max=len(cdf)-1).cpu()
+
+        # -- unravel --
         hw = h * w
-        ind = int(th.multinomial(size,1).item())
-        ti = ind // hw
-        hi = (ind%hw)//h
-        wi = (ind%hw)%w
-        point = [ti,hi,wi]
-        return point
-        # t0,t1 = 0,t
-        # h0,h1,w0,w1 = 0,h,0,w
-        # region = [t0,t1,h0,w0,h1,w1]
-        # for level in reversed(range(len(self.sobels))):
-
-        #     # -- get region to sample --
-        #     sobel = self.sobels[level]
-        #     sobel = rslice(sobel,region)
-
-        #     # -- sample a point --
-        #     fsobel = sobel.ravel()
-        #     ind = th.multinomial(fsobel,1).item()
-
-        #     # -- convert to absolute point value --
-        #     t0,t1,h0,w0,h1,w1 = region
-        #     t,c,h,w = sobel[level].shape
-        #     hw = h*w
-        #     ti = ind//hw + t0
-        #     hi = (ind%hw)//h + h0
-        #     wi = (ind%hw)%w + w0
-
-        #     # --
-
-        #     print(ti,hi,wi)
+        ti = inds // hw
+        hi = (inds % hw) // w
+        wi = (inds % hw) % w
+
+        # -- coarse to full resolution --
+        hi = (hi * self.height) // h
+        wi = (wi * self.width) // w
+        return th.stack([ti,hi,wi],1)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        # -- get point in image --
-        point = self.sample_point()
-        print(point,self.reg_nframes,self.reg_height,self.reg_width,0,
-              self.height,self.width,self.nframes)
-
-        # -- center region --
-        fstart,fend = point2range(point[0],self.reg_nframes,0,self.nframes)
-        top,btm = point2range(point[1],self.reg_height,0,self.height)
-        left,right = point2range(point[2],self.reg_width,0,self.width)
-
-        # -- create region --
-        region = [fstart,fend,top,left,btm,right]
-
-        return region
+        if len(self._buffer) == 0:
+            self._buffer = self.sample(self.nbuffer).tolist()
+        return self._buffer.pop()
 
     def __len__(self):
         return 10**5#self.len
-
-
-
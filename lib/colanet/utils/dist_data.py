@@ -0,0 +1,101 @@
+"""
+
+A distributed sampler over the region crops of a video dataset.
+
+Each video is visited "crops_per_video" times an epoch (the dataset picks
+a new random region on each visit) and the visits are shuffled with a
+generator seeded by (seed + epoch), so every process draws the same
+order and takes a disjoint, equal-sized shard of it:
+
+    sampler = RegionSampler(data.tr,crops_per_video=4,seed=cfg.seed)
+    loader = DataLoader(data.tr,batch_size=bs,sampler=sampler)
+    ...
+    sampler.set_epoch(epoch) # lightning calls this each epoch
+
+The rank and world size default to those of the process group when the
+sampler is first iterated (e.g. after the trainer launched its processes),
+or 0 and 1 without one. Shards are padded by wrapping around so each
+process runs the same number of steps.
+
+"reduce_means" averages metrics over all processes with one all_reduce
+of a fixed-shape tensor, so every process must call it with the same keys
+even if it has no values for some of them.
+
+"""
+
+import math
+import torch as th
+import torch.distributed as dist
+
+def dist_info():
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(),dist.get_world_size()
+    return 0,1
+
+class RegionSampler(th.utils.data.Sampler):
+
+    def __init__(self, dataset, crops_per_video=1, shuffle=True, seed=0,
+                 rank=None, num_replicas=None, drop_last=False):
+        self.nvids = len(dataset)
+        self.crops_per_video = crops_per_video
+        self.shuffle = shuffle
+        self.seed = seed
+        self.rank = rank
+        self.num_replicas = num_replicas
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def shard_info(self):
+        rank,world = dist_info()
+        rank = rank if self.rank is None else self.rank
+        world = world if self.num_replicas is None else self.num_replicas
+        if not(0 <= rank < world):
+            raise ValueError(f"Invalid rank [{rank}] for world size [{world}]")
+        return rank,world
+
+    def __len__(self):
+        _,world = self.shard_info()
+        ntotal = self.nvids * self.crops_per_video
+        if self.drop_last: return ntotal // world
+        return math.ceil(ntotal / world)
+
+    def __iter__(self):
+        rank,world = self.shard_info()
+        ntotal = self.nvids * self.crops_per_video
+        if self.shuffle:
+            gen = th.Generator()
+            gen.manual_seed(self.seed + self.epoch)
+            order = th.randperm(ntotal,generator=gen)
+        else:
+            order = th.arange(ntotal)
+        order = order % self.nvids # visit -> video index
+
+        # -- equal shards; pad by wrapping or drop the tail --
+        nper = len(self)
+        if self.drop_last:
+            order = order[:nper*world]
+        elif nper*world > ntotal:
+            npad = nper*world - ntotal
+            order = th.cat([order,order.repeat(math.ceil(npad/ntotal))[:npad]])
+        return iter(order[rank::world].tolist())
+
+def reduce_means(sums, keys, device="cpu"):
+    """
+
+    Means over all processes of the (total,count) pairs in "sums" for
+    a fixed list of "keys"; missing keys count zero. Returns the keys
+    with at least one value on any process.
+
+    """
+    totals = th.zeros((len(keys),2),dtype=th.float64,device=device)
+    for i,key in enumerate(keys):
+        if key in sums:
+            totals[i,0],totals[i,1] = sums[key]
+    if dist.is_available() and dist.is_initialized():
+        dist.all_reduce(totals) # every process; even with no metrics
+    means = totals[:,0] / totals[:,1].clamp(min=1)
+    counts = totals[:,1].tolist()
+    return {k:m for k,m,c in zip(keys,means.tolist(),counts) if c > 0}
@@ -0,0 +1,125 @@
+"""
+
+A frozen, hashable config with a stable content hash.
+
+    cfg = freeze({"ws":21,"k_s":100,"refine_inds":[False,True,True]})
+    cfg.ws, cfg["k_s"], cfg.digest
+
+Nested dicts are frozen recursively and lists become tuples. The digest
+is a sha1 of the canonical (sorted-key) json of the contents, so it is
+the same across processes and runs; use it to key the model, flow and
+result caches. Tensors and arrays enter the json as their dtype, shape
+and a sha1 of their bytes (their str is truncated for large sizes);
+devices, dtypes and paths as tagged strings. Other types raise a
+TypeError rather than hash their repr. "thaw" returns a fresh
+(mutable) edict.
+
+"""
+
+import json
+import hashlib
+from pathlib import PurePath
+import numpy as np
+import torch as th
+from collections.abc import Mapping
+from easydict import EasyDict as edict
+
+class FrozenConfig(Mapping):
+
+    __slots__ = ("_data","_digest","_hash")
+
+    def __init__(self, pydict):
+        data = {key:freeze(val) for key,val in pydict.items()}
+        object.__setattr__(self,"_data",data)
+        object.__setattr__(self,"_digest",None)
+        object.__setattr__(self,"_hash",None)
+
+    def __getattr__(self, name):
+        if name in FrozenConfig.__slots__: # unset slot
+            raise AttributeError(name)
+        try:
+            return self._data[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenConfig is read-only; use thaw(cfg).")
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def digest(self):
+        if self._digest is None:
+            object.__setattr__(self,"_digest",config_digest(self))
+        return self._digest
+
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self,"_hash",int(self.digest[:16],16))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other,FrozenConfig):
+            return self.digest == other.digest
+        return Mapping.__eq__(self,other)
+
+    def __reduce__(self):
+        return (FrozenConfig,(thaw(self),))
+
+    def __repr__(self):
+        return "FrozenConfig(%s)" % repr(self._data)
+
+def freeze(obj):
+    if isinstance(obj,FrozenConfig):
+        return obj
+    elif isinstance(obj,Mapping):
+        return FrozenConfig(obj)
+    elif isinstance(obj,(list,tuple)):
+        return tuple(freeze(val) for val in obj)
+    return obj
+
+def thaw(obj):
+    if isinstance(obj,Mapping):
+        return edict({key:thaw(val) for key,val in obj.items()})
+    elif isinstance(obj,(list,tuple)):
+        return [thaw(val) for val in obj]
+    return obj
+
+def config_digest(cfg):
+    """
+    sha1 of the canonical json of a (frozen or plain) config.
+    """
+    canon = json.dumps(thaw(cfg),sort_keys=True,default=encode_value,
+                       separators=(",",":"))
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()
+
+def encode_value(obj):
+    """
+    The json of values json can't encode itself.
+    """
+    if th.is_tensor(obj):
+        obj = obj.detach().cpu().contiguous()
+        data = obj.reshape(-1).view(th.uint8).numpy().tobytes()
+        return {"__tensor__":[str(obj.dtype),list(obj.shape),sha1(data)]}
+    elif isinstance(obj,np.ndarray):
+        data = np.ascontiguousarray(obj).tobytes()
+        return {"__ndarray__":[obj.dtype.str,list(obj.shape),sha1(data)]}
+    elif isinstance(obj,np.generic):
+        return obj.item()
+    elif isinstance(obj,th.device):
+        return {"__device__":str(obj)}
+    elif isinstance(obj,th.dtype):
+        return {"__dtype__":str(obj)}
+    elif isinstance(obj,PurePath):
+        return {"__path__":obj.as_posix()}
+    raise TypeError("Can't hash a config value of type [%s]" % type(obj).__name__)
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
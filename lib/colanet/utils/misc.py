@@ -1,6 +1,7 @@
 
 import torch as th
 import pickle
+import contextlib
 from easydict import EasyDict as edict
 from einops import rearrange
 
@@ -14,6 +15,20 @@ def fwd_4dim(fxn,vid):
     out = rearrange(out,'(b t) c h w -> b t c h w',b=B)
     return out
 
+# -- inference precisions; "single" runs without autocast --
+PRECISIONS = {"single":None,"fp32":None,"bf16":th.bfloat16,
+              "fp16":th.float16,"half":th.float16}
+
+def autocast(device,precision="single"):
+    if not(precision in PRECISIONS):
+        raise ValueError(f"Uknown precision [{precision}]")
+    dtype = PRECISIONS[precision]
+    if dtype is None: return contextlib.nullcontext()
+    return th.autocast(device_type=th.device(device).type,dtype=dtype)
+
+def fp32_region(device):
+    return th.autocast(device_type=th.device(device).type,enabled=False)
+
 def optional(pydict,key,default):
     if pydict is None: return default
     elif key in pydict: return pydict[key]
@@ -36,6 +51,88 @@ def rslice(vid,coords):
     fs,fe,t,l,b,r = coords
     return vid[fs:fe,:,t:b,l:r]
 
+def region_grid(regions,device):
+    """
+
+    Index grids for a (N,6) tensor of equal-sized regions,
+    rows are (fs,fe,t,l,b,r).
+
+    """
+    regions = th.as_tensor(regions,device=device).long().reshape(-1,6)
+    sizes = regions[:,[1,4,5]] - regions[:,[0,2,3]]
+    assert th.all(sizes == sizes[[0]]).item(),"regions must have equal sizes."
+    nT,nH,nW = [int(v) for v in sizes[0]]
+    ti = regions[:,[0]] + th.arange(nT,device=device)
+    hi = regions[:,[2]] + th.arange(nH,device=device)
+    wi = regions[:,[3]] + th.arange(nW,device=device)
+    return ti[:,:,None,None],hi[:,None,:,None],wi[:,None,None,:]
+
+def rslice_batch(vid,regions):
+    """
+
+    Crop N equal-sized regions with one gather.
+
+    vid: (T,C,H,W)
+    regions: (N,6) rows of (fs,fe,t,l,b,r)
+    returns: (N,T',C,h,w)
+
+    """
+    ti,hi,wi = region_grid(regions,vid.device)
+    crops = vid.permute(0,2,3,1)[ti,hi,wi] # N T' h w C
+    return crops.permute(0,1,4,2,3)
+
+def rslice_videos(vids,regions):
+    """
+
+    Crop region n of video n with one gather.
+
+    vids: (N,T,C,H,W)
+    regions: (N,6) equal-sized rows of (fs,fe,t,l,b,r)
+    returns: (N,T',C,h,w)
+
+    """
+    ti,hi,wi = region_grid(regions,vids.device)
+    ni = th.arange(len(vids),device=vids.device)[:,None,None,None]
+    crops = vids.permute(0,1,3,4,2)[ni,ti,hi,wi] # N T' h w C
+    return crops.permute(0,1,4,2,3)
+
+def equal_regions(regions):
+    regions = th.as_tensor(regions).long().reshape(-1,6)
+    sizes = regions[:,[1,4,5]] - regions[:,[0,2,3]]
+    return th.all(sizes == sizes[[0]]).item()
+
+def rslice_flows_batch(flows,regions):
+    """
+    Crop flows of shape (T,2,H,W) or (1,T,2,H,W) to match "rslice_batch".
+    """
+    if flows is None: return flows
+    flows_r = edict()
+    for key in ["fflow","bflow"]:
+        flow = flows[key]
+        if flow.ndim == 5: flow = flow[0]
+        flows_r[key] = rslice_batch(flow,regions)
+    return flows_r
+
+def rscatter_add(vid,crops,regions,counts=None):
+    """
+
+    Inverse of "rslice_batch"; add the crops back into "vid" in-place.
+    Overlapping regions are summed and "counts" (same shape as "vid")
+    accumulates the number of crops at each pixel for normalizing.
+
+    vid: (T,C,H,W)
+    crops: (N,T',C,h,w)
+
+    """
+    ti,hi,wi = region_grid(regions,vid.device)
+    ti,hi,wi = th.broadcast_tensors(ti,hi,wi)
+    vals = crops.permute(0,1,3,4,2)
+    vid.permute(0,2,3,1).index_put_((ti,hi,wi),vals,accumulate=True)
+    if not(counts is None):
+        ones = th.ones_like(vals)
+        counts.permute(0,2,3,1).index_put_((ti,hi,wi),ones,accumulate=True)
+    return vid
+
 def slice_flows(flows,t_start,t_end):
     if flows is None: return flows
     flows_t = edict()
@@ -0,0 +1,150 @@
+"""
+
+Multi-scale loader on the public DataLoader API.
+
+The sampler draws the scale once per batch and yields (idx_scale, indices);
+a worker sets the scale on its copy of the dataset, loads and collates the
+whole batch, and appends idx_scale as the last element (as the original
+MSDataLoader did). Workers are persistent and prefetch pinned batches.
+
+The scale and the shuffle order come from a generator seeded by
+(seed, epoch), and the worker seeds derive from the loader's seeded
+generator, so a run is reproducible for a fixed --seed and --n_threads.
+
+A plain "batch_sampler" (yielding lists of indices) is wrapped so its
+batches also get a scale; it is exclusive with batch_size, shuffle,
+sampler and drop_last as in DataLoader. Shared by dn_gray and dn_real.
+
+"""
+
+import random
+import numpy as np
+
+import torch
+from torch.utils.data import Dataset, Sampler
+from torch.utils.data import RandomSampler, SequentialSampler, BatchSampler
+from torch.utils.data.dataloader import DataLoader
+from torch.utils.data.dataloader import default_collate
+
+class MSBatchSampler(Sampler):
+
+    def __init__(self, dataset, nscales, batch_size=1, shuffle=False,
+                 drop_last=False, seed=0, sampler=None, batch_sampler=None):
+        self.dataset = dataset
+        self.nscales = nscales
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.seed = seed
+        self.sampler = sampler
+        self.batch_sampler = batch_sampler
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _generator(self):
+        gen = torch.Generator()
+        gen.manual_seed(self.seed + self.epoch)
+        return gen
+
+    def __iter__(self):
+        gen = self._generator()
+        if self.batch_sampler is not None:
+            batches = self.batch_sampler
+        else:
+            if self.sampler is not None:
+                sampler = self.sampler
+            elif self.shuffle:
+                sampler = RandomSampler(self.dataset, generator=gen)
+            else:
+                sampler = SequentialSampler(self.dataset)
+            batches = BatchSampler(sampler, self.batch_size, self.drop_last)
+        use_scales = self.nscales > 1 and getattr(self.dataset, 'train', False)
+        for batch_indices in batches:
+            idx_scale = 0
+            if use_scales:
+                idx_scale = torch.randint(self.nscales, (1,), generator=gen).item()
+            yield idx_scale, batch_indices
+
+    def __len__(self):
+        if self.batch_sampler is not None:
+            return len(self.batch_sampler)
+        n = len(self.sampler) if self.sampler is not None else len(self.dataset)
+        if self.drop_last:
+            return n // self.batch_size
+        return (n + self.batch_size - 1) // self.batch_size
+
+class MSBatchDataset(Dataset):
+    """
+    Loads a full batch per index so the scale is set once per batch.
+    """
+
+    def __init__(self, dataset, collate_fn=default_collate):
+        self.dataset = dataset
+        self.collate_fn = collate_fn
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, item):
+        idx_scale, batch_indices = item
+        if hasattr(self.dataset, 'set_scale'):
+            self.dataset.set_scale(idx_scale)
+        samples = self.collate_fn([self.dataset[i] for i in batch_indices])
+        samples = list(samples)
+        samples.append(idx_scale)
+        return samples
+
+def _ms_worker_init(worker_id):
+    # -- torch already seeds each worker from the loader's generator --
+    seed = torch.initial_seed() % 2**32
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.set_num_threads(1)
+
+class MSDataLoader(DataLoader):
+    def __init__(
+        self, args, dataset, batch_size=1, shuffle=False,
+        sampler=None, batch_sampler=None,
+        collate_fn=default_collate, pin_memory=False, drop_last=False,
+        timeout=0, worker_init_fn=None, prefetch_factor=2):
+
+        self.scale = args.scale
+        seed = getattr(args, 'seed', 0)
+        num_workers = args.n_threads
+        if batch_sampler is not None and not isinstance(batch_sampler, MSBatchSampler):
+            if batch_size != 1 or shuffle or sampler is not None or drop_last:
+                raise ValueError('batch_sampler option is mutually exclusive '
+                                 'with batch_size, shuffle, sampler, and drop_last')
+            batch_sampler = MSBatchSampler(
+                dataset, len(self.scale), seed=seed,
+                batch_sampler=batch_sampler)
+        elif batch_sampler is None:
+            batch_sampler = MSBatchSampler(
+                dataset, len(self.scale), batch_size=batch_size,
+                shuffle=shuffle, drop_last=drop_last, seed=seed,
+                sampler=sampler)
+        if worker_init_fn is None:
+            worker_init_fn = _ms_worker_init
+
+        kwargs = {}
+        if num_workers > 0:
+            kwargs['persistent_workers'] = True
+            kwargs['prefetch_factor'] = prefetch_factor
+
+        super(MSDataLoader, self).__init__(
+            MSBatchDataset(dataset, collate_fn), batch_size=None,
+            sampler=batch_sampler, num_workers=num_workers,
+            collate_fn=_identity, timeout=timeout,
+            pin_memory=pin_memory and torch.cuda.is_available(),
+            worker_init_fn=worker_init_fn,
+            generator=torch.Generator().manual_seed(seed), **kwargs)
+        self.ms_sampler = batch_sampler
+
+    def set_epoch(self, epoch):
+        if hasattr(self.ms_sampler, 'set_epoch'):
+            self.ms_sampler.set_epoch(epoch)
+
+def _identity(batch):
+    return batch
@@ -0,0 +1,121 @@
+"""
+
+Seeded noise simulation generated directly on the device of the clean video.
+
+Each sample (one clip) draws its noise, all frames at once, from a
+generator seeded by a counter hash of
+
+    (seed, video, frame, crop region, step)
+
+so the same sample is reproduced regardless of the order, the worker, or
+the batch it is drawn in; no RNG state is shared between workers or
+threads (each thread re-seeds its own generator) and nothing is copied
+from the host. "frame" is the index of the clip's
+first frame in the video and "region" the (fs,fe,top,left,btm,right)
+crop the sample is used for, so two crops of one video differ. "step"
+must be unique per draw, e.g. "counter_seed(epoch,batch_idx,rank)"
+during training, since "global_step" repeats across the micro-batches
+of gradient accumulation.
+
+    sim = NoiseModel("pg",sigma=[10.,50.],gain=0.01,seed=123)
+    noisy = sim(clean,video=index,region=region,step=step)
+
+Noise types:
+  "g": additive gaussian; clean + sigma * N(0,1)
+  "pg": poisson-gaussian; gain * Poisson(clean/gain) + sigma * N(0,1)
+
+"sigma" is on the [0,255] scale (as "add_noise_to_image"); a pair
+[sigma_min,sigma_max] samples a sigma per sample uniformly.
+
+"""
+
+import threading
+import torch as th
+
+MASK64 = (1 << 64) - 1
+
+def splitmix64(x):
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+def counter_seed(*counters):
+    """
+    A 63-bit seed from a tuple of non-negative integers.
+    """
+    x = 0
+    for c in counters:
+        x = splitmix64(x ^ (int(c) & MASK64))
+    return x >> 1
+
+_local = threading.local()
+def get_generator(device,seed):
+    """
+    This thread's generator for "device", seeded with "seed".
+    """
+    device = th.device(device)
+    if not(hasattr(_local,"generators")):
+        _local.generators = {}
+    if not(device in _local.generators):
+        _local.generators[device] = th.Generator(device=device)
+    return _local.generators[device].manual_seed(seed)
+
+def sample_seed(seed, video=0, frame=0, region=None, step=0):
+    """
+    The generator seed of one sample; see the module docstring.
+    """
+    region = [0]*6 if region is None else [int(v) for v in region]
+    return counter_seed(seed,video,frame,*region,step)
+
+def per_sample(value, nbatch):
+    if th.is_tensor(value): value = value.tolist()
+    if isinstance(value,(list,tuple)): return list(value)
+    return [value]*nbatch
+
+class NoiseModel():
+
+    def __init__(self, ntype="g", sigma=25., gain=0.01, seed=123, imax=1.):
+        self.ntype = ntype
+        self.sigma = sigma
+        self.gain = gain
+        self.seed = seed
+        self.imax = imax # pixel range of the clean video
+        if not(ntype in ["g","pg"]):
+            raise ValueError(f"Uknown noise type [{ntype}]")
+
+    def sample_sigma(self,gen,device):
+        if not(isinstance(self.sigma,(list,tuple))):
+            return self.sigma
+        smin,smax = self.sigma
+        u = th.rand(1,generator=gen,device=device).item()
+        return smin + (smax - smin) * u
+
+    def __call__(self, clean, video=0, frame=0, region=None, step=0):
+        """
+
+        clean: (T,C,H,W) or (B,T,C,H,W); with a batch dim "video" and
+        "frame" may be a list (or tensor) of one id per sample and
+        "region" a (B,6) tensor (or list) of one crop per sample.
+
+        """
+        if clean.ndim == 5:
+            B = len(clean)
+            videos,frames = per_sample(video,B),per_sample(frame,B)
+            regions = [None]*B if region is None else region
+            return th.stack([self(clean[b],videos[b],frames[b],regions[b],step)
+                             for b in range(B)])
+        seed = sample_seed(self.seed,video,frame,region,step)
+        gen = get_generator(clean.device,seed)
+        sigma = self.sample_sigma(gen,clean.device)
+        return self.sample_clip(clean,sigma,gen)
+
+    def sample_clip(self, clean, sigma, gen):
+        scale = self.imax / 255.
+        noise = th.randn(clean.shape,generator=gen,
+                         device=clean.device,dtype=clean.dtype)
+        if self.ntype == "g":
+            return clean + sigma * scale * noise
+        gain = self.gain * self.imax
+        counts = th.poisson(clean.clamp(min=0)/gain,generator=gen)
+        return gain * counts + sigma * scale * noise
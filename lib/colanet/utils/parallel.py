@@ -0,0 +1,113 @@
+"""
+
+Run the per-video experiment stages across a pool of worker processes.
+
+Each worker holds its own model on its own device (or a cpu thread budget)
+and streams its shard of videos through a pipeline of stages,
+
+    load -> flow -> deno -> metrics -> write
+
+with bounded queues between them (see utils/pipeline.py), so the loading
+and the metrics/write work overlap the device stages. The per-video results
+are merged back into one results dict, in the order of the input indices.
+
+"stages" is an edict of module-level (so picklable) functions:
+
+    init(cfg,device,**init_kwargs) -> ctx
+    steps: a list of (name,fxn) with fxn(ctx,vsample) -> vsample;
+           the first takes the video index and the last
+           returns the results of one video (a dict of values)
+    init_kwargs: optional; pickled to each worker, so keep them small
+           (e.g. pass the config and load the datasets in "init";
+           with one worker they are passed as is)
+
+"cfg.stage_nworkers" optionally sets the threads per stage, e.g. {"flow":2}.
+The current cuda device is per-thread, so each stage thread sets the
+worker's device before it runs.
+
+"""
+
+# -- misc --
+import torch as th
+from functools import partial
+from easydict import EasyDict as edict
+from .pipeline import Pipeline
+
+# -- multiproc --
+import torch.multiprocessing as mp
+
+def shard(indices,nworkers):
+    return [list(indices[i::nworkers]) for i in range(nworkers)]
+
+def get_devices(cfg,nworkers):
+    """
+    One device per worker; cycles through "cfg.devices" if set
+    e.g. "cuda:0-cuda:1" or ["cuda:0","cuda:1"].
+    """
+    devices = cfg.devices if "devices" in cfg else cfg.device
+    if isinstance(devices,str):
+        devices = devices.split("-")
+    return [devices[i % len(devices)] for i in range(nworkers)]
+
+def run_sharded(cfg,indices,stages,nworkers=1,nthreads=0,qsize=2,results=None):
+    """
+
+    Process all "indices" and merge the outputs into "results".
+    With one worker the stages run in this process.
+
+    """
+    # -- one worker; skip the pool --
+    devices = get_devices(cfg,nworkers)
+    if nworkers == 1:
+        outs = run_shard(cfg,indices,stages,devices[0],nthreads,qsize)
+        return merge_results(outs,indices,results)
+
+    # -- pool of workers --
+    shards = shard(indices,nworkers)
+    args = [(cfg,shards[i],stages,devices[i],nthreads,qsize)
+            for i in range(nworkers) if len(shards[i]) > 0]
+    ctx = mp.get_context("spawn")
+    with ctx.Pool(len(args)) as pool:
+        outs = pool.starmap(run_shard,args)
+    outs = [out for outs_i in outs for out in outs_i]
+    return merge_results(outs,indices,results)
+
+def set_thread_device(device):
+    if "cuda" in str(device):
+        th.cuda.set_device(th.device(device))
+
+def run_shard(cfg,indices,stages,device,nthreads=0,qsize=2):
+    if nthreads > 0:
+        th.set_num_threads(nthreads)
+    set_thread_device(device)
+    init_kwargs = stages.init_kwargs if "init_kwargs" in stages else {}
+    ctx = stages.init(cfg,device,**init_kwargs)
+    nworkers = cfg.stage_nworkers if "stage_nworkers" in cfg else {}
+    return run_pipeline(ctx,indices,stages.steps,nworkers,qsize,
+                        thread_init=partial(set_thread_device,device))
+
+def run_pipeline(ctx,indices,steps,nworkers=None,qsize=2,verbose=True,
+                 thread_init=None):
+    if nworkers is None: nworkers = {}
+    pstages = []
+    for name,fxn in steps:
+        nworkers_s = nworkers[name] if name in nworkers else 1
+        pstages.append((name,partial(fxn,ctx),nworkers_s))
+    pipe = Pipeline(pstages,qsize,thread_init)
+    outs = pipe.run(indices)
+    if verbose: print(pipe)
+    return list(zip(indices,outs))
+
+def merge_results(outs,indices,results=None):
+    """
+    Append each video's results in the order of "indices".
+    """
+    order = {index:i for i,index in enumerate(indices)}
+    outs = sorted(outs,key=lambda out: order[out[0]])
+    if results is None: results = edict()
+    for index,results_i in outs:
+        for key,val in results_i.items():
+            if not(key in results):
+                results[key] = []
+            results[key].append(val)
+    return results
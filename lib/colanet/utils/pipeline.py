@@ -0,0 +1,157 @@
+"""
+
+A producer/consumer pipeline with bounded queues between stages.
+
+    pipe = Pipeline([("load",load_fxn,1),
+                     ("flow",flow_fxn,4),
+                     ("deno",deno_fxn,1),
+                     ("metrics",metrics_fxn,2),
+                     ("write",write_fxn,2)],qsize=2)
+    outs = pipe.run(items)
+    stats = pipe.stats()
+
+Each stage runs "nworkers" threads that read from the queue of the previous
+stage and write to the next one. The bounded queues limit how far the
+producers run ahead, so the cpu-heavy stages (flow, png writes) hide
+behind the model while memory stays capped. Outputs are returned in the
+order of the inputs. The first error of any stage is raised by "run"
+once the remaining items are drained.
+
+"thread_init" runs at the start of every stage thread; e.g. to set the
+current cuda device, which is per-thread.
+
+"""
+
+# -- misc --
+import time
+import queue
+import threading
+import numpy as np
+from easydict import EasyDict as edict
+
+class Stage():
+
+    def __init__(self,name,fxn,nworkers=1):
+        self.name = name
+        self.fxn = fxn
+        self.nworkers = nworkers
+        self.reset()
+
+    def reset(self):
+        self.nitems = 0
+        self.busy = 0.
+        self.depths = []
+        self.lock = threading.Lock()
+        self.nfinished = 0
+
+    def record(self,dtime,depth):
+        with self.lock:
+            self.nitems += 1
+            self.busy += dtime
+            self.depths.append(depth)
+
+class Pipeline():
+
+    def __init__(self,stages,qsize=2,thread_init=None):
+        self.stages = [s if isinstance(s,Stage) else Stage(*s) for s in stages]
+        self.qsize = qsize
+        self.thread_init = thread_init
+        self.runtime = 0.
+
+    def run(self,items):
+
+        # -- init --
+        done = object()
+        errors = []
+        nstages = len(self.stages)
+        queues = [queue.Queue(maxsize=self.qsize) for _ in range(nstages)]
+        outs = []
+        for stage in self.stages: stage.reset()
+
+        def work(sidx):
+            stage = self.stages[sidx]
+            in_q = queues[sidx]
+            if not(self.thread_init is None):
+                try:
+                    self.thread_init()
+                except Exception as e:
+                    errors.append(e)
+            while True:
+                depth = in_q.qsize()
+                item = in_q.get()
+                if item is done: break
+                if len(errors) > 0: continue
+                order,data = item
+                try:
+                    start = time.perf_counter()
+                    data = stage.fxn(data)
+                    stage.record(time.perf_counter() - start,depth)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if sidx+1 < nstages: queues[sidx+1].put((order,data))
+                else: outs.append((order,data))
+
+            # -- last worker of a stage closes the next queue --
+            with stage.lock:
+                stage.nfinished += 1
+                is_last = stage.nfinished == stage.nworkers
+            if is_last and sidx+1 < nstages:
+                for _ in range(self.stages[sidx+1].nworkers):
+                    queues[sidx+1].put(done)
+
+        # -- launch --
+        threads = []
+        for sidx,stage in enumerate(self.stages):
+            for _ in range(stage.nworkers):
+                thread = threading.Thread(target=work,args=(sidx,),daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        # -- feed --
+        start = time.perf_counter()
+        for order,item in enumerate(items):
+            queues[0].put((order,item))
+        for _ in range(self.stages[0].nworkers):
+            queues[0].put(done)
+        for thread in threads: thread.join()
+        self.runtime = time.perf_counter() - start
+
+        # -- raise the first error --
+        if len(errors) > 0:
+            raise errors[0]
+
+        # -- input order --
+        outs = sorted(outs,key=lambda out: out[0])
+        return [data for order,data in outs]
+
+    def stats(self):
+        """
+
+        Per-stage report:
+          nitems: number of items processed
+          busy: total seconds spent in the stage
+          throughput: items per second of wall-clock time
+          ave_depth,max_depth: the input queue depth seen by the workers
+
+        """
+        stats = edict()
+        for stage in self.stages:
+            stats_s = edict()
+            stats_s.nworkers = stage.nworkers
+            stats_s.nitems = stage.nitems
+            stats_s.busy = stage.busy
+            stats_s.throughput = stage.nitems/max(self.runtime,1e-8)
+            depths = stage.depths if len(stage.depths) > 0 else [0]
+            stats_s.ave_depth = float(np.mean(depths))
+            stats_s.max_depth = int(np.max(depths))
+            stats[stage.name] = stats_s
+        return stats
+
+    def __str__(self):
+        msg = "--- Pipeline Stats ---"
+        fmt = "\n%s [%d]: %d items, %2.3f items/sec, %2.3f busy [s], depth %2.2f (max %d)"
+        for name,s in self.stats().items():
+            msg += fmt % (name,s.nworkers,s.nitems,s.throughput,
+                          s.busy,s.ave_depth,s.max_depth)
+        return msg
@@ -17,7 +17,8 @@ def extract_proc_cfg(in_cfg):
     def_cfg = {"spatial_crop_size":0,
                "spatial_crop_overlap":0,
                "temporal_crop_size":0,
-               "temporal_crop_overlap":0}
+               "temporal_crop_overlap":0,
+               "temporal_crop_propagate":False}
     cfg = edict()
     for key in def_cfg:
         if key in in_cfg:
@@ -36,15 +37,22 @@ def get_fwd_fxn(cfg,model):
     s_overlap = cfg.spatial_crop_overlap
     t_size = cfg.temporal_crop_size
     t_overlap = cfg.temporal_crop_overlap
-    model_fwd = lambda vid,flows: model(vid,flows=flows)
+    t_propagate = cfg.temporal_crop_propagate if "temporal_crop_propagate" in cfg else False
+    if "aug_test" in cfg and cfg.aug_test:
+        t_propagate = False # indices are not augmented with the frames
+    def model_fwd(vid,flows,state=None):
+        if state is None: return model(vid,flows=flows)
+        return model(vid,flows=flows,state=state)
     if not(s_size is None) and not(s_size == "none") and not(s_size <= 0):
         schop_p = lambda vid,flows: spatial_chop(s_size,s_overlap,model_fwd,vid,
                                                  flows=flows,verbose=s_verbose)
+        t_propagate = False # indices are per spatial chunk
     else:
         schop_p = model_fwd
     if not(t_size is None) and not(t_size == "none") and not(t_size <= 0):
         tchop_p = lambda vid,flows: temporal_chop(t_size,t_overlap,schop_p,vid,
-                                                  flows=flows,verbose=t_verbose)
+                                                  flows=flows,verbose=t_verbose,
+                                                  propagate=t_propagate)
         fwd_fxn = tchop_p # rename
     else:
         fwd_fxn = schop_p
@@ -150,15 +158,59 @@ def spatial_chop(ssize,overlap,fwd_fxn,vid,flows=None,verbose=False):
     return deno
 
 
-def temporal_chop(tsize,overlap,fwd_fxn,vid,flows=None,verbose=True):
+class ChopState():
+    """
+
+    Search indices carried from one temporal window into the next.
+
+    The model fills "inds" (one entry per attention block) and reads
+    "seeds"; see CES.forward. Seeds replace the full search of a block
+    with a refine search around them.
+
+    """
+
+    def __init__(self):
+        self.seeds = None
+        self.inds = None
+
+def shift_inds(inds,delta,nframes,prev_nframes=None):
+    """
+
+    Seeds for a window of "nframes" starting "delta" frames after the
+    window of "prev_nframes" (default: "nframes") which produced "inds"
+    (b,h,(T nH nW),k,3). An overlap frame takes its own indices; a new
+    frame takes those of the last frame of the previous window moved
+    forward in time. Frame indices are clamped to the new window.
+
+    """
+    T_prev = nframes if prev_nframes is None else prev_nframes
+    if inds is None or delta >= T_prev: return None
+    b,h,Q,k,_ = inds.shape
+    assert Q % T_prev == 0,"inds must hold %d frames" % T_prev
+    T,nHW = nframes,Q//T_prev
+    inds = inds.view(b,h,T_prev,nHW,k,3)
+    tgt = th.arange(T,device=inds.device)
+    src = (tgt + delta).clamp(max=T_prev-1)
+    seeds = inds[:,:,src].clone()
+    tshift = (tgt - src).to(inds.dtype).view(1,1,T,1,1)
+    seeds[...,0] = (seeds[...,0] + tshift).clamp(0,T-1)
+    return seeds.view(b,h,T*nHW,k,3)
+
+def temporal_chop(tsize,overlap,fwd_fxn,vid,flows=None,verbose=True,
+                  propagate=False):
     """
     overlap is a __percent__
+
+    With "propagate", the search indices of the frames shared with
+    the previous window seed the search of the next one.
     """
     vprint = partial(_vprint,verbose)
     nframes = vid.shape[-4]
     t_chunks = get_chunks(nframes,tsize,overlap)
     vprint("t_chunks: ",t_chunks)
     deno,Z = th.zeros_like(vid),th.zeros_like(vid)
+    chop = ChopState() if propagate else None
+    prev_chunk,prev_T = None,None
     for t_chunk in t_chunks:
 
         # -- extract --
@@ -168,8 +220,17 @@ def temporal_chop(tsize,overlap,fwd_fxn,vid,flows=None,verbose=True):
         flow_chunk = get_temporal_chunk_flow(flows,t_slice)
 
         # -- process --
-        if flows: deno_chunk = fwd_fxn(vid_chunk,flow_chunk)
-        else: deno_chunk = fwd_fxn(vid_chunk,flow_chunk)
+        if propagate:
+            chop.seeds = None
+            T = vid_chunk.shape[-4]
+            if not(prev_chunk is None) and not(chop.inds is None):
+                chop.seeds = [shift_inds(inds,t_chunk-prev_chunk,T,prev_T)
+                              for inds in chop.inds]
+            deno_chunk = fwd_fxn(vid_chunk,flow_chunk,chop)
+            prev_T = T
+        else:
+            deno_chunk = fwd_fxn(vid_chunk,flow_chunk)
+        prev_chunk = t_chunk
 
         # -- accumulate --
         ones = th.ones_like(deno_chunk)
@@ -177,4 +238,3 @@ def temporal_chop(tsize,overlap,fwd_fxn,vid,flows=None,verbose=True):
         Z[...,t_slice,:,:,:] += ones
     deno /= Z
     return deno
-
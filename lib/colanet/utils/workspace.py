@@ -0,0 +1,95 @@
+"""
+
+A workspace of reusable buffers for the temporaries of a forward pass.
+
+Buffers are keyed by (tag, shape, dtype, device) and handed out again on
+the next request with the same key, so layers and spatial chunks of the
+same size share one allocation instead of going through the allocator on
+each call. A buffer is only valid until the next request for its key;
+callers must be done with it by then.
+
+    ws = Workspace(max_bytes=2**30)
+    y = th.div(num,den,out=ws.get("y",num.shape,num.dtype,num.device))
+    ...
+    ws.release() # free everything
+
+Buffers are only handed out with grad disabled since autograd may keep
+a reference to a tensor that the next request would overwrite. Once
+the buffers (and objects) held exceed "max_bytes", the least recently
+used are dropped, so many distinct video or tile sizes do not grow it
+without bound; a dropped buffer still in use is freed after its last use.
+
+"""
+
+import torch as th
+from collections import OrderedDict
+
+class Workspace():
+
+    def __init__(self, max_bytes=2**30):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active(self):
+        return not(th.is_grad_enabled())
+
+    def get(self, tag, shape, dtype, device, zero=False):
+        key = ("buf",tag,tuple(shape),dtype,str(device))
+        buf = self.lookup(key)
+        if buf is None:
+            buf = th.empty(shape,dtype=dtype,device=device)
+            self.add(key,buf)
+        if zero: buf.zero_()
+        return buf
+
+    def get_obj(self, tag, key, init_fxn):
+        """
+        An object holding its own buffers (e.g. an iFoldz), made once per key.
+        """
+        key = ("obj",tag) + tuple(key)
+        obj = self.lookup(key)
+        if obj is None:
+            obj = init_fxn()
+            self.add(key,obj)
+        return obj
+
+    def lookup(self, key):
+        if not(key in self.entries):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def add(self, key, entry):
+        self.entries[key] = entry
+        self.sizes[key] = entry_nbytes(entry)
+        self.total += self.sizes[key]
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            key,_ = self.entries.popitem(last=False)
+            self.total -= self.sizes.pop(key)
+
+    def nbytes(self):
+        return self.total
+
+    def release(self):
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.total = 0
+        if th.cuda.is_available():
+            th.cuda.empty_cache()
+
+    def __len__(self):
+        return len(self.entries)
+
+def entry_nbytes(entry):
+    if th.is_tensor(entry):
+        tensors = [entry]
+    else:
+        tensors = [v for v in vars(entry).values() if th.is_tensor(v)]
+    return sum([t.numel()*t.element_size() for t in tensors])
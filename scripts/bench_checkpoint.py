@@ -0,0 +1,86 @@
+"""
+
+Peak memory and time of a training step of RR with activation checkpointing.
+
+For each crop size and checkpoint setting we run forward + backward on a
+random clip and report the peak allocated memory [GB], the time per step
+and both relative to storing every activation.
+
+"""
+
+# -- misc --
+import time
+import pprint
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- network --
+import colanet
+import colanet.utils.gpu_mem as gpu_mem
+
+def train_step(model, noisy, clean, flows):
+    deno = model(noisy,flows=flows)
+    loss = th.mean((deno - clean)**2)
+    loss.backward()
+    model.zero_grad(set_to_none=True)
+
+def time_step(model, vshape, device, nreps=3):
+    T,C,H,W = vshape
+    clean = th.rand((1,T,C,H,W),device=device)
+    noisy = clean + 25./255 * th.randn_like(clean)
+    zeros = th.zeros((1,T,2,H,W),device=device)
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+    train_step(model,noisy,clean,flows) # burn-in
+    th.cuda.synchronize()
+    gpu_mem.reset_peak_gpu_stats()
+    start = time.perf_counter()
+    for _ in range(nreps):
+        train_step(model,noisy,clean,flows)
+    th.cuda.synchronize()
+    dtime = (time.perf_counter() - start)/nreps
+    mem,_ = gpu_mem.print_peak_gpu_stats(False,"step")
+    return mem,dtime
+
+def main():
+
+    # -- config --
+    cfg = edict()
+    device = "cuda:0"
+    cfg.device = device
+    cfg.search_menu_name = "full"
+    cfg.search_v0 = "exact"
+    cfg.k_s = 100
+    cfg.k_a = 100
+    isizes = [128,192,256]
+    nframes = 3
+    settings = [(0,"none"),(4,"none"),(0,"attn"),(0,"merge"),
+                (4,"attn"),(4,"merge"),(2,"merge")]
+
+    # -- model --
+    model = colanet.augmented.load_model(cfg).to(device).train()
+
+    # -- run --
+    for isize in isizes:
+        vshape = (nframes,1,isize,isize)
+        report = edict()
+        for res_group,attn in settings:
+            model.set_checkpoint(res_group,attn)
+            try:
+                mem,dtime = time_step(model,vshape,device)
+            except th.cuda.OutOfMemoryError:
+                mem,dtime = np.inf,np.inf
+                th.cuda.empty_cache()
+            report["%d-%s" % (res_group,attn)] = edict({"mem":mem,"time":dtime})
+        base = report["0-none"]
+        for name in report:
+            report[name].mem_ratio = report[name].mem / base.mem
+            report[name].time_ratio = report[name].time / base.time
+        print("isize: %d" % isize)
+        pp.pprint(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+
+Time RR against its static variant, eager and under torch.compile, on the cpu.
+
+Uses the "csa" attention (tensor ops only) so the whole forward compiles;
+reports the mean time per clip, the speed-up over RR and the max abs
+difference of the outputs.
+
+"""
+
+# -- misc --
+import time
+import pprint
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- network --
+import colanet
+
+def get_video(T=3,H=64,W=64):
+    clean = th.rand((1,1,8,8))
+    clean = th.nn.functional.interpolate(clean,(H,W),mode="bilinear")
+    clean = clean.repeat(T,1,1,1)
+    return clean + 25./255 * th.randn_like(clean)
+
+def time_fwd(fwd, noisy, nreps):
+    with th.no_grad():
+        deno = fwd(noisy) # burn-in; compiles
+        start = time.perf_counter()
+        for _ in range(nreps):
+            fwd(noisy)
+        dtime = (time.perf_counter() - start)/nreps
+    return dtime,deno
+
+def main():
+
+    # -- config --
+    cfg = edict()
+    cfg.device = "cpu"
+    cfg.search_menu_name = "full"
+    cfg.search_v0 = "csa"
+    cfg.pretrained_load = False
+    nreps = 10
+    th.set_num_threads(4)
+
+    # -- models --
+    model = colanet.augmented.load_model(cfg).eval()
+    smodel = model.to_static()
+    cmodel = th.compile(smodel)
+    T,H,W = 3,64,64
+    noisy = get_video(T,H,W)
+    zeros = th.zeros((1,T,2,H,W))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+
+    # -- time --
+    fwds = {"rr":lambda vid: model(vid,flows=flows),
+            "static":lambda vid: smodel(vid),
+            "compiled":lambda vid: cmodel(vid)}
+    report = edict()
+    deno_ref = None
+    for name,fwd in fwds.items():
+        dtime,deno = time_fwd(fwd,noisy,nreps)
+        if deno_ref is None: deno_ref = deno
+        report[name] = edict({"time":dtime,
+                              "max_diff":(deno-deno_ref).abs().max().item()})
+    for name in report:
+        report[name].speedup = report.rr.time / report[name].time
+    pp.pprint(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+
+Data-parallel scaling of ColaNetLit on one cpu machine with gloo.
+
+Trains the "csa" model on synthetic region crops with 1, 2 and 4
+processes (a fixed number of crops per epoch split across them, with
+gradient accumulation) and reports crops/sec, the speed-up over one
+process and the epoch metrics reduced across processes.
+
+"""
+
+# -- misc --
+import time
+import pprint
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- lightning --
+import pytorch_lightning as pl
+from pytorch_lightning.strategies import DDPSpawnStrategy
+
+# -- network --
+import colanet
+from colanet.lightning import ColaNetLit,dist_trainer_kwargs,region_loader
+
+class SyntheticRegions(th.utils.data.Dataset):
+    """
+    Smooth random videos on [0,255] with a random crop "region".
+    """
+
+    def __init__(self, nvids=16, nframes=3, isize=96, csize=64, seed=0):
+        gen = th.Generator().manual_seed(seed)
+        vids = th.rand((nvids,1,1,8,8),generator=gen)
+        vids = th.nn.functional.interpolate(vids.flatten(0,1),(isize,isize),
+                                            mode="bilinear")
+        self.vids = 255.*vids[:,None].repeat(1,nframes,1,1,1)
+        self.csize = csize
+
+    def __len__(self):
+        return len(self.vids)
+
+    def __getitem__(self, index):
+        clean = self.vids[index]
+        T,C,H,W = clean.shape
+        top,left = np.random.randint(0,H-self.csize+1,2)
+        region = th.IntTensor([0,T,top,left,top+self.csize,left+self.csize])
+        noisy = clean + 25.*th.randn_like(clean)
+        return {"noisy":noisy,"clean":clean,"region":region,"index":index}
+
+def run_fit(cfg, model_cfg, nprocs):
+    cfg = edict(dict(cfg))
+    cfg.ndevices = nprocs
+    dset = SyntheticRegions()
+    loader = region_loader(cfg,dset,cfg.batch_size)
+    model = ColaNetLit(model_cfg,batch_size=cfg.batch_size,flow=False,
+                       nepochs=cfg.nepochs,sim_device="cpu")
+    kwargs = dist_trainer_kwargs(cfg)
+    if nprocs > 1:
+        kwargs['strategy'] = DDPSpawnStrategy(process_group_backend="gloo")
+    trainer = pl.Trainer(**kwargs,max_epochs=cfg.nepochs,logger=False,
+                         enable_checkpointing=False,enable_progress_bar=False,
+                         num_sanity_val_steps=0)
+    start = time.perf_counter()
+    trainer.fit(model,loader,loader)
+    dtime = time.perf_counter() - start
+    ncrops = cfg.nepochs * len(dset) * cfg.crops_per_video
+    metrics = {k:float(v) for k,v in trainer.callback_metrics.items()}
+    return edict({"time":dtime,"crops_per_sec":ncrops/dtime,"metrics":metrics})
+
+def main():
+
+    # -- config --
+    cfg = edict()
+    cfg.accelerator = "cpu"
+    cfg.dist_backend = "gloo"
+    cfg.accumulate_grad_batches = 2
+    cfg.crops_per_video = 4
+    cfg.batch_size = 2
+    cfg.nepochs = 2
+    cfg.seed = 123
+    cfg.num_workers = 0
+    model_cfg = edict({"device":"cpu","search_menu_name":"full",
+                       "search_v0":"csa","pretrained_load":False})
+    nprocs_list = [1,2,4]
+    th.set_num_threads(1) # one thread per process
+
+    # -- run --
+    report = {}
+    for nprocs in nprocs_list:
+        report[nprocs] = run_fit(cfg,model_cfg,nprocs)
+    for nprocs in nprocs_list:
+        report[nprocs].speedup = report[nprocs].crops_per_sec / report[1].crops_per_sec
+    pp.pprint(report)
+
+if __name__ == "__main__":
+    main()
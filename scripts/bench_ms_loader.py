@@ -0,0 +1,79 @@
+"""
+
+Throughput of the multi-scale loader on synthetic patch datasets.
+
+Reports batches/sec and the time spent waiting on the loader for
+a range of worker counts; each "step" sleeps to mimic the model.
+
+"""
+
+# -- misc --
+import time
+import pprint
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- loader --
+from colanet.utils.ms_loader import MSDataLoader
+
+class SyntheticPatches(th.utils.data.Dataset):
+    """
+    Random uint8 images cropped to a scale-dependent patch size.
+    """
+
+    def __init__(self, nimgs=64, isize=256, psize=48, scale=[1,2,3],
+                 nsamples=2048, chnls=1):
+        self.imgs = np.random.randint(0,256,(nimgs,isize,isize,chnls),
+                                      dtype=np.uint8)
+        self.psize = psize
+        self.scale = scale
+        self.nsamples = nsamples
+        self.idx_scale = 0
+        self.train = True
+
+    def set_scale(self, idx_scale):
+        self.idx_scale = idx_scale
+
+    def __len__(self):
+        return self.nsamples
+
+    def __getitem__(self, index):
+        img = self.imgs[index % len(self.imgs)]
+        ps = self.psize * self.scale[self.idx_scale]
+        top = np.random.randint(0,img.shape[0]-ps+1)
+        left = np.random.randint(0,img.shape[1]-ps+1)
+        hr = img[top:top+ps,left:left+ps]
+        hr = th.from_numpy(np.ascontiguousarray(hr)).permute(2,0,1).float()
+        lr = hr[:,::self.scale[self.idx_scale],::self.scale[self.idx_scale]]
+        return lr.contiguous(),hr
+
+def run_bench(nworkers, batch_size=16, nepochs=2, step_time=0.005):
+    args = edict({"scale":[1,2,3],"n_threads":nworkers,"seed":123})
+    dataset = SyntheticPatches(scale=args.scale)
+    loader = MSDataLoader(args, dataset, batch_size=batch_size,
+                          shuffle=True, pin_memory=True)
+    nbatches,wait = 0,0.
+    start = time.perf_counter()
+    for epoch in range(nepochs):
+        loader.set_epoch(epoch)
+        tic = time.perf_counter()
+        for batch in loader:
+            wait += time.perf_counter() - tic
+            time.sleep(step_time) # the "model"
+            nbatches += 1
+            tic = time.perf_counter()
+    dtime = time.perf_counter() - start
+    return edict({"nworkers":nworkers,"nbatches":nbatches,
+                  "batches_per_sec":nbatches/dtime,"wait":wait,"time":dtime})
+
+def main():
+    results = [run_bench(nworkers) for nworkers in [0,1,2,4]]
+    for res in results:
+        pp.pprint(res)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+
+Export RR (csa attention) to ONNX and compare its onnxruntime latency
+to pytorch on the cpu for a few clip sizes.
+
+"""
+
+# -- misc --
+import pprint
+from pathlib import Path
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import torch as th
+from easydict import EasyDict as edict
+
+# -- network --
+import colanet
+from colanet.augmented import onnx_export
+
+def main():
+
+    # -- config --
+    cfg = edict()
+    cfg.device = "cpu"
+    cfg.search_menu_name = "full"
+    cfg.search_v0 = "csa"
+    nthreads = 4
+    vshapes = [(3,1,64,64),(3,1,128,128),(5,1,128,128)]
+    th.set_num_threads(nthreads)
+
+    # -- export & time --
+    model = colanet.augmented.load_model(cfg).eval()
+    Path("./output").mkdir(exist_ok=True)
+    for vshape in vshapes:
+        path = "./output/rr_csa_%dx%dx%dx%d.onnx" % vshape
+        onnx_export.export_onnx(model,path,vshape)
+        report = onnx_export.compare_latency(model,path,vshape,nthreads=nthreads)
+        print(vshape)
+        pp.pprint(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+
+Calibrate an int8 trunk for RR and compare it to float on the cpu.
+
+Reports the per-clip time and psnr of both models, the speed-up, the
+psnr drop and how many convs run in int8 (the attention convs stay
+float), and exports the quantized weights.
+
+"""
+
+# -- misc --
+import pprint
+from pathlib import Path
+pp = pprint.PrettyPrinter(indent=4)
+
+# -- linalg --
+import numpy as np
+import torch as th
+from easydict import EasyDict as edict
+
+# -- data --
+import data_hub
+
+# -- network --
+import colanet
+from colanet.augmented import quant
+
+def load_samples(cfg,indices,sigma):
+    data,loaders = data_hub.sets.load(cfg)
+    samples = []
+    for index in indices:
+        sample = data.te[index]
+        clean = sample['clean'][:cfg.nframes]/255.
+        clean = clean[...,:cfg.isize,:cfg.isize].contiguous()
+        noisy = clean + sigma/255. * th.randn_like(clean)
+        T,C,H,W = clean.shape
+        zeros = th.zeros((1,T,2,H,W))
+        flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+        samples.append((noisy,clean,flows))
+    return samples
+
+def main():
+
+    # -- config --
+    cfg = edict()
+    cfg.dname = "set8"
+    cfg.bw = True
+    cfg.sigma = 30.
+    cfg.nframes = 3
+    cfg.isize = 128
+    cfg.device = "cpu"
+    cfg.search_menu_name = "full"
+    cfg.search_v0 = "csa" # cpu attention
+    cfg.pretrained_load = True # the psnr drop needs the trained weights
+    cfg.pretrained_type = "lit"
+    cfg.pretrained_root = "."
+    cfg.pretrained_path = "aa543914-3948-426b-b744-8403d46878cd-epoch=30.ckpt" # FT-30
+    cfg.backend = "fbgemm"
+    calib_indices = [0,1]
+    test_indices = [2,3]
+    th.set_num_threads(4)
+
+    # -- models --
+    model = colanet.augmented.load_model(cfg).eval()
+    calib = load_samples(cfg,calib_indices,cfg.sigma)
+    calib = [(noisy,flows) for noisy,clean,flows in calib]
+    qmodel = quant.quantize_model(model,calib,cfg.backend)
+    Path("./output").mkdir(exist_ok=True)
+    quant.export_quantized(qmodel,"./output/rr_int8.pt",cfg.backend)
+
+    # -- compare --
+    samples = load_samples(cfg,test_indices,cfg.sigma)
+    report = quant.benchmark(model,qmodel,samples)
+    pp.pprint(report)
+    print("speed-up: %2.2fx, psnr drop: %2.3f dB" % (report.speedup,report.psnr_drop))
+    print("int8 convs: %d, float convs: %d" % (report.int8_convs,report.float_convs))
+
+if __name__ == "__main__":
+    main()
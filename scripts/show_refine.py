@@ -30,6 +30,7 @@ from colanet.utils.misc import optional,slice_flows
 import colanet.utils.gpu_mem as gpu_mem
 from colanet.utils.misc import rslice,write_pickle,read_pickle
 from colanet.utils.proc_utils import get_fwd_fxn
+from colanet.analysis import index_overlap,pairwise_index_overlap
 # from colanet.utils.proc_utils import spatial_chop,temporal_chop
 
 
@@ -177,42 +178,10 @@ def run_exp(_cfg):
 
 def process_inds(inds,R,K_s,K_p):
     inds = inds[0] # no 2nd batching right now.
-    N,B,Q,K,_ = inds.shape
-    inds = inds.type(th.float32)
-    accs = []
-    for n0 in range(N):
-        for n1 in range(n0+1,N):
-            _acc = process_inds_pair(inds[n0],inds[n1],R,K_s,K_p)
-            accs.append(_acc)
-    accs = th.stack(accs)
-    return accs
+    return pairwise_index_overlap(inds,R,K_s,K_p)
 
 def process_inds_pair(inds0,inds1,R,K_s,K_p):
-    B,Q,K,_ = inds0.shape
-    inds0 = inds0.view(B*Q,K,-1)
-    inds0 = inds0[:,:K_p]
-    inds1 = inds1.view(B*Q,K,-1)
-    inds1 = inds1[:,:K_s] # only top K_n
-    p = th.inf
-
-    if R == 0: # exact only
-        dists = th.cdist(inds1,inds0,p=p)
-        dists = th.any(dists<=R,-1).type(th.float32)
-    else:
-        # -- frames must match --
-        dists = th.cdist(inds1[...,[0]],inds0[...,[0]],p=p)
-        frames_eq = th.any(dists<=0,-1)
-
-        # -- spatial distance --
-        dists = th.cdist(inds1[...,1:],inds0[...,1:],p=p)
-        dists = th.any(dists<=R,-1)
-
-        # -- spatial & same frame --
-        dists = th.logical_and(dists,frames_eq).type(th.float32)
-
-    dists = th.mean(dists,-1)
-    dists = dists.view(B,Q)
-    return dists
+    return index_overlap(inds0,inds1,R,K_s,K_p)
 
 def load_trained_state(model,sigma,use_train,attn_mode):
 
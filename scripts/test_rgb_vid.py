@@ -1,6 +1,7 @@
 
 # -- misc --
 import os,math,tqdm
+import threading
 import pprint,random,copy
 pp = pprint.PrettyPrinter(indent=4)
 from functools import partial
@@ -35,6 +36,7 @@ import colanet.utils.gpu_mem as gpu_mem
 from colanet.utils.misc import rslice,write_pickle,read_pickle
 from colanet.utils.proc_utils import get_fwd_fxn#spatial_chop,temporal_chop
 from colanet.utils.aug_test import test_x8
+from colanet.utils import parallel
 
 def run_exp(_cfg):
 
@@ -42,16 +44,6 @@ def run_exp(_cfg):
     cfg = copy.deepcopy(_cfg)
     cache_io.exp_strings2bools(cfg)
 
-    # -- clear --
-    th.cuda.empty_cache()
-    th.cuda.synchronize()
-
-    # -- set device --
-    th.cuda.set_device(int(cfg.device.split(":")[1]))
-
-    # -- set seed --
-    configs.set_seed(cfg.seed)
-
     # -- init results --
     results = edict()
     results.psnrs = []
@@ -65,6 +57,41 @@ def run_exp(_cfg):
     results.mem_res = []
     results.mem_alloc = []
 
+    # -- data --
+    data,loaders = data_hub.sets.load(cfg)
+    groups = data[cfg.dset].groups
+    # indices = [i for i,g in enumerate(groups) if cfg.vid_name in g]
+    indices = data_hub.filter_subseq(data[cfg.dset],cfg.vid_name,
+                                     cfg.frame_start,cfg.nframes)
+
+    # -- shard videos across workers; each pipelines the steps --
+    steps = [("load",load_video),("flow",flow_video),("deno",deno_video),
+             ("metrics",metrics_video),("write",write_video)]
+    if optional(optional(cfg,"stage_nworkers",{}),"deno",1) > 1:
+        raise ValueError("One deno thread per worker; peak memory is per device.")
+    nworkers = optional(cfg,"nworkers",1)
+    init_kwargs = {"data":data} if nworkers == 1 else {} # workers load from cfg
+    stages = edict({"init":init_worker,"steps":steps,
+                    "init_kwargs":init_kwargs})
+    nthreads = optional(cfg,"nthreads",0)
+    results = parallel.run_sharded(cfg,indices,stages,nworkers,
+                                   nthreads,results=results)
+    return results
+
+def init_worker(_cfg,device,data=None):
+
+    # -- init --
+    cfg = copy.deepcopy(_cfg)
+    cfg.device = device
+
+    # -- clear; the device is set per stage thread by "parallel" --
+    if "cuda" in device:
+        th.cuda.empty_cache()
+        th.cuda.synchronize()
+
+    # -- set seed --
+    configs.set_seed(cfg.seed)
+
     # -- network --
     nchnls = 1 if cfg.bw else 3
     model = colanet.load_model(cfg)
@@ -78,66 +105,70 @@ def run_exp(_cfg):
     load_trained_state(model,cfg.use_train,cfg.ca_fwd,cfg.sigma,cfg.ws,cfg.wt)
 
     # -- data --
-    data,loaders = data_hub.sets.load(cfg)
-    groups = data[cfg.dset].groups
-    # indices = [i for i,g in enumerate(groups) if cfg.vid_name in g]
-    indices = data_hub.filter_subseq(data[cfg.dset],cfg.vid_name,
-                                     cfg.frame_start,cfg.nframes)
-
-    for index in indices:
-
-        # -- clean memory --
-        th.cuda.empty_cache()
-        print("index: ",index)
+    if data is None:
+        data,loaders = data_hub.sets.load(cfg)
+
+    # -- denoiser --
+    if cfg.aug_test:
+        aug_fxn = partial(test_x8,model,use_refine=cfg.aug_refine_inds)
+    else: aug_fxn = model
+    fwd_fxn = get_fwd_fxn(cfg,aug_fxn)
+
+    # -- pack --
+    ctx = edict({"cfg":cfg,"model":model,"data":data,
+                 "fwd_fxn":fwd_fxn,"imax":imax,
+                 "device_lock":threading.Lock()})
+    return ctx
+
+def load_video(ctx,index):
+
+    # -- unpack --
+    cfg,imax = ctx.cfg,ctx.imax
+    print("index: ",index)
+    sample = ctx.data[cfg.dset][index]
+    region = sample['region']
+    noisy,clean = sample['noisy'],sample['clean'] # on the cpu; see flow/deno
+    vid_frames = sample['fnums'].numpy()
+    print("[%d] noisy.shape: " % index,noisy.shape)
+
+    # -- optional crop --
+    noisy = rslice(noisy,region)
+    clean = rslice(clean,region)
+    print("[%d] noisy.shape: " % index,noisy.shape)
+
+    # -- pack --
+    vsample = edict({"index":index,"noisy":noisy,"clean":clean,
+                     "vid_frames":vid_frames,
+                     "timer":colanet.utils.timer.ExpTimer()})
+    return vsample
+
+def flow_video(ctx,vsample):
+
+    # -- on the device, as before; not while the denoiser runs --
+    with ctx.device_lock:
+        vsample.timer.start("flow")
+        noisy = vsample.noisy.to(ctx.cfg.device)
+        vsample.flows = flow.orun(noisy,ctx.cfg.flow)
+        vsample.timer.sync_stop("flow")
+    return vsample
+
+def deno_video(ctx,vsample):
+
+    # -- the flow stage waits on the lock, so the peak memory is ours --
+    with ctx.device_lock:
 
         # -- unpack --
-        sample = data[cfg.dset][index]
-        region = sample['region']
-        noisy,clean = sample['noisy'],sample['clean']
-        noisy,clean = noisy.to(cfg.device),clean.to(cfg.device)
-        print(th.mean((noisy - clean)**2))
-        vid_frames = sample['fnums'].numpy()
-        print("[%d] noisy.shape: " % index,noisy.shape)
-        temporal_chop = noisy.shape[0] > 20
-        temporal_chop = temporal_chop and not(use_chop)
-        # noisy,clean = noisy[...,:1,:,:],clean[...,:1,:,:]
-
-        # -- optional crop --
-        noisy = rslice(noisy,region)
-        clean = rslice(clean,region)
-        print("[%d] noisy.shape: " % index,noisy.shape)
-        noisy_psnrs = colanet.utils.metrics.compute_psnrs(noisy,clean,div=imax)
-        print(noisy_psnrs)
-
-        # -- create timer --
-        timer = colanet.utils.timer.ExpTimer()
-
-        # -- size --
-        nframes = noisy.shape[0]
-        ngroups = int(25 * 37./nframes)
-        batch_size = 390*39#ngroups*1024
-
-        # -- optical flow --
-        timer.start("flow")
-        flows = flow.orun(noisy,cfg.flow)
-        # if cfg.flow is True:
-        #     sigma_est = flow.est_sigma(noisy)
-        #     flows = flow.run_batch(noisy[None,:],sigma_est)
-        # else:
-        #     flows = flow.run_zeros(noisy[None,:])
-        timer.sync_stop("flow")
-
-        # -- denoise --
-        if cfg.aug_test:
-            aug_fxn = partial(test_x8,model,use_refine=cfg.aug_refine_inds)
-        else: aug_fxn = model
-        fwd_fxn = get_fwd_fxn(cfg,aug_fxn)
+        cfg,imax = ctx.cfg,ctx.imax
+        noisy,flows,timer = vsample.noisy.to(cfg.device),vsample.flows,vsample.timer
+        if not(flows is None):
+            flows = edict({k:v.to(cfg.device) for k,v in flows.items()})
+        fwd_fxn = ctx.fwd_fxn
 
         # -- run once for setup gpu --
         if cfg.burn_in:
             with th.no_grad():
                 fwd_fxn(noisy[[0],...,:128,:128]/imax,None)
-            model.reset_times()
+            ctx.model.reset_times()
 
         # -- benchmark it! --
         gpu_mem.print_peak_gpu_stats(False,"val",reset=True)
@@ -147,43 +178,53 @@ def run_exp(_cfg):
         deno = deno.clamp(0.,1.)*imax
         timer.sync_stop("deno")
         mem_alloc,mem_res = gpu_mem.print_peak_gpu_stats(True,"val",reset=True)
-
-        # -- save example --
-        out_dir = Path(cfg.saved_dir) / str(cfg.uuid)
-        deno_fns = colanet.utils.io.save_burst(deno,out_dir,"deno")
-        # colanet.utils.io.save_burst(clean,out_dir,"clean")
-
-        # -- psnr --
-        print(noisy.min(),noisy.max())
-        print(clean.min(),clean.max())
-        noisy_psnrs = colanet.utils.metrics.compute_psnrs(noisy,clean,div=imax)
-        psnrs = colanet.utils.metrics.compute_psnrs(deno,clean,div=imax)
-        ssims = colanet.utils.metrics.compute_ssims(deno,clean,div=imax)
-        print(noisy_psnrs)
-        print(psnrs)
-
-        # -- append results --
-        results.psnrs.append(psnrs)
-        results.ssims.append(ssims)
-        results.noisy_psnrs.append(noisy_psnrs)
-        results.deno_fns.append(deno_fns)
-        results.vid_frames.append(vid_frames)
-        results.vid_name.append([cfg.vid_name])
-        results.mem_res.append([mem_res])
-        results.mem_alloc.append([mem_alloc])
-        for name,time in timer.items():
-            if not(name in results):
-                results[name] = []
-            results[name].append(time)
-        for name,time in model.times.items():
-            if not(name in results):
-                results[name] = []
-            results[name].append(time)
-
-    # -- clear --
-    th.cuda.empty_cache()
-    th.cuda.synchronize()
-
+        if hasattr(ctx.model,"release_workspace"):
+            ctx.model.release_workspace() # buffers are sized for this video
+
+        # -- pack --
+        vsample.deno = deno.cpu()
+        vsample.flows = None # frees the device copy
+        vsample.mem_alloc = mem_alloc
+        vsample.mem_res = mem_res
+        vsample.model_times = list(ctx.model.times.items())
+    return vsample
+
+def metrics_video(ctx,vsample):
+
+    # -- unpack --
+    imax = ctx.imax
+    noisy,clean,deno = vsample.noisy,vsample.clean,vsample.deno
+
+    # -- psnr --
+    vsample.noisy_psnrs = colanet.utils.metrics.compute_psnrs(noisy,clean,div=imax)
+    vsample.psnrs = colanet.utils.metrics.compute_psnrs(deno,clean,div=imax)
+    vsample.ssims = colanet.utils.metrics.compute_ssims(deno,clean,div=imax)
+    print(vsample.noisy_psnrs)
+    print(vsample.psnrs)
+    return vsample
+
+def write_video(ctx,vsample):
+
+    # -- save example --
+    cfg = ctx.cfg
+    out_dir = Path(cfg.saved_dir) / str(cfg.uuid)
+    deno_fns = colanet.utils.io.save_burst(vsample.deno,out_dir,"deno")
+    # colanet.utils.io.save_burst(clean,out_dir,"clean")
+
+    # -- results for this video --
+    results = edict()
+    results.psnrs = vsample.psnrs
+    results.ssims = vsample.ssims
+    results.noisy_psnrs = vsample.noisy_psnrs
+    results.deno_fns = deno_fns
+    results.vid_frames = vsample.vid_frames
+    results.vid_name = [cfg.vid_name]
+    results.mem_res = [vsample.mem_res]
+    results.mem_alloc = [vsample.mem_alloc]
+    for name,time in vsample.timer.items():
+        results[name] = time
+    for name,time in vsample.model_times:
+        results[name] = time
     return results
 
 def load_trained_state(model,use_train,ca_fwd,sigma,ws,wt):
@@ -285,6 +326,12 @@ def main():
     cfg.temporal_crop_overlap = 0/5.#4/5. # 3 of 5 frames
     cfg.softmax_scale = 10.
 
+    # -- workers; one model per worker --
+    cfg.nworkers = 1
+    # cfg.devices = "cuda:0-cuda:1"
+    # cfg.nthreads = 4 # cpu threads per worker
+    # cfg.stage_nworkers = {"flow":2,"write":2} # threads per stage
+
     # -- get mesh --
     dnames = ["set8"]
     dset = ["te"]
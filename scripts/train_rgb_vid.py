@@ -26,6 +26,7 @@ import colanet.utils.gpu_mem as gpu_mem
 from colanet.utils.timer import ExpTimer
 from colanet.utils.metrics import compute_psnrs,compute_ssims
 from colanet.lightning import ColaNetLit,MetricsCallback
+from colanet.lightning import dist_trainer_kwargs,region_loader
 from colanet.utils.misc import rslice,write_pickle,read_pickle,optional
 
 # -- lightning module --
@@ -77,7 +78,7 @@ def launch_training(cfg):
     # -- init validation performance --
     init_val_report = MetricsCallback()
     logger = CSVLogger(log_dir,name="init_val_te",flush_logs_every_n_steps=1)
-    trainer = pl.Trainer(gpus=1,precision=32,limit_train_batches=1.,
+    trainer = pl.Trainer(accelerator=cfg.accelerator,devices=1,precision=32,limit_train_batches=1.,
                          max_epochs=3,log_every_n_steps=1,
                          callbacks=[init_val_report],logger=logger)
     timer.start("init_val_te")
@@ -99,8 +100,9 @@ def launch_training(cfg):
     # -- reset model --
     model.isize = cfg.isize
 
-    # -- data --
+    # -- data; region crops sharded across processes --
     data,loaders = data_hub.sets.load(cfg)
+    loader_tr = region_loader(cfg,data.tr,cfg.batch_size_tr)
     print("Num Training Vids: ",len(data.tr))
 
     # -- pytorch_lightning training --
@@ -112,14 +114,13 @@ def launch_training(cfg):
     cc_recent = ModelCheckpoint(monitor="epoch",save_top_k=10,mode="max",
                                 dirpath=cfg.checkpoint_dir,filename=chkpt_fn)
     swa_callback = StochasticWeightAveraging(swa_lrs=cfg.lr_init)
-    trainer = pl.Trainer(accelerator="gpu",devices=cfg.ndevices,precision=32,
-                         accumulate_grad_batches=cfg.accumulate_grad_batches,
+    trainer = pl.Trainer(**dist_trainer_kwargs(cfg),precision=32,
                          limit_train_batches=cfg.limit_train_batches,
                          max_epochs=cfg.nepochs-1,log_every_n_steps=1,
                          logger=logger,gradient_clip_val=0.5,
                          callbacks=[checkpoint_callback,swa_callback,cc_recent])
     timer.start("train")
-    trainer.fit(model, loaders.tr, loaders.val)
+    trainer.fit(model, loader_tr, loaders.val)
     timer.stop("train")
     best_model_path = checkpoint_callback.best_model_path
 
@@ -142,7 +143,7 @@ def launch_training(cfg):
     # -- training performance --
     tr_report = MetricsCallback()
     logger = CSVLogger(log_dir,name="train_te",flush_logs_every_n_steps=1)
-    trainer = pl.Trainer(gpus=1,precision=32,limit_train_batches=1.,
+    trainer = pl.Trainer(accelerator=cfg.accelerator,devices=1,precision=32,limit_train_batches=1.,
                          max_epochs=1,log_every_n_steps=1,
                          callbacks=[tr_report],logger=logger)
     timer.start("train_te")
@@ -155,7 +156,7 @@ def launch_training(cfg):
     # -- validation performance --
     val_report = MetricsCallback()
     logger = CSVLogger(log_dir,name="val_te",flush_logs_every_n_steps=1)
-    trainer = pl.Trainer(gpus=1,precision=32,limit_train_batches=1.,
+    trainer = pl.Trainer(accelerator=cfg.accelerator,devices=1,precision=32,limit_train_batches=1.,
                          max_epochs=1,log_every_n_steps=1,
                          callbacks=[val_report],logger=logger)
     timer.start("val_te")
@@ -234,6 +235,9 @@ def main():
     cfg.nsamples_val = 30
     cfg.nepochs = 100
     cfg.ndevices = 1
+    cfg.accelerator = "gpu"
+    cfg.dist_backend = "nccl" # "gloo" on cpus
+    cfg.crops_per_video = 1
     cfg.batch_size = 4
     cfg.batch_size_tr = 4//cfg.ndevices
     cfg.batch_size_val = 1
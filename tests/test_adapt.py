@@ -0,0 +1,157 @@
+"""
+
+Test the batched region crops of the test-time adaptation loop
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn as nn
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.utils.misc import rslice,rslice_batch,rslice_flows_batch,rscatter_add
+from colanet.utils.misc import rslice_videos,equal_regions
+from colanet.refactored.dn_gray.model.adapt import adapt_step
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+class ClipDenoiser(nn.Module):
+    """
+    A small per-frame denoiser recording the clips and flows it sees.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(1,1,3,padding=1)
+        self.calls = []
+
+    def forward(self, vid, ensemble=False, flows=None):
+        self.calls.append((vid.shape,flows))
+        return vid + self.conv(vid)
+
+def test_adapt_step_regions():
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 4,1,48,48
+    nregions,nsteps = 3,2
+    clean = th.rand((T,C,H,W))
+    zeros = th.zeros((1,T,2,H,W))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+    opt = edict({"lr":1e-3,"sigma":25.,"epochs_between_check":2})
+
+    # -- run --
+    model = ClipDenoiser()
+    adapt_step(model,clean,clean,flows,opt,nsteps=nsteps,nepochs=1,
+               nregions=nregions,region_template="2_16_16",eval_every=0)
+
+    # -- one forward per step; the regions are a batch with matching flows --
+    assert len(model.calls) == nsteps
+    for vshape,flows_r in model.calls:
+        assert tuple(vshape) == (nregions,2,C,16,16)
+        for key in ["fflow","bflow"]:
+            assert tuple(flows_r[key].shape) == (nregions,2,2,16,16)
+
+def test_rslice_batch_round_trip():
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 5,3,32,40
+    N,nT,nH,nW = 6,2,9,11
+    vid = th.randn((T,C,H,W))
+    flow = th.randn((1,T,2,H,W))
+    flows = edict({"fflow":flow,"bflow":-flow})
+
+    # -- random equal-sized regions; some overlap --
+    fs = th.randint(0,T-nT+1,(N,))
+    top = th.randint(0,H-nH+1,(N,))
+    left = th.randint(0,W-nW+1,(N,))
+    regions = th.stack([fs,fs+nT,top,left,top+nH,left+nW],1)
+
+    # -- gather matches the per-region loop --
+    crops = rslice_batch(vid,regions)
+    flows_r = rslice_flows_batch(flows,regions)
+    for n in range(N):
+        assert th.equal(crops[n],rslice(vid,regions[n]))
+        for key in ["fflow","bflow"]:
+            assert th.equal(flows_r[key][n],rslice(flows[key][0],regions[n]))
+
+    # -- scatter matches the per-region loop --
+    vid_s = th.zeros_like(vid)
+    counts = th.zeros_like(vid)
+    rscatter_add(vid_s,crops,regions,counts)
+    vid_l = th.zeros_like(vid)
+    counts_l = th.zeros_like(vid)
+    for n in range(N):
+        f0,f1,t,l,b,r = regions[n].tolist()
+        vid_l[f0:f1,:,t:b,l:r] += crops[n]
+        counts_l[f0:f1,:,t:b,l:r] += 1
+    assert th.allclose(vid_s,vid_l,atol=1e-6)
+    assert th.equal(counts,counts_l)
+
+    # -- normalized scatter recovers the covered pixels --
+    mask = counts > 0
+    assert th.allclose((vid_s/counts.clamp(min=1))[mask],vid[mask],atol=1e-6)
+
+def test_rslice_videos():
+
+    # -- params --
+    set_seed(123)
+    N,T,C,H,W = 4,5,3,24,20
+    vids = th.randn((N,T,C,H,W))
+    fs = th.randint(0,T-2+1,(N,))
+    top = th.randint(0,H-8+1,(N,))
+    left = th.randint(0,W-6+1,(N,))
+    regions = th.stack([fs,fs+2,top,left,top+8,left+6],1)
+
+    # -- region n of video n --
+    crops = rslice_videos(vids,regions)
+    assert crops.shape == (N,2,C,8,6)
+    for n in range(N):
+        assert th.equal(crops[n],rslice(vids[n],regions[n]))
+
+    # -- sizes --
+    assert equal_regions(regions)
+    regions[0,4] += 1
+    assert not(equal_regions(regions))
+
+def test_batched_forward_matches_loop():
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 4,1,48,48
+    nregions = 3
+    tol = 1e-5
+    cfg = edict({"device":"cpu","search_menu_name":"full",
+                 "search_v0":"csa","pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+
+    # -- equal-sized regions of one clip --
+    vid = th.rand((T,C,H,W))
+    flow = th.randn((1,T,2,H,W))
+    flows = edict({"fflow":flow,"bflow":-flow})
+    regions = th.tensor([[0,2,0,0,32,32],[1,3,8,16,40,48],[2,4,16,8,48,40]])
+    vid_r = rslice_batch(vid,regions)
+    flows_r = rslice_flows_batch(flows,regions)
+    assert vid_r.shape == (nregions,2,C,32,32)
+
+    # -- one batched forward vs one forward per region --
+    with th.no_grad():
+        deno = model(vid_r,flows=flows_r)
+        deno_l = []
+        for n in range(nregions):
+            flows_n = edict({k:flows_r[k][n:n+1] for k in flows_r})
+            deno_l.append(model(vid_r[n],flows=flows_n))
+        deno_l = th.stack(deno_l)
+    assert th.allclose(deno,deno_l,atol=tol,rtol=tol)
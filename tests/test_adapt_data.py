@@ -0,0 +1,108 @@
+"""
+
+Test the memmapped patch store of the adaptation image pairs and its batched augmentation
+
+"""
+
+# -- misc --
+import os,pickle
+import pytest,random
+
+# -- linalg --
+import torch as th
+import numpy as np
+import torch.utils.data as data
+
+# -- package imports [to test] --
+from colanet.utils.adapt_data import ImagePairDataSet,augment_batch
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def dihedral(x):
+    # -- the 8 flips/transposes of augment_batch --
+    outs = []
+    for hflip in [False,True]:
+        for vflip in [False,True]:
+            for transpose in [False,True]:
+                y = x.flip(-1) if hflip else x
+                y = y.flip(-2) if vflip else y
+                y = y.transpose(-1,-2) if transpose else y
+                outs.append(y)
+    return outs
+
+def sample_pair(N,C,H,W,sigma=50.):
+    clean = th.rand((N,C,H,W))
+    noisy = clean + sigma/255. * th.randn_like(clean)
+    return clean,noisy
+
+def test_image_pair_store():
+
+    # -- params --
+    set_seed(123)
+    N,C,H,W = 2,1,20,24
+    block_w,stride = 8,3
+    clean,noisy = sample_pair(N,C,H,W)
+    assert (noisy < 0).any() and (noisy > 1).any()
+
+    # -- blocks match slicing the images --
+    dset = ImagePairDataSet(block_w,images_a=clean,images_b=noisy,stride=stride)
+    nh,nw = (H - block_w)//stride + 1,(W - block_w)//stride + 1
+    assert len(dset) == N*nh*nw
+    for item in [0,7,len(dset)-1]:
+        im,row,col = np.unravel_index(item,(N,nh,nw))
+        top,left = row*stride,col*stride
+        clean_b = clean[im,:,top:top+block_w,left:left+block_w]
+        noisy_b = noisy[im,:,top:top+block_w,left:left+block_w]
+        sample_a,sample_b = dset[item]
+        assert sample_a.dtype == th.uint8 and sample_b.dtype == th.float16
+        assert (sample_a.float()/255. - clean_b).abs().max() <= 0.5/255. + 1e-6
+
+        # -- the noisy channel is not clipped or quantized to 8 bits --
+        assert th.allclose(sample_b.float(),noisy_b,atol=2e-3,rtol=1e-3)
+
+    # -- workers map the same file --
+    dset_w = pickle.loads(pickle.dumps(dset))
+    assert all([th.equal(x,y) for x,y in zip(dset_w[5],dset[5])])
+    del dset_w
+    assert os.path.exists(dset.path)
+    path = dset.path
+    dset.close()
+    assert not(os.path.exists(path))
+
+def test_image_pair_loader():
+
+    # -- params --
+    set_seed(123)
+    N,C,H,W = 2,1,16,16
+    block_w,bs = 6,5
+    clean,noisy = sample_pair(N,C,H,W)
+    dset = ImagePairDataSet(block_w,images_a=clean,images_b=noisy,stride=2)
+
+    # -- batches are float; a pair gets the same flips --
+    loader = data.DataLoader(dset,batch_size=bs,shuffle=False,
+                             collate_fn=dset.collate_fn)
+    batch_a,batch_b = next(iter(loader))
+    assert batch_a.shape == (bs,C,block_w,block_w)
+    assert batch_a.dtype == th.float32 and batch_b.dtype == th.float32
+    for i in range(bs):
+        raw_a,raw_b = dset[i]
+        raw_a,raw_b = raw_a.float()/255.,raw_b.float()
+        match = [j for j,y in enumerate(dihedral(raw_a))
+                 if th.allclose(y,batch_a[i])]
+        assert len(match) > 0
+        assert any([th.equal(dihedral(raw_b)[j],batch_b[i]) for j in match])
+    dset.close()
+
+def test_augment_batch_draws():
+
+    # -- flips are drawn per sample --
+    set_seed(123)
+    batch = th.arange(64*16,dtype=th.float32).reshape(64,1,4,4)
+    gen = th.Generator().manual_seed(0)
+    aug_a,aug_b = augment_batch(batch,batch.clone(),gen)
+    assert th.equal(aug_a,aug_b)
+    nsame = sum([th.equal(aug_a[i],batch[i]) for i in range(64)])
+    assert 0 < nsame < 64
@@ -0,0 +1,81 @@
+"""
+
+Test the batched region proposals of the adaptation loop
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.adapt_rpd import RegionProposalData,point2range,points2ranges
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"mtype":["rand","sobel"]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def test_points2ranges():
+
+    # -- every point against the scalar version --
+    for ub,reg in [(10,1),(10,4),(10,5),(10,10),(64,32),(64,33)]:
+        points = th.arange(ub)
+        pmin,pmax = points2ranges(points,reg,0,ub)
+        ref = [point2range(p,reg,0,ub) for p in range(ub)]
+        assert pmin.tolist() == [r[0] for r in ref]
+        assert pmax.tolist() == [r[1] for r in ref]
+
+def test_sample(mtype):
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 5,1,64,48
+    clean = th.rand((T,C,H,W))
+    rpd = RegionProposalData(clean,mtype,"3_32_16")
+
+    # -- regions fit the video and have the template size --
+    regions = rpd.sample(500)
+    assert regions.shape == (500,6) and regions.dtype == th.int64
+    fstart,fend,top,left,btm,right = regions.T
+    assert th.all(fend - fstart == 3) and th.all(btm - top == 32)
+    assert th.all(right - left == 16)
+    assert th.all(fstart >= 0) and th.all(fend <= T)
+    assert th.all(top >= 0) and th.all(btm <= H)
+    assert th.all(left >= 0) and th.all(right <= W)
+
+    # -- iterating pops from a buffer of samples --
+    region = next(rpd)
+    assert len(region) == 6 and len(rpd._buffer) == rpd.nbuffer - 1
+
+def test_sample_sobel_edges():
+
+    # -- points fall on the only edges: a bright square --
+    set_seed(123)
+    T,C,H,W = 2,1,64,64
+    clean = th.zeros((T,C,H,W))
+    clean[...,40:56,40:56] = 1.
+    rpd = RegionProposalData(clean,"sobel","1_8_8")
+    points = rpd.sample_points(200)
+    assert th.all(points[:,0] < T)
+    assert th.all(points[:,1:] >= 24) and th.all(points[:,1:] < 64)
+
+    # -- the cdf is built once --
+    cdf = rpd.cdf
+    rpd.sample(10)
+    assert rpd.cdf is cdf
+
+    # -- unknown methods --
+    with pytest.raises(NotImplementedError):
+        RegionProposalData(clean,"grid","1_8_8").sample(1)
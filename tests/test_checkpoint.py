@@ -0,0 +1,79 @@
+"""
+
+Test the gradients of RR with activation checkpointing against storing every activation
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+
+# -- skip without a gpu --
+pytestmark = pytest.mark.skipif(not th.cuda.is_available(),
+                                reason="requires a cuda device")
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"attn":["attn","merge"],"res_group":[0,2],
+                  "search_v0":["exact","csa"]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def get_grads(model,noisy,clean,flows):
+    model.zero_grad(set_to_none=True)
+    deno = model(noisy,flows=flows)
+    loss = th.mean((deno - clean)**2)
+    loss.backward()
+    return {name:p.grad.clone() for name,p in model.named_parameters()
+            if not(p.grad is None)}
+
+def test_checkpoint_grads(attn,res_group,search_v0):
+
+    # -- params --
+    device = "cuda:0"
+    T,C,H,W = 3,1,48,48
+    tol = 1e-4
+
+    # -- model --
+    set_seed(123)
+    cfg = edict({"device":device,"search_menu_name":"full",
+                 "search_v0":search_v0,"ws":9,"k_s":25,"k_a":25})
+    model = colanet.augmented.load_model(cfg).to(device).train()
+
+    # -- data --
+    clean = th.rand((1,T,C,H,W),device=device)
+    noisy = clean + 25./255 * th.randn_like(clean)
+    zeros = th.zeros((1,T,2,H,W),device=device)
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+
+    # -- reference; store every activation --
+    model.set_checkpoint(0,"none")
+    grads_ref = get_grads(model,noisy,clean,flows)
+
+    # -- checkpointed --
+    model.set_checkpoint(res_group,attn)
+    grads = get_grads(model,noisy,clean,flows)
+    model.set_checkpoint(0,"none")
+
+    # -- test --
+    assert grads.keys() == grads_ref.keys()
+    for name in grads_ref:
+        scale = grads_ref[name].abs().max().item() + 1e-8
+        error = (grads[name] - grads_ref[name]).abs().max().item()
+        assert error/scale < tol,name
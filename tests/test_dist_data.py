@@ -0,0 +1,59 @@
+"""
+
+Test the epoch metrics reduced across two gloo processes
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- linalg --
+import torch as th
+import torch.distributed as dist
+import torch.multiprocessing as mp
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.dist_data import reduce_means,RegionSampler
+
+KEYS = ["loss","mem_alloc","psnr"]
+SUMS = [{"loss":(3.,3),"psnr":(60.,2)}, # rank 0
+        {}] # rank 1 has no metrics this epoch
+
+def run_reduce(rank, world, init_file):
+    dist.init_process_group("gloo",init_method="file://%s" % init_file,
+                            rank=rank,world_size=world)
+    try:
+        means = reduce_means(SUMS[rank],KEYS)
+        th.save(means,"%s.%d" % (init_file,rank))
+    finally:
+        dist.destroy_process_group()
+
+@pytest.mark.skipif(not dist.is_available(),reason="requires torch.distributed")
+def test_reduce_means_gloo(tmp_path):
+
+    # -- run; a deadlock here is a failure --
+    init_file = str(tmp_path / "init")
+    mp.spawn(run_reduce,args=(2,init_file),nprocs=2,join=True)
+
+    # -- every rank sees the same means; unseen keys are dropped --
+    for rank in range(2):
+        means = th.load("%s.%d" % (init_file,rank))
+        assert sorted(means.keys()) == ["loss","psnr"]
+        assert means["loss"] == pytest.approx(1.)
+        assert means["psnr"] == pytest.approx(30.)
+
+def test_reduce_means_local():
+    assert reduce_means({},KEYS) == {}
+    means = reduce_means({"psnr":(60.,2)},KEYS)
+    assert means == {"psnr":30.}
+
+def test_region_sampler_shards():
+    dset = list(range(5))
+    world = 2
+    samplers = [RegionSampler(dset,crops_per_video=3,seed=1,rank=r,
+                              num_replicas=world) for r in range(world)]
+    shards = [list(sampler) for sampler in samplers]
+    assert len(shards[0]) == len(shards[1]) == 8
+    visits = np.bincount(shards[0] + shards[1],minlength=5)
+    assert visits.sum() == 16 and visits.min() >= 3
@@ -0,0 +1,93 @@
+"""
+
+Test the stability and collisions of the content hash of frozen configs
+
+"""
+
+# -- misc --
+import pickle
+from pathlib import Path
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.frozen_config import freeze,thaw,config_digest
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def test_digest_stable():
+
+    # -- key order, lists vs tuples and freezing don't change the digest --
+    cfg = {"ws":21,"k_s":100,"refine_inds":[False,True,True],
+           "search":{"ps":7,"dist_type":"prod"}}
+    cfg_r = {"search":{"dist_type":"prod","ps":7},
+             "refine_inds":(False,True,True),"k_s":100,"ws":21}
+    assert config_digest(cfg) == config_digest(cfg_r)
+    assert freeze(cfg).digest == config_digest(cfg)
+    assert freeze(cfg) == freeze(cfg_r) and hash(freeze(cfg)) == hash(freeze(cfg_r))
+
+    # -- round trips --
+    frozen = freeze(cfg)
+    assert pickle.loads(pickle.dumps(frozen)).digest == frozen.digest
+    assert freeze(thaw(frozen)).digest == frozen.digest
+    assert isinstance(thaw(frozen),edict) and thaw(frozen).refine_inds == [False,True,True]
+
+    # -- a fixed config has a fixed digest across runs --
+    assert config_digest({"ws":21}) == "bf755cb56a445371c74fb37d05556f0c568ac59c"
+
+def test_digest_collisions():
+
+    # -- values and types change the digest --
+    digests = [config_digest(cfg) for cfg in
+               [{"ws":21},{"ws":22},{"ws":"21"},{"ws":21.5},{"ws":[21]},
+                {"ws":True},{"ws":None},{"wt":21},{"ws":21,"wt":0}]]
+    assert len(set(digests)) == len(digests)
+
+def test_digest_arrays():
+
+    # -- large tensors differing past the truncated str --
+    set_seed(123)
+    vals = th.zeros(10000)
+    vals_m = vals.clone()
+    vals_m[5000] = 1.
+    assert str(vals) == str(vals_m)
+    assert config_digest({"w":vals}) != config_digest({"w":vals_m})
+    assert config_digest({"w":vals}) == config_digest({"w":vals.clone()})
+
+    # -- and arrays --
+    arr = np.zeros(10000)
+    arr_m = arr.copy()
+    arr_m[5000] = 1.
+    assert config_digest({"w":arr}) != config_digest({"w":arr_m})
+    assert config_digest({"w":arr}) == config_digest({"w":arr.copy()})
+
+    # -- dtype and shape are part of the digest --
+    assert config_digest({"w":vals}) != config_digest({"w":vals.double()})
+    assert config_digest({"w":vals}) != config_digest({"w":vals.reshape(100,100)})
+    assert config_digest({"w":arr}) != config_digest({"w":vals.numpy()})
+    assert config_digest({"w":vals}) != config_digest({"w":str(vals)})
+
+    # -- numpy scalars are their python values --
+    assert config_digest({"ws":np.int64(21)}) == config_digest({"ws":21})
+
+def test_digest_types():
+
+    # -- devices, dtypes and paths are tagged; not equal to their str --
+    for val in [th.device("cuda:0"),th.float32,Path("a/b")]:
+        assert config_digest({"v":val}) != config_digest({"v":str(val)})
+    assert config_digest({"v":th.device("cuda",0)}) == config_digest({"v":th.device("cuda:0")})
+    assert config_digest({"v":th.device("cpu")}) != config_digest({"v":th.device("cuda:0")})
+
+    # -- other types raise instead of hashing their repr --
+    for val in [object(),{1,2},lambda x: x]:
+        with pytest.raises(TypeError):
+            config_digest({"v":val})
@@ -0,0 +1,89 @@
+"""
+
+Test the BatchNorm folding of "RR.fuse_for_inference" against the unfused model
+
+"""
+
+# -- misc --
+import copy
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn as nn
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented.sk_conv import SKUnit
+from colanet.augmented.fuse import fuse_for_inference
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def randomize_bns(model):
+    # -- non-trivial running stats & affine params --
+    for module in model.modules():
+        if isinstance(module,nn.BatchNorm2d):
+            C = module.num_features
+            module.running_mean.copy_(0.1*th.randn(C))
+            module.running_var.copy_(0.5+th.rand(C))
+            module.weight.data.copy_(1.+0.1*th.randn(C))
+            module.bias.data.copy_(0.1*th.randn(C))
+
+def count_bns(model):
+    return sum([isinstance(m,nn.BatchNorm2d) for m in model.modules()])
+
+def test_fuse_skunit():
+
+    # -- params --
+    set_seed(123)
+    tol = 1e-5
+
+    # -- unit --
+    unit = SKUnit(in_features=64,out_features=64,M=2,G=8,r=2)
+    randomize_bns(unit)
+    unit = unit.eval()
+    fused = fuse_for_inference(copy.deepcopy(unit))
+
+    # -- test --
+    x = th.randn((2,64,16,16))
+    with th.no_grad():
+        out_ref = unit(x)
+        out = fused(x)
+    assert count_bns(fused) == 0
+    assert th.allclose(out,out_ref,atol=tol,rtol=tol)
+
+@pytest.mark.skipif(not th.cuda.is_available(),reason="requires a cuda device")
+def test_fuse_rr():
+
+    # -- params --
+    set_seed(123)
+    device = "cuda:0"
+    tol = 1e-4
+
+    # -- model --
+    cfg = edict({"device":device,"search_menu_name":"full",
+                 "search_v0":"exact","ws":9,"k_s":25,"k_a":25})
+    model = colanet.augmented.load_model(cfg).eval()
+    with th.no_grad():
+        randomize_bns(model)
+    fused = copy.deepcopy(model).fuse_for_inference()
+
+    # -- video --
+    T,H,W = 3,64,64
+    noisy = th.rand((T,1,H,W),device=device)
+    zeros = th.zeros((1,T,2,H,W),device=device)
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+
+    # -- test --
+    with th.no_grad():
+        deno_ref = model(noisy,flows=flows)
+        deno = fused(noisy,flows=flows)
+    assert count_bns(fused) == 0
+    assert th.allclose(deno,deno_ref,atol=tol,rtol=tol)
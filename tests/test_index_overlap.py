@@ -0,0 +1,86 @@
+"""
+
+Test the packed-key overlap of two neighbor sets against a brute-force set intersection
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.analysis.index_overlap import index_overlap,pairwise_index_overlap
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"radius":[0,1,2]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def sample_inds(shape,T,H,W,offset=0):
+    t = th.randint(0,T,shape)
+    h = th.randint(0,H,shape) + offset
+    w = th.randint(0,W,shape) - offset
+    return th.stack([t,h,w],-1).int()
+
+def overlap_brute(inds_a,inds_b,radius,k_s,k_p):
+    lead = inds_a.shape[:-2]
+    inds_a = inds_a.reshape(-1,inds_a.shape[-2],3)[:,:k_p].tolist()
+    inds_b = inds_b.reshape(-1,inds_b.shape[-2],3)[:,:k_s].tolist()
+    accs = []
+    for ref,qry in zip(inds_a,inds_b):
+        ref = set([tuple(x) for x in ref])
+        nfound = 0
+        for t,h,w in qry:
+            window = set([(t,h+dh,w+dw) for dh in range(-radius,radius+1)
+                          for dw in range(-radius,radius+1)])
+            nfound += len(window & ref) > 0
+        accs.append(nfound/len(qry))
+    return th.tensor(accs).reshape(lead)
+
+def test_index_overlap(radius):
+
+    # -- params; small frames so many neighbors match --
+    set_seed(123)
+    B,Q,K = 2,40,12
+    T,H,W = 3,9,7
+    inds_a = sample_inds((B,Q,K),T,H,W)
+    inds_b = sample_inds((B,Q,K),T,H,W,offset=1) # negative w's too
+    inds_b[:,:,:3] = inds_a[:,:,:3] # exact matches
+
+    # -- test --
+    for k_s,k_p in [(K,K),(5,K),(K,4),(1,1)]:
+        acc = index_overlap(inds_a,inds_b,radius,k_s,k_p)
+        ref = overlap_brute(inds_a,inds_b,radius,k_s,k_p)
+        assert acc.shape == (B,Q)
+        assert th.allclose(acc,ref.float())
+
+    # -- with itself --
+    assert th.all(index_overlap(inds_a,inds_a,radius,K,K) == 1)
+
+def test_pairwise_index_overlap(radius):
+
+    # -- params --
+    set_seed(123)
+    N,Q,K = 4,30,8
+    inds = sample_inds((N,Q,K),2,6,6)
+
+    # -- one row per pair (n0,n1) with n0 < n1 --
+    accs = pairwise_index_overlap(inds,radius,K,K)
+    assert accs.shape == (N*(N-1)//2,Q)
+    index = 0
+    for n0 in range(N-1):
+        for n1 in range(n0+1,N):
+            ref = overlap_brute(inds[n0],inds[n1],radius,K,K)
+            assert th.allclose(accs[index],ref.float())
+            index += 1
@@ -0,0 +1,116 @@
+"""
+
+Test the rung selection of the quality ladder under a deadline and a queue
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented.ladder import QualityLadder,rung_blocks
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def init_ladder():
+    # -- costs in seconds per element; profiled psnrs --
+    cfgs = [{"name":"small","ws":9,"k_s":25,"k_a":25},
+            {"name":"large","ws":21,"k_s":100,"k_a":100,"aug_test":True},
+            {"name":"mid","ws":15,"k_s":50,"k_a":50}]
+    ladder = QualityLadder(cfgs,ema=0.5)
+    for rung,cost,psnr in zip(ladder,[1e-6,8e-6,3e-6],[30.,32.,31.]):
+        rung.cost,rung.psnr = cost,psnr
+    ladder.sort()
+    return ladder
+
+def test_ladder_select():
+
+    # -- rungs are sorted by psnr --
+    ladder = init_ladder()
+    assert [rung.name for rung in ladder] == ["large","mid","small"]
+    assert ladder[0].aug_test and not(ladder[1].aug_test)
+
+    # -- the best rung within the deadline --
+    nelems = 10**6
+    assert ladder.select(nelems,10.) == 0
+    assert ladder.select(nelems,8.5) == 0
+    assert ladder.select(nelems,5.) == 1
+    assert ladder.select(nelems,2.) == 2
+
+    # -- a queue splits the budget across the backlog --
+    assert ladder.select(nelems,10.,queue_depth=1) == 1
+    assert ladder.select(nelems,10.,queue_depth=3) == 2
+
+    # -- nothing fits; the cheapest rung --
+    assert ladder.select(nelems,0.1) == 2
+    assert ladder.select(nelems,10.,queue_depth=100) == 2
+
+def test_ladder_costs():
+
+    # -- unprofiled ladders can't select --
+    ladder = QualityLadder([{"ws":9},{"ws":21}])
+    with pytest.raises(ValueError):
+        ladder.select(10**6,1.)
+
+    # -- measured costs move the choice --
+    ladder = init_ladder()
+    ladder.update_cost(0,2e-6)
+    assert ladder[0].cost == pytest.approx(5e-6)
+    assert ladder.select(10**6,5.5) == 0
+
+    # -- sorting keeps the current rung --
+    ladder.current = 2
+    ladder[0].psnr = 29.
+    ladder.sort()
+    assert ladder[ladder.current].name == "small"
+    assert [rung.name for rung in ladder] == ["mid","small","large"]
+
+def test_ladder_apply():
+
+    # -- model --
+    set_seed(123)
+    cfg = edict({"device":"cpu","search_menu_name":"full","search_v0":"csa",
+                 "ws":9,"k_s":25,"k_a":25,"pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+
+    # -- profiled rungs; name/cost/psnr/menu aren't search fields --
+    cfgs = [{"name":"small","ws":7,"k_s":20,"k_a":10,"softmax_scale":5.,
+             "search_v0":"csa","cost":1e-6,"psnr":30.},
+            {"name":"large","ws":9,"k_s":25,"k_a":25,"search_v0":"csa",
+             "aug_test":True,"cost":8e-6,"psnr":32.}]
+    ladder = QualityLadder(cfgs)
+    for block in rung_blocks(ladder[0]):
+        assert not({"name","cost","psnr","aug_test","search_v0"} & set(block))
+        assert block.search_name == "csa"
+
+    # -- applying a rung swaps the search of every block --
+    ladder.apply(model,0)
+    for i in range(3):
+        ca_i = getattr(model.msa,'c%d'%(i+1)).CAUnit
+        assert ca_i.search_cfg.ws == 7 and ca_i.k_s == 20
+        assert ca_i.k_a == 10 and ca_i.softmax_scale == 5.
+        assert ca_i.search_name == "csa"
+    ladder.apply(model,1)
+    assert model.msa.c3.CAUnit.search_cfg.ws == 9
+    assert model.msa.c3.CAUnit.k_a == 25
+
+    # -- and runs the rung that fits --
+    T,C,H,W = 3,1,32,32
+    vid = th.rand((T,C,H,W))
+    zeros = th.zeros((1,T,2,H,W))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+    ladder.sort()
+    deno,index = ladder.run(model,vid,flows,deadline=1e-3*T*H*W)
+    assert ladder[index].name == "large" and deno.shape == vid.shape
+    assert ladder.current == index
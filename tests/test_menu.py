@@ -0,0 +1,81 @@
+"""
+
+Test the search schedules of the menu and the indices they share
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.augmented.menu import parse_schedule,plan_schedule,estimate_cost
+from colanet.augmented.io import search_pairs
+
+def base_cfg():
+    return edict(search_pairs())
+
+def test_parse_schedule():
+    schedule = "exact:ws=21:k=100:s=4/refine:wr=3:k=50:kr=.5/refine:k=30:ka=-1"
+    blocks = parse_schedule(schedule,[3])
+    assert len(blocks) == 3
+    assert [b.search_name for b in blocks] == ["exact","refine","refine"]
+    assert (blocks[0].ws,blocks[0].k_s,blocks[0].stride0) == (21,100,4)
+    assert (blocks[1].wr,blocks[1].k_s,blocks[1].kr) == (3,50,0.5)
+    assert (blocks[2].k_s,blocks[2].k_a) == (30,-1)
+    assert all([b.use_state_update for b in blocks])
+
+def test_parse_schedule_single():
+    blocks = parse_schedule("exact:ka=-1",[3])
+    assert len(blocks) == 3
+    assert all([b.k_a == -1 for b in blocks])
+    assert not(any([b.use_state_update for b in blocks]))
+
+@pytest.mark.parametrize("schedule",["exact/exact","exact:foo=1",
+                                     "exact:ws21","exact:ws=1=2"])
+def test_parse_schedule_errors(schedule):
+    with pytest.raises(ValueError):
+        parse_schedule(schedule,[3])
+
+def test_plan_schedule():
+
+    # -- valid --
+    blocks = parse_schedule("exact:k=100/refine:wr=1:k=50/refine:wr=1:k=30",[3])
+    plan = plan_schedule(blocks,base_cfg())
+    assert [cfg.k_s for cfg in plan] == [100,50,30]
+    costs,total = estimate_cost(blocks,base_cfg(),(3,3,64,64))
+    assert costs[1].search < costs[0].search
+    assert total == sum([cost.total for cost in costs])
+
+    # -- invalid sharing --
+    for schedule in ["refine/exact/exact","exact:s=4/refine:s=2/exact",
+                     "exact:k=10/refine:wr=1:k=50/exact"]:
+        with pytest.raises(ValueError):
+            plan_schedule(parse_schedule(schedule,[3]),base_cfg())
+
+def test_update_state_order():
+    nl_attn = pytest.importorskip("colanet.augmented.nl_attn")
+
+    # -- a block's search state --
+    self = edict({"use_state_update":True,"stride0":4})
+    self.inds_rs0 = lambda inds,nH,nW: nl_attn.inds_rs0(self,inds,nH,nW)
+    T,H,W,K = 2,16,16,5
+    vshape = (T,3,H,W)
+    Q = T*((H-1)//4+1)*((W-1)//4+1)
+    inds_a = th.randint(0,T,(1,1,Q,K,3))
+    inds_b = th.randint(0,T,(1,1,Q,K,3))
+
+    # -- the newest indices are in state[0]; read by the next "refine" --
+    state = [None,None]
+    nl_attn.update_state(self,state,None,inds_a,vshape)
+    assert th.equal(nl_attn.inds_rs1(self,state[0]),inds_a)
+    assert state[1] is None
+    nl_attn.update_state(self,state,None,inds_b,vshape)
+    assert th.equal(nl_attn.inds_rs1(self,state[0]),inds_b)
+    assert th.equal(nl_attn.inds_rs1(self,state[1]),inds_a)
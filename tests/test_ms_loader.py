@@ -0,0 +1,83 @@
+"""
+
+Test the batches, scales and samplers of the multi-scale loader
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+from torch.utils.data import BatchSampler,SequentialSampler
+
+# -- package imports [to test] --
+from colanet.utils.ms_loader import MSDataLoader
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+class ScaledRange(th.utils.data.Dataset):
+    """
+    Returns (index,scale) for the current scale.
+    """
+
+    def __init__(self, n, scale):
+        self.n = n
+        self.scale = scale
+        self.idx_scale = 0
+        self.train = True
+
+    def set_scale(self, idx_scale):
+        self.idx_scale = idx_scale
+
+    def __getitem__(self, index):
+        return index,self.scale[self.idx_scale]
+
+    def __len__(self):
+        return self.n
+
+def run_epoch(loader, epoch=0):
+    loader.set_epoch(epoch)
+    batches = []
+    for inds,scales,idx_scale in loader:
+        assert (scales == loader.scale[idx_scale]).all() # one scale per batch
+        batches.append((inds.tolist(),idx_scale))
+    return batches
+
+def test_ms_loader_epochs():
+
+    # -- params --
+    set_seed(123)
+    args = edict({"scale":[1,2,3],"n_threads":0,"seed":1})
+    dset = ScaledRange(22,args.scale)
+
+    # -- every index once per epoch; reproducible for a seed and epoch --
+    loader = MSDataLoader(args,dset,batch_size=4,shuffle=True)
+    batches = run_epoch(loader)
+    assert len(batches) == len(loader) == 6
+    assert sorted(sum([b[0] for b in batches],[])) == list(range(22))
+    assert batches == run_epoch(loader)
+    assert batches != run_epoch(loader,epoch=1)
+    assert len(set([b[1] for b in run_epoch(loader,epoch=2)])) > 1
+
+def test_ms_loader_batch_sampler():
+
+    # -- a plain batch sampler is wrapped --
+    args = edict({"scale":[1,2],"n_threads":0,"seed":1})
+    dset = ScaledRange(10,args.scale)
+    bsampler = BatchSampler(SequentialSampler(dset),3,drop_last=True)
+    loader = MSDataLoader(args,dset,batch_sampler=bsampler)
+    batches = run_epoch(loader)
+    assert [b[0] for b in batches] == list(bsampler)
+    assert len(loader) == 3
+
+    # -- and exclusive with the batching options --
+    with pytest.raises(ValueError,match="mutually exclusive"):
+        MSDataLoader(args,dset,batch_size=2,batch_sampler=bsampler)
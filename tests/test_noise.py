@@ -0,0 +1,84 @@
+"""
+
+Test the seeds of the on-device noise model
+
+"""
+
+# -- misc --
+import pytest,random
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.noise import NoiseModel,sample_seed,counter_seed
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def test_sample_seed():
+
+    # -- each field changes the seed --
+    regions = [None,[0,3,0,0,64,64],[0,3,8,0,72,64],[0,3,0,8,64,72],[1,4,0,0,64,64]]
+    seeds = []
+    for video,frame,region,step in itertools.product([0,1,7],[0,5],regions,[0,1,2]):
+        seeds.append(sample_seed(123,video,frame,region,step))
+    assert len(set(seeds)) == len(seeds)
+
+    # -- and the base seed --
+    assert sample_seed(123) != sample_seed(124)
+
+    # -- stable; a tensor region gives the same seed --
+    region = [0,3,8,0,72,64]
+    assert sample_seed(123,1,5,region,2) == sample_seed(123,1,5,th.tensor(region),2)
+    assert sample_seed(123,1,5,region,2) == sample_seed(123,1,5,region,2)
+
+    # -- micro-batches of one global step --
+    steps = [counter_seed(epoch,batch_idx,0) for epoch in range(3)
+             for batch_idx in range(8)]
+    assert len(set(steps)) == len(steps)
+
+def test_noise_reproducible():
+
+    # -- params --
+    set_seed(123)
+    B,T,C,H,W = 3,4,1,16,16
+    clean = th.rand((B,T,C,H,W))
+    videos = th.tensor([4,2,4])
+    regions = th.tensor([[0,4,0,0,16,16],[0,4,0,0,16,16],[1,5,2,3,18,19]])
+    sim = NoiseModel("pg",sigma=[10.,50.],gain=0.01,seed=123)
+
+    # -- a batch matches drawing each sample alone --
+    noisy = sim(clean,video=videos,region=regions,step=3)
+    for b in range(B):
+        noisy_b = sim(clean[b],video=int(videos[b]),region=regions[b],step=3)
+        assert th.equal(noisy[b],noisy_b)
+
+    # -- the crop region and step change the draw --
+    noise = noisy - clean
+    assert not th.allclose(noise[0],noise[2])
+    noisy_s = sim(clean,video=videos,region=regions,step=4)
+    assert not th.allclose(noisy_s,noisy)
+
+    # -- frames of one clip are independent --
+    noise_g = NoiseModel("g",sigma=25.)(th.zeros((T,C,H,W)))
+    for t in range(1,T):
+        assert not th.allclose(noise_g[0],noise_g[t])
+
+def test_noise_threads():
+
+    # -- concurrent draws on one device match the serial draws --
+    set_seed(123)
+    clean = th.rand((4,1,32,32))
+    sim = NoiseModel("pg",sigma=[10.,50.],gain=0.01,seed=123)
+    draw = lambda video: sim(clean,video=video,step=1)
+    refs = [draw(video) for video in range(32)]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for _ in range(4):
+            noisy = list(pool.map(draw,range(32)))
+            assert all([th.equal(x,y) for x,y in zip(noisy,refs)])
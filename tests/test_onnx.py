@@ -0,0 +1,112 @@
+"""
+
+Test the ONNX export of RR (csa attention) against pytorch with onnxruntime
+and the reference implementations of the custom ops against dense attention
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented import onnx_export
+from colanet.augmented.static import patches
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"dist_type":["prod","l2"]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def dense_dists(q, k, ps, dist_type):
+    # -- every pair of patches within a frame; (T,Q,Q) --
+    p0 = patches(q,ps,1).transpose(1,2)
+    p1 = patches(k,ps,1)
+    dists = p0 @ p1
+    if dist_type == "l2":
+        sq0 = (p0**2).sum(-1)[...,:,None]
+        sq1 = (p1**2).sum(-2)[...,None,:]
+        dists = sq0 + sq1 - 2*dists
+    return dists
+
+def test_onnx_csa(tmp_path):
+
+    # -- skip without onnx --
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+
+    # -- params --
+    set_seed(123)
+    vshape = (3,1,64,64)
+    tol = 1e-4
+    verbose = False
+
+    # -- model --
+    cfg = edict({"device":"cpu","search_menu_name":"full",
+                 "search_v0":"csa","pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+    path = str(tmp_path / "rr_csa.onnx")
+    onnx_export.export_onnx(model,path,vshape)
+
+    # -- video --
+    vid,fflow,bflow = onnx_export.sample_inputs(vshape)
+    flows = edict({"fflow":fflow,"bflow":bflow})
+
+    # -- test --
+    with th.no_grad():
+        deno_ref = model(vid,flows=flows)
+    deno = onnx_export.run_onnx(path,vid,fflow,bflow)
+    assert deno.shape == deno_ref.shape
+    assert th.allclose(deno,deno_ref,atol=tol,rtol=tol)
+
+    # -- latency --
+    report = onnx_export.compare_latency(model,path,vshape,nreps=3)
+    if verbose: print(report)
+    assert report.max_diff < tol
+
+def test_ref_ops_dense(dist_type):
+
+    # -- params; the window covers the frame so the search is dense --
+    set_seed(123)
+    T,C,H,W = 2,3,8,8
+    ps,ws,wt,scale = 3,8,0,2.
+    Q = H*W
+    tol = 1e-4
+    q,k,v = [th.rand((1,T,C,H,W)) for _ in range(3)]
+
+    # -- search; the k_s = Q best are every patch of the same frame --
+    dists,inds = onnx_export.ref_search(q,k,ws,wt,ps,Q,1,dist_type)
+    assert dists.shape == (1,1,T*Q,Q) and inds.shape == (1,1,T*Q,Q,3)
+    dists_d = dense_dists(q[0],k[0],ps,dist_type)
+    sorted_d = dists_d.sort(-1,descending=dist_type == "prod").values
+    assert th.allclose(dists[0,0].reshape(T,Q,Q),sorted_d,atol=tol,rtol=tol)
+    inds = inds[0,0].long().reshape(T,Q,Q,3)
+    frames = th.arange(T)[:,None,None].expand(-1,Q,Q)
+    assert th.equal(inds[...,0],frames)
+    gathered = th.gather(dists_d,-1,inds[...,1]*W + inds[...,2])
+    assert th.allclose(dists[0,0].reshape(T,Q,Q),gathered,atol=tol,rtol=tol)
+
+    # -- aggregate; dense softmax-weighted sum folded as in "csa_attn" --
+    sign = -1 if dist_type == "l2" else 1
+    weights = th.softmax(sign*scale*dists,-1)
+    y = onnx_export.ref_agg_fold(v,weights,inds.reshape(1,1,T*Q,Q,3),ps,1)
+    zi = th.softmax(sign*scale*dists_d,-1) @ patches(v[0],ps,1).transpose(1,2)
+    zi = zi.transpose(1,2)
+    fold = lambda x: th.nn.functional.fold(x,(H,W),ps,padding=ps//2)
+    y_d = fold(zi) / fold(th.ones_like(zi))
+    assert th.allclose(y[0],y_d,atol=tol,rtol=tol)
@@ -0,0 +1,140 @@
+"""
+
+Test the order, errors and per-thread setup of the bounded-queue pipeline
+and the sharding of videos across worker processes
+
+"""
+
+# -- misc --
+import os,time
+import pytest,random
+import threading
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.pipeline import Pipeline
+from colanet.utils import parallel
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+# -- module-level stages; picklable for the spawn pool --
+def init_stage(cfg,device,offset=0):
+    return {"offset":offset,"device":device,"pid":os.getpid()}
+
+def add_stage(ctx,index):
+    time.sleep(random.random()*1e-3)
+    return index + ctx["offset"]
+
+def out_stage(ctx,val):
+    return {"val":val,"device":ctx["device"],"pid":ctx["pid"]}
+
+def jitter(fxn):
+    # -- finish out of order --
+    def wrap(x):
+        time.sleep(random.random()*1e-3)
+        return fxn(x)
+    return wrap
+
+def test_pipeline_order():
+    set_seed(123)
+    stages = [("a",jitter(lambda x: x+1),3),
+              ("b",jitter(lambda x: 2*x),4),
+              ("c",jitter(lambda x: x-3),2)]
+    pipe = Pipeline(stages,qsize=2)
+    items = list(range(50))
+    outs = pipe.run(items)
+    assert outs == [2*(x+1)-3 for x in items]
+    stats = pipe.stats()
+    assert [stats[name].nitems for name in "abc"] == [50,50,50]
+    assert all([stats[name].max_depth <= 2 for name in "abc"])
+
+def test_pipeline_error():
+
+    # -- an error mid-stream is raised after draining; no deadlock --
+    def fail(x):
+        if x == 7: raise ValueError("bad item [%d]" % x)
+        return x
+    seen = []
+    stages = [("a",lambda x: x,2),("b",fail,2),("c",seen.append,1)]
+    pipe = Pipeline(stages,qsize=1)
+    with pytest.raises(ValueError,match="bad item"):
+        pipe.run(range(40))
+    assert not(7 in seen)
+
+    # -- the pipeline is reusable afterwards --
+    pipe = Pipeline([("a",lambda x: x,1)],qsize=1)
+    assert pipe.run(range(5)) == list(range(5))
+
+def test_pipeline_thread_init():
+
+    # -- every stage thread runs the init before its items --
+    local = threading.local()
+    ninit = []
+    def thread_init():
+        local.ready = True
+        ninit.append(1)
+    def check(x):
+        assert getattr(local,"ready",False)
+        return x
+    stages = [("a",check,2),("b",check,3)]
+    pipe = Pipeline(stages,qsize=2,thread_init=thread_init)
+    assert pipe.run(range(10)) == list(range(10))
+    assert len(ninit) == 5
+
+def test_run_pipeline_ctx():
+    steps = [("add",lambda ctx,x: x + ctx["offset"]),
+             ("sq",lambda ctx,x: {"val":x*x})]
+    outs = parallel.run_pipeline({"offset":1},[3,1,2],steps,verbose=False)
+    assert outs == [(3,{"val":16}),(1,{"val":4}),(2,{"val":9})]
+    results = parallel.merge_results(outs,[1,2,3])
+    assert results["val"] == [4,9,16]
+
+def test_shard():
+
+    # -- shards are disjoint and cover every index --
+    indices = list(range(3,20))
+    for nworkers in [1,2,3,5,40]:
+        shards = parallel.shard(indices,nworkers)
+        assert len(shards) == nworkers
+        flat = [index for shard in shards for index in shard]
+        assert sorted(flat) == indices
+        assert len(set(flat)) == len(flat)
+
+def test_merge_results_order():
+
+    # -- per-video outputs merge back in the order of the indices --
+    set_seed(123)
+    indices = [5,2,9,0,7]
+    outs = [(index,{"val":[index],"name":"v%d"%index}) for index in indices]
+    random.shuffle(outs)
+    results = edict({"val":[-1]})
+    results = parallel.merge_results(outs,indices,results)
+    assert results.val == [-1] + [[index] for index in indices]
+    assert results.name == ["v%d" % index for index in indices]
+
+def test_run_sharded():
+
+    # -- two workers; each runs its own shard on its own device --
+    cfg = edict({"devices":["cpu","cpu"]})
+    stages = edict({"init":init_stage,"init_kwargs":{"offset":10},
+                    "steps":[("add",add_stage),("out",out_stage)]})
+    indices = [4,1,8,3,6,0,2]
+    results = parallel.run_sharded(cfg,indices,stages,nworkers=2)
+    assert results.val == [index+10 for index in indices]
+    assert results.device == ["cpu"]*len(indices)
+    pids = set(results.pid)
+    assert len(pids) == 2 and not(os.getpid() in pids)
+
+    # -- one worker runs in this process --
+    results = parallel.run_sharded(cfg,indices,stages,nworkers=1)
+    assert results.val == [index+10 for index in indices]
+    assert set(results.pid) == {os.getpid()}
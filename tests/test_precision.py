@@ -0,0 +1,118 @@
+"""
+
+Test the mixed-precision / channels_last inference modes against fp32
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented import csa_attn
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"precision":["bf16","fp16"],"channels_last":[False,True]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def get_video(device,T=3,H=64,W=64):
+    # -- smooth random video with noise --
+    clean = th.rand((1,1,8,8),device=device)
+    clean = th.nn.functional.interpolate(clean,(H,W),mode="bilinear")
+    clean = clean.repeat(T,1,1,1)
+    noisy = clean + 25./255 * th.randn_like(clean)
+    return noisy
+
+def get_flows(vid):
+    T,C,H,W = vid.shape
+    zeros = th.zeros((1,T,2,H,W),device=vid.device)
+    return edict({"fflow":zeros,"bflow":zeros.clone()})
+
+def compute_psnr(deno,ref):
+    mse = th.mean((deno.float() - ref.float())**2).item()
+    return -10 * np.log10(mse + 1e-12)
+
+@pytest.mark.skipif(not th.cuda.is_available(),reason="requires a cuda device")
+def test_precision(precision,channels_last):
+
+    # -- params --
+    device = "cuda:0"
+    min_psnr = 35. # vs fp32 on [0,1] images
+    verbose = True
+
+    # -- model --
+    cfg = edict({"device":device,"search_menu_name":"full",
+                 "search_v0":"exact","ws":9,"k_s":25,"k_a":25})
+    model = colanet.augmented.load_model(cfg).eval()
+    noisy = get_video(device)
+    flows = get_flows(noisy)
+
+    # -- fp32 reference --
+    with th.no_grad():
+        deno_ref = model(noisy,flows=flows)
+
+    # -- reduced precision --
+    model.set_precision(precision,channels_last)
+    with th.no_grad():
+        deno = model(noisy,flows=flows)
+    model.set_precision("single",False)
+
+    # -- test --
+    assert deno.dtype == noisy.dtype
+    assert deno.shape == deno_ref.shape
+    psnr = compute_psnr(deno,deno_ref)
+    if verbose: print("psnr vs fp32: %2.2f" % psnr)
+    assert psnr > min_psnr
+
+def test_precision_csa_cpu(monkeypatch):
+
+    # -- params --
+    set_seed(123)
+    device = "cpu"
+    min_psnr = 35. # vs fp32 on [0,1] images
+
+    # -- model --
+    cfg = edict({"device":device,"search_menu_name":"full",
+                 "search_v0":"csa","pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+    noisy = get_video(device,H=32,W=32)
+    flows = get_flows(noisy)
+
+    # -- fp32 reference --
+    with th.no_grad():
+        deno_ref = model(noisy,flows=flows)
+
+    # -- record the dtype reaching the fold --
+    dtypes = []
+    def th_fold(zi,*args,**kwargs):
+        dtypes.append(zi.dtype)
+        return th.nn.functional.fold(zi,*args,**kwargs)
+    monkeypatch.setattr(csa_attn,"th_fold",th_fold)
+
+    # -- bf16 trunk; the attention stays fp32 --
+    model.set_precision("bf16",False)
+    with th.no_grad():
+        deno = model(noisy,flows=flows)
+    model.set_precision("single",False)
+    assert len(dtypes) > 0 and all([d == th.float32 for d in dtypes])
+
+    # -- test --
+    assert deno.dtype == noisy.dtype
+    assert deno.shape == deno_ref.shape
+    assert compute_psnr(deno,deno_ref) > min_psnr
@@ -0,0 +1,100 @@
+"""
+
+Test the temporal chopping of "get_fwd_fxn" with and without propagation,
+and the shifting of the search indices between windows
+
+"""
+
+# -- misc --
+import pytest,random
+from functools import partial
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.proc_utils import get_fwd_fxn,ChopState,shift_inds
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def chop_cfg(aug_test):
+    return edict({"spatial_crop_size":0,"spatial_crop_overlap":0,
+                  "temporal_crop_size":3,"temporal_crop_overlap":0.5,
+                  "temporal_crop_propagate":True,"aug_test":aug_test})
+
+def test_propagate_state():
+
+    # -- a model taking the carried state --
+    states = []
+    def model(vid,flows=None,state=None):
+        states.append(state)
+        return 2*vid
+
+    # -- run --
+    set_seed(123)
+    vid = th.rand((1,5,1,8,8))
+    fwd_fxn = get_fwd_fxn(chop_cfg(False),model)
+    deno = fwd_fxn(vid,None)
+    assert th.allclose(deno,2*vid)
+    assert len(states) > 1
+    assert all([isinstance(state,ChopState) for state in states])
+
+def test_aug_test_no_propagate():
+
+    # -- "test_x8" has no state argument --
+    def model(vid,flows=None):
+        return 2*vid
+    def aug_fxn(model,vid,flows=None,use_refine=False):
+        return model(vid,flows)
+    aug_model = partial(aug_fxn,model,use_refine=False)
+
+    # -- run --
+    set_seed(123)
+    vid = th.rand((1,5,1,8,8))
+    fwd_fxn = get_fwd_fxn(chop_cfg(True),aug_model)
+    deno = fwd_fxn(vid,None)
+    assert th.allclose(deno,2*vid)
+
+def frame_inds(frames,nHW=2,k=2):
+    # -- (1,1,(T nHW),k,3); the frame of each neighbor, then (t,q) as (h,w) --
+    T = len(frames)
+    inds = th.zeros((1,1,T,nHW,k,3),dtype=th.int32)
+    for t in range(T):
+        inds[...,t,:,:,0] = frames[t]
+        inds[...,t,:,:,1] = t
+        inds[...,t,:,:,2] = th.arange(nHW,dtype=th.int32)[:,None]
+    return inds.view(1,1,T*nHW,k,3)
+
+def test_shift_inds():
+
+    # -- equal windows: frames move back by "delta"; new frames are clamped --
+    inds = frame_inds([0,2,2])
+    seeds = shift_inds(inds,1,3).view(1,1,3,2,2,3)
+    assert seeds[0,0,:,0,0,0].tolist() == [1,1,2]
+    assert seeds[0,0,:,0,0,1].tolist() == [1,2,2]
+    assert th.equal(seeds[...,2],inds.view(1,1,3,2,2,3)[...,2])
+
+    # -- a shorter last window takes the frames it overlaps --
+    inds = frame_inds([1,0,2,3])
+    seeds = shift_inds(inds,2,2,4)
+    assert seeds.shape == (1,1,4,2,3)
+    seeds = seeds.view(1,1,2,2,2,3)
+    assert seeds[0,0,:,0,0,0].tolist() == [0,1]
+    assert seeds[0,0,:,0,0,1].tolist() == [2,3]
+
+    # -- and a longer one repeats the last frame --
+    seeds = shift_inds(frame_inds([0,1]),1,3,2).view(1,1,3,2,2,3)
+    assert seeds[0,0,:,0,0,0].tolist() == [0,1,2]
+    assert seeds[0,0,:,0,0,1].tolist() == [1,1,1]
+
+    # -- no overlap, no seeds; "inds" must match the previous window --
+    assert shift_inds(frame_inds([0,1]),2,2) is None
+    with pytest.raises(AssertionError):
+        shift_inds(frame_inds([0,1,2]),1,3,4)
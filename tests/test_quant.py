@@ -0,0 +1,71 @@
+"""
+
+Test the int8 trunk of RR round-trips through export and load on the cpu
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented import quant
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def sample_clip(T,C,H,W):
+    clean = th.rand((T,C,H,W))
+    noisy = clean + 25./255 * th.randn_like(clean)
+    zeros = th.zeros((1,T,2,H,W))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+    return noisy,flows
+
+def test_quant_round_trip(tmp_path):
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 3,1,32,32
+    backend = "fbgemm"
+    if not(backend in th.backends.quantized.supported_engines):
+        pytest.skip("requires the %s engine" % backend)
+
+    # -- model --
+    cfg = edict({"device":"cpu","search_menu_name":"full",
+                 "search_v0":"csa","pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+
+    # -- calibrate, export and load --
+    calib = [sample_clip(T,C,H,W) for _ in range(2)]
+    qmodel = quant.quantize_model(model,calib,backend)
+    path = str(tmp_path / "rr_int8.pt")
+    quant.export_quantized(qmodel,path,backend)
+    qmodel_l = quant.load_quantized(model,path)
+
+    # -- every conv of the SKUnits is int8; the attention convs are float --
+    for i in range(3):
+        skunit = getattr(qmodel.msa,'c%d'%(i+1)).SKUnit
+        assert quant.count_convs(skunit)[1] == 0
+    nint8,nfloat = quant.count_convs(qmodel)
+    assert nint8 > 0 and nfloat == quant.count_convs(qmodel.msa)[1]
+
+    # -- the loaded model matches the calibrated one --
+    noisy,flows = sample_clip(T,C,H,W)
+    with th.no_grad():
+        deno_f = model(noisy,flows=flows)
+        deno_q = qmodel(noisy,flows=flows)
+        deno_l = qmodel_l(noisy,flows=flows)
+    assert deno_l.shape == deno_f.shape
+    assert th.allclose(deno_l,deno_q,atol=1e-5,rtol=1e-5)
+
+    # -- and stays near float --
+    assert (deno_q - deno_f).abs().mean().item() < 5e-2
@@ -0,0 +1,119 @@
+"""
+
+Test the recall metrics of the search benchmark against brute-force full attention and top-k
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn.functional as F
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.bench.recall import full_attention,attention_metrics,pareto
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def full_attention_brute(vid,ps,stride0):
+    B,T,C,H,W = vid.shape
+    pad = ps//2
+    vid_p = F.pad(vid.reshape(B*T,C,H,W),(pad,)*4,mode="reflect")
+    vid_p = vid_p.reshape(B,T,C,H+2*pad,W+2*pad)
+    patch = lambda h,w: vid_p[...,h:h+ps,w:w+ps].reshape(B,T,-1)
+    keys = th.stack([patch(h,w) for h in range(H) for w in range(W)],2)
+    qrys = th.stack([patch(h,w) for h in range(0,H,stride0)
+                     for w in range(0,W,stride0)],2)
+    return th.einsum("btqf,btnf->btqn",qrys,keys)
+
+def topk_neighbors(logits,k,T,W):
+    # -- the k best keys of each query in the stnls layout --
+    B,_,Q,_ = logits.shape
+    dists,order = th.topk(logits,k,-1)
+    ti = th.arange(T).view(1,T,1,1).expand_as(order)
+    inds = th.stack([ti,order // W,order % W],-1)
+    dists = dists.reshape(B,1,T*Q,k)
+    inds = inds.reshape(B,1,T*Q,k,3).int()
+    return dists,inds
+
+def test_full_attention():
+    set_seed(123)
+    vid = th.randn((1,2,3,9,10))
+    for stride0 in [1,3]:
+        logits = full_attention(vid,3,stride0)
+        ref = full_attention_brute(vid,3,stride0)
+        assert logits.shape == ref.shape
+        assert th.allclose(logits,ref,atol=1e-4,rtol=1e-4)
+
+def test_attention_metrics_topk():
+
+    # -- params --
+    set_seed(123)
+    B,T,C,H,W = 1,2,3,8,8
+    scale,stride0 = 2.,2
+    vid = th.randn((B,T,C,H,W))
+    logits = full_attention(vid,3,stride0)
+    probs = F.softmax(scale*logits,-1)
+    vals = vid.permute(0,1,3,4,2).reshape(B,T,H*W,C)
+    out_full = probs @ vals
+
+    # -- every key: full recall, no error --
+    dists,inds = topk_neighbors(logits,H*W,T,W)
+    recall,error = attention_metrics(vid,logits,dists,inds,scale,stride0)
+    assert recall == pytest.approx(1.,abs=1e-5) and error < 1e-5
+
+    # -- the top-k: their mass and the truncated softmax output --
+    for k in [1,5,20]:
+        dists,inds = topk_neighbors(logits,k,T,W)
+        recall,error = attention_metrics(vid,logits,dists,inds,scale,stride0)
+        top_p,order = th.topk(probs,k,-1)
+        assert recall == pytest.approx(top_p.sum(-1).mean().item(),abs=1e-5)
+        weights = F.softmax(scale*th.topk(logits,k,-1).values,-1)
+        nbrs = th.gather(vals[:,:,None].expand(-1,-1,order.shape[2],-1,-1),3,
+                         order[...,None].expand(-1,-1,-1,-1,C))
+        out = (weights[...,None]*nbrs).sum(-2)
+        ref = (th.linalg.norm(out-out_full)/th.linalg.norm(out_full)).item()
+        assert error == pytest.approx(ref,rel=1e-4,abs=1e-6)
+
+def test_attention_metrics_repeats():
+
+    # -- a neighbor repeated k times covers its mass once --
+    set_seed(123)
+    B,T,C,H,W = 1,1,2,6,6
+    scale,stride0 = 1.,3
+    vid = th.randn((B,T,C,H,W))
+    logits = full_attention(vid,3,stride0)
+    probs = F.softmax(scale*logits,-1)
+    dists,inds = topk_neighbors(logits,1,T,W)
+    recall_1,_ = attention_metrics(vid,logits,dists,inds,scale,stride0)
+    dists_r,inds_r = dists.repeat(1,1,1,4),inds.repeat(1,1,1,4,1)
+    recall_r,_ = attention_metrics(vid,logits,dists_r,inds_r,scale,stride0)
+    assert recall_r == pytest.approx(recall_1,abs=1e-6)
+    assert recall_1 == pytest.approx(probs.max(-1).values.mean().item(),abs=1e-6)
+
+    # -- neighbors in other frames are not counted --
+    inds_o = inds.clone()
+    inds_o[...,0] = 1
+    recall_o,_ = attention_metrics(vid,logits,dists,inds_o,scale,stride0)
+    assert recall_o == 0.
+
+def test_pareto():
+    rows = [edict({"name":"a","time":1.,"recall":0.5}),
+            edict({"name":"b","time":2.,"recall":0.4}), # dominated by a
+            edict({"name":"c","time":2.,"recall":0.8}),
+            edict({"name":"d","time":3.,"recall":0.8}), # ties c, slower
+            edict({"name":"e","time":0.5,"recall":0.2}),
+            edict({"name":"f","time":4.,"recall":0.95}),
+            edict({"name":"g","time":1.,"recall":0.3})] # ties a, worse
+    front = pareto(rows)
+    assert [row.name for row in front] == ["e","a","c","f"]
+    front = pareto(rows,x="recall",y="time") # any pair of keys
+    assert front[0].name == "e"
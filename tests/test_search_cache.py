@@ -0,0 +1,115 @@
+"""
+
+Test the keys of the search cache
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn as nn
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.augmented.search_cache import digest,WeightsVersion,search_cache_key
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def cache_unit():
+    unit = edict()
+    unit.search_cache_name = "msa.c1.CAUnit"
+    unit.search_cache_input = None
+    unit.search_name = "exact"
+    unit.seed_inds = None
+    unit.search_cfg = edict({"ws":21,"wt":0,"k_s":100,"k_a":100,
+                             "softmax_scale":10,"agg_fxn":"wpsum",
+                             "use_state_update":False})
+    return unit
+
+def near_inputs(x):
+    """
+    Inputs close to "x" with matching shapes and most moments.
+    """
+    vids = [x.clone() for _ in range(5)]
+    vids[0].view(-1)[0] = th.nextafter(x.view(-1)[0],th.tensor(2.))
+    vids[1].view(-1)[[0,-1]] = x.view(-1)[[-1,0]] # swap the ends
+    vids[2] = x.flip(-1)
+    vids[3] = x.transpose(-1,-2).contiguous()
+    vids[4] = x.to(th.float16).to(x.dtype)
+    return vids
+
+def test_distinct_inputs_distinct_keys():
+
+    # -- inputs --
+    set_seed(123)
+    x = th.rand((3,4,16,16))
+    vids = [x] + near_inputs(x)
+    vids += [th.rand((3,4,16,16)) for _ in range(20)]
+    vids += [x.reshape(3,4,8,32),x.double()]
+
+    # -- one key per input --
+    unit = cache_unit()
+    keys = [search_cache_key(unit,vid,None,[None,None]) for vid in vids]
+    assert len(set(keys)) == len(keys)
+
+    # -- the same input gives the same key --
+    assert search_cache_key(unit,x.clone(),None,[None,None]) == keys[0]
+    assert digest(x) == digest(x.clone())
+
+    # -- flows are part of the key --
+    zeros = th.zeros((1,3,2,16,16))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+    key_f = search_cache_key(unit,x,flows,[None,None])
+    flows.fflow = flows.fflow + 1e-6
+    assert len(set([keys[0],key_f,search_cache_key(unit,x,flows,[None,None])])) == 3
+
+def test_aggregation_fields_share_keys():
+
+    # -- the aggregation doesn't change the search; same key --
+    set_seed(123)
+    x = th.rand((3,4,16,16))
+    unit = cache_unit()
+    key = search_cache_key(unit,x,None,[None,None])
+    for field,val in [("k_a",50),("softmax_scale",5.),("agg_fxn","pdb"),
+                      ("use_state_update",True)]:
+        unit_f = cache_unit()
+        unit_f.search_cfg[field] = val
+        assert search_cache_key(unit_f,x,None,[None,None]) == key,field
+
+    # -- search fields do --
+    for field,val in [("ws",15),("wt",1),("k_s",50)]:
+        unit_f = cache_unit()
+        unit_f.search_cfg[field] = val
+        assert search_cache_key(unit_f,x,None,[None,None]) != key,field
+
+def test_weights_version():
+
+    # -- params --
+    set_seed(123)
+    model = nn.Sequential(nn.Conv2d(4,4,3),nn.Conv2d(4,4,1))
+    version = WeightsVersion(model.parameters)
+    v0 = version()
+    assert version() == v0
+
+    # -- any in-place update changes the version --
+    with th.no_grad():
+        model[0].weight[0,0,0,0] += 1e-7
+    v1 = version()
+    assert v1 != v0
+
+    # -- a replaced parameter changes the version --
+    model[1] = nn.Conv2d(4,4,1)
+    assert version() != v1
+
+    # -- invalidate never reuses an old version --
+    v2 = version()
+    version.invalidate()
+    assert version() != v2
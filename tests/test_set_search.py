@@ -0,0 +1,98 @@
+"""
+
+Test that swapping the search config of a live model only rebuilds the operators that read a changed field
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented.attn_mods import SEARCH_FIELDS,AGG_FIELDS
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def get_ops(model):
+    ops = []
+    for i in range(3):
+        ca = getattr(model.msa,'c%d'%(i+1)).CAUnit
+        ops.append((ca.search,ca.wpsum))
+    return ops
+
+def test_set_search_rebuilds():
+
+    # -- model --
+    set_seed(123)
+    cfg = edict({"device":"cpu","search_menu_name":"full","search_v0":"exact",
+                 "ws":9,"k_s":25,"k_a":25,"pretrained_load":False})
+    model = colanet.augmented.load_model(cfg)
+    ca = model.msa.c1.CAUnit
+
+    # -- aggregation-only fields keep the search --
+    ops = get_ops(model)
+    changed = model.set_search({"k_a":10,"softmax_scale":5.})
+    for changed_i in changed:
+        assert {"k_a","softmax_scale"} <= set(changed_i)
+        assert not(set(changed_i) & set(SEARCH_FIELDS + AGG_FIELDS))
+    assert get_ops(model) == ops
+    assert ca.k_a == 10 and ca.softmax_scale == 5.
+
+    # -- search fields rebuild the search only --
+    ops = get_ops(model)
+    model.set_search({"ws":7,"k_s":20})
+    for (search,wpsum),(search_p,wpsum_p) in zip(get_ops(model),ops):
+        assert not(search is search_p) and wpsum is wpsum_p
+    assert ca.search_cfg.ws == 7 and ca.k_s == 20
+
+    # -- shared fields rebuild both --
+    ops = get_ops(model)
+    model.set_search({"reflect_bounds":True})
+    for (search,wpsum),(search_p,wpsum_p) in zip(get_ops(model),ops):
+        assert not(search is search_p) and not(wpsum is wpsum_p)
+
+    # -- per-block configs --
+    model.set_search([{"k_s":20},{"k_s":15,"k_a":15},{}])
+    assert model.msa.c2.CAUnit.k_s == 15 and model.msa.c3.CAUnit.k_s == 20
+
+    # -- no change; nothing is rebuilt --
+    ops = get_ops(model)
+    assert model.set_search({"ws":7}) == [[],[],[]]
+    assert get_ops(model) == ops
+
+def test_set_search_errors():
+
+    # -- model --
+    cfg = edict({"device":"cpu","search_menu_name":"full","search_v0":"exact",
+                 "ws":9,"k_s":25,"k_a":25,"pretrained_load":False})
+    model = colanet.augmented.load_model(cfg)
+    ca = model.msa.c1.CAUnit
+
+    # -- unknown fields and invalid configs leave the module as is --
+    with pytest.raises(KeyError):
+        model.set_search({"not_a_field":1})
+    with pytest.raises(ValueError):
+        model.set_search({"k_a":30})
+    with pytest.raises(ValueError):
+        model.set_search([{},{}])
+    assert ca.k_a == 25 and ca.search_cfg.k_a == 25
+
+    # -- a failure in the last block leaves the first two as is --
+    ops = get_ops(model)
+    for bad in [{"k_a":30},{"not_a_field":1}]:
+        with pytest.raises((ValueError,KeyError)):
+            model.set_search([{"ws":7},{"ws":7},bad])
+        assert get_ops(model) == ops
+        for i in range(3):
+            ca_i = getattr(model.msa,'c%d'%(i+1)).CAUnit
+            assert ca_i.search_cfg.ws == 9 and ca_i.k_a == 25
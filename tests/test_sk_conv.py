@@ -0,0 +1,93 @@
+"""
+
+Test the fused selective-kernel gating of SKConv and merge_block against the stacked weighted sums they replace
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn as nn
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented.sk_conv import SKConv
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"M":[2,3]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def skconv_stacked(sk, x):
+    # -- the original forward: stack the branches, softmax over them --
+    feas = th.stack([conv(x) for conv in sk.convs],1)
+    fea_z = sk.fc(feas.sum(1).mean(-1).mean(-1))
+    vectors = th.stack([fc(fea_z) for fc in sk.fcs],1)
+    vectors = th.softmax(vectors,1)[...,None,None]
+    return (feas * vectors).sum(1)
+
+class CAStub(nn.Module):
+    """
+    Stands in for the attention branch of a merge_block.
+    """
+
+    def __init__(self, nchnls):
+        super().__init__()
+        self.conv = nn.Conv2d(nchnls,nchnls,3,padding=1)
+
+    def forward(self, x, flows, state, batchsize):
+        return self.conv(x)
+
+def test_skconv_fused(M):
+
+    # -- params --
+    set_seed(123)
+    tol = 1e-5
+    sk = SKConv(16,M,8,2).eval()
+    x = th.randn((4,16,12,12))
+
+    # -- test --
+    with th.no_grad():
+        out = sk(x)
+        ref = skconv_stacked(sk,x)
+    assert th.allclose(out,ref,atol=tol,rtol=tol)
+
+def test_merge_block_lerp():
+
+    # -- a merge block of RR with a stand-in attention --
+    set_seed(123)
+    tol = 1e-5
+    cfg = edict({"device":"cpu","search_menu_name":"full",
+                 "search_v0":"csa","pretrained_load":False})
+    model = colanet.augmented.load_model(cfg).eval()
+    block = model.msa.c1
+    block.CAUnit = CAStub(64)
+    x = th.randn((3,64,16,16))
+
+    # -- the original two-way softmax-weighted sum --
+    with th.no_grad():
+        out1 = block.SKUnit(x)
+        out2 = block.CAUnit(x,None,None,1)
+        out = th.stack((out2,out1),1)
+        vec = block.fc1(out.sum(1).mean(-1).mean(-1))
+        vec = th.stack((block.att_CA(vec),block.att_SK(vec)),1)
+        vec = th.softmax(vec,1)[...,None,None]
+        ref = (out*vec).sum(1)
+
+        # -- fused --
+        deno = block._forward(x,None,None,1)
+    assert th.allclose(deno,ref,atol=tol,rtol=tol)
@@ -0,0 +1,74 @@
+"""
+
+Test the static variant of RR against the model it is made from
+
+"""
+
+# -- misc --
+import gc
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import numpy as np
+
+# -- package imports [to test] --
+import colanet
+from colanet.augmented import static
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def load_model(search_v0):
+    cfg = edict({"device":"cpu","search_menu_name":"full",
+                 "search_v0":search_v0,"ws":9,"k_s":25,"k_a":25,
+                 "pretrained_load":False})
+    return colanet.augmented.load_model(cfg).eval()
+
+def test_static_csa():
+
+    # -- params --
+    set_seed(123)
+    T,C,H,W = 3,1,32,32
+    tol = 1e-5
+
+    # -- model --
+    model = load_model("csa")
+    smodel = model.to_static()
+
+    # -- video --
+    vid = th.rand((1,T,C,H,W))
+    zeros = th.zeros((1,T,2,H,W))
+    flows = edict({"fflow":zeros,"bflow":zeros.clone()})
+
+    # -- test --
+    with th.no_grad():
+        deno_ref = model(vid,flows=flows)
+        deno = smodel(vid,zeros,zeros.clone())
+        deno_4d = smodel(vid[0])
+    assert deno.shape == deno_ref.shape
+    assert th.allclose(deno,deno_ref,atol=tol,rtol=tol)
+    assert th.allclose(deno_4d,deno[0],atol=tol,rtol=tol)
+
+def test_static_registry():
+
+    # -- each static model holds three entries until freed --
+    model = load_model("exact")
+    nops = len(static._ATTN_OPS)
+    for _ in range(3):
+        smodel = model.to_static()
+        gc.collect()
+        assert len(static._ATTN_OPS) == nops + 3
+    names = [smodel.msa.c1.CAUnit.name,smodel.msa.c2.CAUnit.name,
+             smodel.msa.c3.CAUnit.name]
+    assert all([name in static._ATTN_OPS for name in names])
+
+    # -- and none are left after --
+    del smodel
+    gc.collect()
+    assert len(static._ATTN_OPS) == nops
@@ -0,0 +1,87 @@
+"""
+
+Test the workspace of reused temporaries and the attention weights computed in it
+
+"""
+
+# -- misc --
+import pytest,random
+
+# -- dict data --
+from easydict import EasyDict as edict
+
+# -- linalg --
+import torch as th
+import torch.nn.functional as F
+import numpy as np
+
+# -- package imports [to test] --
+from colanet.utils.workspace import Workspace
+from colanet.augmented.nl_attn import attn_weights
+
+def set_seed(seed):
+    random.seed(seed)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+
+def pytest_generate_tests(metafunc):
+    seed = 123
+    set_seed(seed)
+    test_lists = {"dist_type":["prod","l2"]}
+    for key,val in test_lists.items():
+        if key in metafunc.fixturenames:
+            metafunc.parametrize(key,val)
+
+def test_attn_weights(dist_type):
+
+    # -- params --
+    set_seed(123)
+    tol = 1e-6
+    layer = edict({"softmax_scale":10.,"dist_type":dist_type})
+    dists = th.randn((1,1,64,25))
+    sign = -1 if dist_type == "l2" else 1
+    ref = F.softmax(sign*10.*dists,-1)
+
+    # -- with and without a workspace --
+    ws = Workspace()
+    with th.no_grad():
+        attn = attn_weights(layer,None,dists)
+        attn_ws = attn_weights(layer,ws,dists)
+    assert th.allclose(attn,ref,atol=tol,rtol=tol)
+    assert th.allclose(attn_ws,ref,atol=tol,rtol=tol)
+
+    # -- the buffer is reused --
+    with th.no_grad():
+        attn_ws2 = attn_weights(layer,ws,2*dists)
+    assert attn_ws2.data_ptr() == attn_ws.data_ptr()
+    assert th.allclose(attn_ws2,F.softmax(sign*20.*dists,-1),atol=tol,rtol=tol)
+    assert ws.hits == 1 and ws.misses == 1
+
+    # -- no overflow for large scores --
+    with th.no_grad():
+        attn_big = attn_weights(layer,ws,100.*dists)
+    assert th.allclose(attn_big,F.softmax(sign*1000.*dists,-1),atol=tol,rtol=tol)
+
+def test_workspace_lru():
+
+    # -- a budget of two 1kB buffers --
+    ws = Workspace(max_bytes=2048)
+    a = ws.get("a",(256,),th.float32,"cpu")
+    b = ws.get("b",(256,),th.float32,"cpu")
+    assert ws.get("a",(256,),th.float32,"cpu") is a # "a" is now most recent
+    c = ws.get("c",(256,),th.float32,"cpu")
+
+    # -- "b" was evicted; the rest are kept --
+    assert len(ws) == 2 and ws.nbytes() == 2048
+    assert ws.get("a",(256,),th.float32,"cpu") is a
+    assert ws.get("c",(256,),th.float32,"cpu") is c
+    assert not(ws.get("b",(256,),th.float32,"cpu") is b)
+
+    # -- many distinct shapes stay under budget --
+    for n in range(1,100):
+        ws.get("y",(n,),th.float32,"cpu")
+    assert ws.nbytes() <= 2048
+
+    # -- release --
+    ws.release()
+    assert len(ws) == 0 and ws.nbytes() == 0